@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import Category, Challenge, UserProfile, Favorite
-from .models import ChallengeProgress
+from .models import ChallengeProgress, ChallengeStats, ExportJob, ProgressEvent, UserScore
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -16,7 +16,7 @@ class ChallengeAdmin(admin.ModelAdmin):
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-	list_display = ("user", "updated_at")
+	list_display = ("user", "image_hash", "updated_at")
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -30,3 +30,54 @@ class ChallengeProgressAdmin(admin.ModelAdmin):
 	list_display = ("user", "challenge", "status", "last_saved_ok", "started_at", "updated_at", "completed_at")
 	list_filter = ("status", "last_saved_ok", "updated_at")
 	search_fields = ("user__username", "challenge__title")
+
+
+@admin.register(UserScore)
+class UserScoreAdmin(admin.ModelAdmin):
+	list_display = ("user", "points", "solved_count", "current_streak", "longest_streak", "last_active_date", "updated_at")
+	search_fields = ("user__username",)
+	ordering = ("-points",)
+
+
+@admin.register(ChallengeStats)
+class ChallengeStatsAdmin(admin.ModelAdmin):
+	list_display = ("challenge", "attempted", "in_progress", "completed", "unsolved", "favorites", "updated_at")
+	list_select_related = ("challenge",)
+	search_fields = ("challenge__title",)
+
+	# Maintained by accounts.stats; repair with rebuild_challenge_stats
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+	list_display = ("id", "requested_by", "status", "rows_written", "bytes_written", "attempts", "created_at", "expires_at")
+	list_filter = ("status",)
+	list_select_related = ("requested_by",)
+
+	# Created through /api/admin/exports/ and run by accounts.export_jobs
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
+
+@admin.register(ProgressEvent)
+class ProgressEventAdmin(admin.ModelAdmin):
+	list_display = ("user", "challenge", "kind", "revision", "count", "created_at")
+	list_filter = ("kind", "created_at")
+	list_select_related = ("user", "challenge")
+	search_fields = ("user__username", "challenge__title")
+	date_hierarchy = "created_at"
+
+	# The log is append-only
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
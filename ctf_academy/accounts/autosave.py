@@ -0,0 +1,470 @@
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection
+
+from .json_patch import JsonPatchError, apply_patch
+from .progress import progress_repository
+from .state_codec import StateTooLarge, dumps, state_digest
+
+logger = logging.getLogger(__name__)
+
+# AUTOSAVE_MODE values.
+WRITE_BEHIND = "write_behind"
+WRITE_THROUGH = "write_through"
+
+FLUSH_BATCH_SIZE = 500
+
+# save() outcomes.
+SAVED = "saved"
+UNCHANGED = "unchanged"
+CONFLICT = "conflict"
+
+# Attempts at the compare-and-put before a racing writer is reported as a conflict.
+SAVE_ATTEMPTS = 3
+
+
+@dataclass(frozen=True)
+class PendingState:
+    """A buffered state with the revision and hash it will be stored under."""
+    state: object
+    state_hash: str
+    revision: int
+
+
+@dataclass(frozen=True)
+class SaveResult:
+    outcome: str
+    revision: int
+    state_hash: str
+
+
+def _field(user_id: int, challenge_id: int) -> str:
+    return f"{user_id}:{challenge_id}"
+
+
+def _parse_field(field) -> tuple[int, int]:
+    if isinstance(field, bytes):
+        field = field.decode()
+    user_id, challenge_id = field.split(":")
+    return int(user_id), int(challenge_id)
+
+
+class AutosaveBuffer:
+    """Latest unflushed editor state per (user, challenge).
+
+    ``put_if`` overwrites, so a burst of autosaves costs one database
+    write. ``drain`` and ``take`` hand entries to a writer but leave them
+    visible (as in flight) to ``peek`` and ``put_if`` until ``ack`` says
+    they are committed, so the revision the next save builds on never
+    falls back to an older stored one. Entries whose write failed stay in
+    flight and are returned by the next ``drain``.
+    """
+
+    def put_if(self, user_id: int, challenge_id: int, entry: PendingState, expected_revision: int) -> bool:
+        """Buffer ``entry`` unless the latest buffered or in-flight entry
+        is at another revision."""
+        raise NotImplementedError
+
+    def peek(self, user_id: int, challenge_id: int) -> PendingState | None:
+        """The latest buffered or in-flight entry."""
+        raise NotImplementedError
+
+    def take(self, user_id: int, challenge_id: int) -> PendingState | None:
+        """Move one buffered entry in flight and return it."""
+        raise NotImplementedError
+
+    def drain(self) -> list[tuple[int, int, PendingState]]:
+        """Move every buffered entry in flight and return all in-flight entries."""
+        raise NotImplementedError
+
+    def ack(self, entries: list[tuple[int, int, PendingState]]) -> None:
+        """Forget in-flight entries that are now stored, unless a newer
+        one has replaced them since."""
+        raise NotImplementedError
+
+    def pending_count(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryAutosaveBuffer(AutosaveBuffer):
+    """Per-process buffer, used with the locmem cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[int, int], PendingState] = {}
+        self._inflight: dict[tuple[int, int], PendingState] = {}
+
+    def _latest(self, key):
+        return self._pending.get(key) or self._inflight.get(key)
+
+    def put_if(self, user_id, challenge_id, entry, expected_revision):
+        with self._lock:
+            current = self._latest((user_id, challenge_id))
+            if current is not None and current.revision != expected_revision:
+                return False
+            self._pending[(user_id, challenge_id)] = entry
+            return True
+
+    def peek(self, user_id, challenge_id):
+        with self._lock:
+            return self._latest((user_id, challenge_id))
+
+    def take(self, user_id, challenge_id):
+        with self._lock:
+            entry = self._pending.pop((user_id, challenge_id), None)
+            if entry is not None:
+                self._inflight[(user_id, challenge_id)] = entry
+            return entry
+
+    def drain(self):
+        with self._lock:
+            self._inflight.update(self._pending)
+            self._pending = {}
+            inflight = list(self._inflight.items())
+        return [(user_id, challenge_id, entry) for (user_id, challenge_id), entry in inflight]
+
+    def ack(self, entries):
+        with self._lock:
+            for user_id, challenge_id, entry in entries:
+                if self._inflight.get((user_id, challenge_id)) == entry:
+                    del self._inflight[(user_id, challenge_id)]
+
+    def pending_count(self):
+        return len(self._pending.keys() | self._inflight.keys())
+
+
+def _encode(entry: PendingState) -> str:
+    return f"{entry.revision}:{entry.state_hash}:{json.dumps(entry.state)}"
+
+
+def _decode(raw) -> PendingState:
+    if isinstance(raw, bytes):
+        raw = raw.decode()
+    revision, state_hash, state = raw.split(":", 2)
+    return PendingState(state=json.loads(state), state_hash=state_hash, revision=int(revision))
+
+
+# KEYS = pending hash, in-flight hash; ARGV = field, encoded entry,
+# expected revision. Values start with "<revision>:", which is all the
+# script needs to read.
+_PUT_IF_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1]) or redis.call('HGET', KEYS[2], ARGV[1])
+if raw and tonumber(string.match(raw, '^(%d+):')) ~= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+# KEYS = pending hash, in-flight hash; ARGV = field
+_TAKE_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if raw then
+    redis.call('HSET', KEYS[2], ARGV[1], raw)
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return raw
+"""
+
+# KEYS = pending hash, in-flight hash
+_DRAIN_SCRIPT = """
+local pending = redis.call('HGETALL', KEYS[1])
+for i = 1, #pending, 2 do
+    redis.call('HSET', KEYS[2], pending[i], pending[i + 1])
+end
+redis.call('DEL', KEYS[1])
+return redis.call('HGETALL', KEYS[2])
+"""
+
+# KEYS = in-flight hash; ARGV = field, encoded entry, field, encoded entry...
+_ACK_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+return 0
+"""
+
+
+class RedisAutosaveBuffer(AutosaveBuffer):
+    """Pending and in-flight states in two Redis hashes, shared by every
+    worker.
+
+    Every operation is a server-side script, so two workers can't both
+    accept a save against the same revision. Entries left in flight by a
+    flusher that died are written by the next ``drain``; a concurrent
+    flusher may write an entry twice, which the revision check in
+    ``save_states`` makes harmless.
+    """
+
+    def __init__(self, client, key: str = "autosave:pending"):
+        self.client = client
+        self.key = key
+        self.inflight_key = f"{key}:inflight"
+        self._put_if = client.register_script(_PUT_IF_SCRIPT)
+        self._take = client.register_script(_TAKE_SCRIPT)
+        self._drain = client.register_script(_DRAIN_SCRIPT)
+        self._ack = client.register_script(_ACK_SCRIPT)
+
+    def put_if(self, user_id, challenge_id, entry, expected_revision):
+        field = _field(user_id, challenge_id)
+        return bool(self._put_if(keys=[self.key, self.inflight_key], args=[field, _encode(entry), expected_revision]))
+
+    def peek(self, user_id, challenge_id):
+        pipe = self.client.pipeline()
+        pipe.hget(self.key, _field(user_id, challenge_id))
+        pipe.hget(self.inflight_key, _field(user_id, challenge_id))
+        pending, inflight = pipe.execute()
+        raw = pending if pending is not None else inflight
+        return None if raw is None else _decode(raw)
+
+    def take(self, user_id, challenge_id):
+        raw = self._take(keys=[self.key, self.inflight_key], args=[_field(user_id, challenge_id)])
+        return None if raw is None else _decode(raw)
+
+    def drain(self):
+        raw = self._drain(keys=[self.key, self.inflight_key])
+        return [(*_parse_field(field), _decode(value)) for field, value in zip(raw[::2], raw[1::2])]
+
+    def ack(self, entries):
+        if entries:
+            args = [arg for user_id, challenge_id, entry in entries
+                    for arg in (_field(user_id, challenge_id), _encode(entry))]
+            self._ack(keys=[self.inflight_key], args=args)
+
+    def pending_count(self):
+        pipe = self.client.pipeline()
+        pipe.hkeys(self.key)
+        pipe.hkeys(self.inflight_key)
+        pending, inflight = pipe.execute()
+        return len(set(pending) | set(inflight))
+
+
+_buffer: AutosaveBuffer | None = None
+_buffer_lock = threading.Lock()
+
+
+def get_autosave_buffer() -> AutosaveBuffer:
+    """Redis-backed when the default cache is django-redis, else in-process."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+                if backend.startswith("django_redis"):
+                    from django_redis import get_redis_connection
+
+                    _buffer = RedisAutosaveBuffer(get_redis_connection("default"))
+                else:
+                    _buffer = MemoryAutosaveBuffer()
+    return _buffer
+
+
+def flush() -> int:
+    """Write every pending state to ChallengeProgress in batched upserts.
+
+    Entries from a failed batch stay in flight for the next run. Returns
+    the number of rows written.
+    """
+    buffer = get_autosave_buffer()
+    entries = buffer.drain()
+    written = 0
+    for start in range(0, len(entries), FLUSH_BATCH_SIZE):
+        batch = entries[start:start + FLUSH_BATCH_SIZE]
+        try:
+            written += progress_repository.save_states(
+                (user_id, challenge_id, entry.state, entry.state_hash, entry.revision)
+                for user_id, challenge_id, entry in batch
+            )
+        except Exception:
+            logger.exception("Autosave flush failed; %s entries stay pending", len(entries) - start)
+            break
+        buffer.ack(batch)
+    return written
+
+
+def persist_pending(user_id: int, challenge_ids) -> int:
+    """Write a user's buffered states for ``challenge_ids`` to the database
+    now rather than at the next flush. Returns the number written."""
+    buffer = get_autosave_buffer()
+    entries = []
+    for challenge_id in challenge_ids:
+        entry = buffer.take(user_id, challenge_id)
+        if entry is not None:
+            entries.append((user_id, challenge_id, entry))
+    if not entries:
+        return 0
+    written = progress_repository.save_states(
+        (user_id, challenge_id, entry.state, entry.state_hash, entry.revision)
+        for user_id, challenge_id, entry in entries
+    )
+    buffer.ack(entries)
+    return written
+
+
+def _flush_loop(interval: int) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except Exception:
+            logger.exception("Autosave flusher error")
+        finally:
+            connection.close()
+
+
+_flusher: threading.Thread | None = None
+_flusher_lock = threading.Lock()
+
+
+def _ensure_flusher() -> None:
+    """Start this process's background flusher on first use.
+
+    ``AUTOSAVE_FLUSH_SECONDS = 0`` disables it; run ``flush_autosave``
+    from a scheduler instead. That needs the shared Redis buffer (see
+    ``effective_mode``).
+    """
+    global _flusher
+    interval = getattr(settings, "AUTOSAVE_FLUSH_SECONDS", 10)
+    if _flusher is not None or interval <= 0:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, args=(interval,), name="autosave-flusher", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+
+def effective_mode(buffer: AutosaveBuffer) -> str:
+    """AUTOSAVE_MODE, except that write-behind without a flusher thread
+    (``AUTOSAVE_FLUSH_SECONDS = 0``) is only possible with the shared
+    Redis buffer: ``flush_autosave`` runs in its own process and can't
+    reach a per-process one, so those saves are written through."""
+    mode = getattr(settings, "AUTOSAVE_MODE", WRITE_BEHIND)
+    if (mode == WRITE_BEHIND and getattr(settings, "AUTOSAVE_FLUSH_SECONDS", 10) <= 0
+            and isinstance(buffer, MemoryAutosaveBuffer)):
+        return WRITE_THROUGH
+    return mode
+
+
+def _current(buffer: AutosaveBuffer, user_id: int, challenge_id: int) -> tuple[int, str]:
+    """The latest ``(revision, state_hash)``: buffered if pending, else stored."""
+    entry = buffer.peek(user_id, challenge_id)
+    if entry is not None:
+        return entry.revision, entry.state_hash
+    return progress_repository.state_version(user_id, challenge_id)
+
+
+def _unchanged(buffer: AutosaveBuffer, user_id: int, challenge_id: int, revision: int, current_hash: str) -> SaveResult:
+    # The client holds the latest state, so nothing is unsaved. A buffered
+    # state sets the flag when it is flushed; a stored one needs it set here.
+    if buffer.peek(user_id, challenge_id) is None:
+        progress_repository.mark_saved(user_id, challenge_id)
+    return SaveResult(UNCHANGED, revision, current_hash)
+
+
+def save(user_id: int, challenge_id: int, state, *, base_revision: int | None = None,
+         state_hash: str | None = None, final: bool = False, max_bytes: int | None = None) -> SaveResult:
+    """Record an autosave as the next revision.
+
+    A state whose hash matches the latest one is UNCHANGED and writes
+    nothing but ``last_saved_ok``; ``state_hash`` is the client's hash and spares hashing the
+    body when it matches. When ``base_revision`` is given and behind the
+    latest revision the save is a CONFLICT (another tab saved since).
+    A state over ``max_bytes`` of canonical JSON raises ``StateTooLarge``.
+
+    In write-behind mode the state is buffered and acknowledged at once.
+    ``final`` saves (page unload) and write-through mode persist right
+    away, along with any older buffered state for the same key.
+    """
+    buffer = get_autosave_buffer()
+    mode = effective_mode(buffer)
+    digest = None
+    for _ in range(SAVE_ATTEMPTS):
+        revision, current_hash = _current(buffer, user_id, challenge_id)
+        if state_hash and state_hash == current_hash:
+            return _unchanged(buffer, user_id, challenge_id, revision, current_hash)
+        if digest is None:
+            encoded = dumps(state)
+            if max_bytes is not None and len(encoded) > max_bytes:
+                raise StateTooLarge(len(encoded), max_bytes)
+            digest = hashlib.sha256(encoded).hexdigest()
+        if digest == current_hash:
+            return _unchanged(buffer, user_id, challenge_id, revision, current_hash)
+        if base_revision is not None and base_revision != revision:
+            return SaveResult(CONFLICT, revision, current_hash)
+        entry = PendingState(state=state, state_hash=digest, revision=revision + 1)
+        # Buffering first claims the revision, even when it is persisted
+        # right away, so no concurrent save can be handed the same one
+        if not buffer.put_if(user_id, challenge_id, entry, expected_revision=revision):
+            continue
+        if mode == WRITE_BEHIND and not final:
+            _ensure_flusher()
+            return SaveResult(SAVED, entry.revision, digest)
+        if persist_pending(user_id, [challenge_id]):
+            return SaveResult(SAVED, entry.revision, digest)
+        # Another writer got in between the read and the write; look again
+    return SaveResult(CONFLICT, *_current(buffer, user_id, challenge_id))
+
+
+def _patch_text_lines(state, operations):
+    """Apply ``operations`` with the state's ``text`` split into lines.
+
+    The stored shape keeps ``text`` as one string; patches address it as a
+    list of lines, so an edit only carries the lines it changed.
+    """
+    if isinstance(state, dict) and isinstance(state.get("text"), list):
+        return apply_patch(state, operations)
+    if isinstance(state, dict) and isinstance(state.get("text"), str):
+        state = {**state, "text": state["text"].split("\n")}
+    state = apply_patch(state, operations)
+    lines = state.get("text") if isinstance(state, dict) else None
+    if isinstance(lines, list) and all(isinstance(line, str) for line in lines):
+        state = {**state, "text": "\n".join(lines)}
+    return state
+
+
+def save_patch(user_id: int, challenge_id: int, operations, *, base_revision: int,
+               state_hash: str | None = None, final: bool = False, max_bytes: int | None = None) -> SaveResult:
+    """Apply a JSON Patch to the latest state and save the result.
+
+    The patch must be based on the latest revision; otherwise it is a
+    CONFLICT and the client should fall back to a full snapshot. With
+    ``state_hash`` the patched state is checked against the client's copy.
+    A string ``text`` is patched as a list of lines (``/text/3``).
+    Raises ``JsonPatchError`` if the patch doesn't apply or the check fails.
+    """
+    buffer = get_autosave_buffer()
+    entry = buffer.peek(user_id, challenge_id)
+    if entry is not None:
+        revision, current_hash, current = entry.revision, entry.state_hash, entry.state
+    else:
+        revision, current_hash, current = progress_repository.stored_state(user_id, challenge_id)
+    if state_hash and state_hash == current_hash:
+        return _unchanged(buffer, user_id, challenge_id, revision, current_hash)
+    if base_revision != revision:
+        return SaveResult(CONFLICT, revision, current_hash)
+    state = _patch_text_lines(current, operations)
+    if state_hash and state_digest(state) != state_hash:
+        raise JsonPatchError("The patched state does not match state_hash")
+    return save(user_id, challenge_id, state, base_revision=base_revision, final=final, max_bytes=max_bytes)
+
+
+def pending_state(user_id: int, challenge_id: int) -> PendingState | None:
+    """The buffered state not yet in the database, if any."""
+    try:
+        return get_autosave_buffer().peek(user_id, challenge_id)
+    except Exception:
+        logger.exception("Autosave buffer unavailable")
+        return None
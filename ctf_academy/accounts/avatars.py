@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.templatetags.static import static
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from .blobs import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+# Square thumbnail edge lengths in pixels (2x the largest CSS size they back).
+AVATAR_SIZES = (64, 128, 256)
+DEFAULT_AVATAR_SIZE = 128
+AVATAR_CACHE_SECONDS = 60 * 60 * 24 * 30
+AVATAR_CONTENT_TYPE = "image/jpeg"
+DEFAULT_AVATAR_STATIC = "accounts/images/empty_profile.jpg"
+
+# Upload pipeline limits. The master is what UserProfile.image_hash references.
+MASTER_SIZE = 512
+ALLOWED_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+MAX_UPLOAD_PIXELS = 40_000_000
+
+
+class AvatarUploadError(ValueError):
+    """Raised when an uploaded profile image is rejected."""
+
+
+def avatar_etag(digest: str) -> str:
+    """Strong ETag for a thumbnail: its content address."""
+    return f'"{digest}"'
+
+
+def avatar_url(user_id: int, image_hash: str | None, size: int = DEFAULT_AVATAR_SIZE) -> str:
+    """URL of a user's avatar thumbnail, or the default image when there is none.
+
+    The profile's ``image_hash`` versions the URL, so it only changes when
+    the picture does.
+    """
+    if not image_hash:
+        return static(DEFAULT_AVATAR_STATIC)
+    return f"{reverse('avatar_image', args=[user_id, size])}?v={image_hash[:16]}"
+
+
+def _square_rgb(img: Image.Image, size: int) -> Image.Image:
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return ImageOps.fit(img, (size, size), Image.Resampling.LANCZOS)
+
+
+def _encode_jpeg(img: Image.Image) -> bytes:
+    # Saving without exif/icc arguments drops all metadata from the upload
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=85, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def make_thumbnail(data: bytes, size: int) -> bytes:
+    """Center-crop to a square and re-encode as a ``size`` x ``size`` JPEG."""
+    with Image.open(io.BytesIO(data)) as img:
+        return _encode_jpeg(_square_rgb(img, size))
+
+
+def validate_upload(data: bytes) -> None:
+    """Reject empty, oversized, non-image or unsupported-format uploads."""
+    max_bytes = getattr(settings, "AVATAR_MAX_UPLOAD_BYTES", 5 * 1024 * 1024)
+    if not data:
+        raise AvatarUploadError("The uploaded image is empty.")
+    if len(data) > max_bytes:
+        raise AvatarUploadError(f"Image is too large (max {max_bytes // (1024 * 1024)} MB).")
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            fmt, (width, height) = img.format, img.size
+            img.verify()
+    except Exception:
+        raise AvatarUploadError("The uploaded file is not a valid image.")
+    if fmt not in ALLOWED_FORMATS:
+        raise AvatarUploadError(f"Unsupported image format: {fmt}.")
+    if width * height > MAX_UPLOAD_PIXELS:
+        raise AvatarUploadError("Image dimensions are too large.")
+
+
+def render_variants(data: bytes) -> tuple[bytes, dict[int, bytes]]:
+    """Decode once and return the compact master plus every thumbnail size."""
+    with Image.open(io.BytesIO(data)) as img:
+        master = _square_rgb(img, MASTER_SIZE)
+    variants = {
+        size: _encode_jpeg(master.resize((size, size), Image.Resampling.LANCZOS))
+        for size in AVATAR_SIZES
+    }
+    return _encode_jpeg(master), variants
+
+
+def process_upload(user_id: int, data: bytes) -> None:
+    """Re-encode an upload and store the master and thumbnails for the user.
+
+    Blobs are content-addressed, so re-uploading an identical picture (or
+    one matching another user's) stores no new bytes.
+    """
+    from .models import AvatarThumbnail, UserProfile
+
+    master, variants = render_variants(data)
+    store = get_blob_store()
+    master_hash = store.put(master)
+    digests = {size: store.put(thumb) for size, thumb in variants.items()}
+    with transaction.atomic():
+        profile = UserProfile.objects.select_for_update().get(user_id=user_id)
+        profile.image_hash = master_hash
+        profile.save(update_fields=["image_hash", "updated_at"])
+        AvatarThumbnail.objects.filter(profile=profile).delete()
+        AvatarThumbnail.objects.bulk_create(
+            AvatarThumbnail(profile=profile, size=size, digest=digest) for size, digest in digests.items()
+        )
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_pending: threading.BoundedSemaphore | None = None
+
+
+def _get_executor() -> tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    global _executor, _pending
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = settings.AVATAR_WORKERS
+                _pending = threading.BoundedSemaphore(workers * 4)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="avatar")
+    return _executor, _pending
+
+
+def _run_upload(user_id: int, data: bytes, pending: threading.BoundedSemaphore) -> None:
+    try:
+        process_upload(user_id, data)
+    except Exception:
+        logger.exception("Avatar processing failed for user %s", user_id)
+    finally:
+        pending.release()
+        connection.close()
+
+
+def submit_upload(user_id: int, data: bytes) -> bool:
+    """Process an already validated upload on the bounded worker pool.
+
+    Returns True if the work was queued, False if it ran inline
+    (``AVATAR_WORKERS = 0``). Raises AvatarUploadError when the queue is full.
+    """
+    if getattr(settings, "AVATAR_WORKERS", 0) <= 0:
+        process_upload(user_id, data)
+        return False
+    executor, pending = _get_executor()
+    if not pending.acquire(blocking=False):
+        raise AvatarUploadError("Image processing is busy — please try again in a moment.")
+    executor.submit(_run_upload, user_id, data, pending)
+    return True
+
+
+def thumbnail_digest(profile, size: int) -> str | None:
+    """Digest of the stored thumbnail, generating it for older images."""
+    from .models import AvatarThumbnail
+
+    digest = AvatarThumbnail.objects.filter(profile=profile, size=size).values_list("digest", flat=True).first()
+    if digest or not profile.image_hash:
+        return digest
+    store = get_blob_store()
+    master = store.read(profile.image_hash)
+    if master is None:
+        return None
+    try:
+        digest = store.put(make_thumbnail(master, size))
+    except Exception:
+        logger.exception("Could not build %spx avatar for profile %s", size, profile.pk)
+        # Undecodable images are served as stored
+        return profile.image_hash
+    AvatarThumbnail.objects.bulk_create(
+        [AvatarThumbnail(profile=profile, size=size, digest=digest)], ignore_conflicts=True
+    )
+    return digest
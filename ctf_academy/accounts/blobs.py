@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from django.conf import settings
+
+# Blobs stored more recently than this are never pruned: an upload stores
+# its blobs before the row referencing them commits.
+PRUNE_GRACE = timedelta(hours=1)
+
+
+def blob_digest(data: bytes) -> str:
+    """Content address of a blob: its SHA-256 hex digest."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """Immutable, content-addressed byte storage.
+
+    ``put`` is idempotent: storing identical bytes twice keeps one copy and
+    returns the same digest. It also refreshes the blob's stored time,
+    which ``digests(stored_before=...)`` filters on.
+    """
+
+    def put(self, data: bytes) -> str:
+        raise NotImplementedError
+
+    def open(self, digest: str) -> BinaryIO | None:
+        """Readable binary file for the blob, or None if it is missing."""
+        raise NotImplementedError
+
+    def read(self, digest: str) -> bytes | None:
+        fh = self.open(digest)
+        if fh is None:
+            return None
+        with fh:
+            return fh.read()
+
+    def delete(self, digest: str) -> None:
+        raise NotImplementedError
+
+    def digests(self, stored_before: datetime | None = None) -> Iterator[str]:
+        """Every digest held by this store, or only those last ``put``
+        before ``stored_before``."""
+        raise NotImplementedError
+
+
+class DatabaseBlobStore(BlobStore):
+    """Blobs as rows of the ``Blob`` table."""
+
+    def put(self, data):
+        from .models import Blob
+
+        digest = blob_digest(data)
+        Blob.objects.bulk_create(
+            [Blob(digest=digest, data=data, size=len(data))],
+            update_conflicts=True, unique_fields=["digest"], update_fields=["created_at"],
+        )
+        return digest
+
+    def open(self, digest):
+        from .models import Blob
+
+        data = Blob.objects.filter(digest=digest).values_list("data", flat=True).first()
+        return None if data is None else io.BytesIO(bytes(data))
+
+    def delete(self, digest):
+        from .models import Blob
+
+        Blob.objects.filter(digest=digest).delete()
+
+    def digests(self, stored_before=None):
+        from .models import Blob
+
+        blobs = Blob.objects.all()
+        if stored_before is not None:
+            blobs = blobs.filter(created_at__lt=stored_before)
+        return blobs.values_list("digest", flat=True).iterator(chunk_size=2000)
+
+
+class FileSystemBlobStore(BlobStore):
+    """Blobs as files under ``root/ab/cd/<digest>``.
+
+    Reads fall back to the ``Blob`` table (where migrated data lives) and
+    copy the blob to disk on first access.
+    """
+
+    def __init__(self, root: str | Path, fallback: BlobStore | None = None):
+        self.root = Path(root)
+        self.fallback = fallback
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def _write(self, digest: str, data: bytes) -> None:
+        path = self.path(digest)
+        if path.exists():
+            path.touch()
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def put(self, data):
+        digest = blob_digest(data)
+        self._write(digest, data)
+        return digest
+
+    def open(self, digest):
+        try:
+            return open(self.path(digest), "rb")
+        except FileNotFoundError:
+            pass
+        if self.fallback is None:
+            return None
+        data = self.fallback.read(digest)
+        if data is None:
+            return None
+        self._write(digest, data)
+        return io.BytesIO(data)
+
+    def delete(self, digest):
+        try:
+            self.path(digest).unlink()
+        except FileNotFoundError:
+            pass
+        if self.fallback is not None:
+            self.fallback.delete(digest)
+
+    def digests(self, stored_before=None):
+        cutoff = stored_before.timestamp() if stored_before is not None else None
+        seen = set()
+        for path in self.root.glob("*/*/*"):
+            if path.name.startswith(".tmp-"):
+                continue
+            seen.add(path.name)
+            try:
+                if cutoff is not None and path.stat().st_mtime >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            yield path.name
+        if self.fallback is not None:
+            for digest in self.fallback.digests(stored_before):
+                if digest not in seen:
+                    yield digest
+
+
+_store: BlobStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Filesystem store under ``BLOB_STORE_ROOT`` if set, else the DB table."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                root = getattr(settings, "BLOB_STORE_ROOT", "")
+                db_store = DatabaseBlobStore()
+                _store = FileSystemBlobStore(root, fallback=db_store) if root else db_store
+    return _store
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+
+from django.core.cache import cache
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+# Shared across workers through the Django cache; bumped whenever an admin
+# changes a category or challenge.
+VERSION_KEY = "catalog:version"
+
+DIFFICULTY_ORDER = {"easy": 1, "medium": 2, "hard": 3}
+
+
+@dataclass(frozen=True)
+class CategorySnapshot:
+    id: int
+    name: str
+    slug: str
+    icon_class: str
+
+    def __str__(self) -> str:
+        return self.name
+
+
+@dataclass(frozen=True)
+class ChallengeSnapshot:
+    """Read-only copy of an active challenge with precomputed display fields.
+
+    The per-user flags and search snippet are empty by default; views fill
+    them in with ``with_user_state`` rather than mutating the shared snapshot.
+    """
+    id: int
+    slug: str
+    title: str
+    description: str
+    difficulty: str
+    difficulty_display: str
+    points: int
+    category: CategorySnapshot
+    tools_count: int
+    max_state_bytes: int | None = None
+    snippet: str = ""
+    is_completed: bool = False
+    is_in_progress: bool = False
+    is_favorite: bool = False
+
+    def get_difficulty_display(self) -> str:
+        return self.difficulty_display
+
+    def get_absolute_url(self) -> str:
+        return reverse("challenge_detail", args=[self.slug])
+
+    def with_user_state(self, **flags) -> ChallengeSnapshot:
+        return replace(self, **flags)
+
+    def __str__(self) -> str:
+        return f"{self.title} ({self.difficulty_display})"
+
+
+@dataclass(frozen=True)
+class Catalog:
+    version: int
+    categories: tuple[CategorySnapshot, ...]   # by name
+    challenges: tuple[ChallengeSnapshot, ...]  # by id
+    by_slug: dict[str, ChallengeSnapshot]
+    by_id: dict[int, ChallengeSnapshot]
+
+    def get(self, slug: str) -> ChallengeSnapshot | None:
+        return self.by_slug.get(slug)
+
+
+def _tools_count(topology) -> int:
+    try:
+        return len(topology.get("tools", [])) if topology else 0
+    except Exception:
+        return 0
+
+
+def load_catalog(version: int) -> Catalog:
+    """Build a snapshot of all categories and active challenges from the DB."""
+    from .models import Category, Challenge
+
+    categories = {
+        c.id: CategorySnapshot(id=c.id, name=c.name, slug=c.slug, icon_class=c.icon_class)
+        for c in Category.objects.order_by("name")
+    }
+    challenges = []
+    rows = Challenge.objects.filter(is_active=True).order_by("id").values(
+        "id", "slug", "title", "description", "difficulty", "points", "category_id", "topology",
+        "max_state_bytes",
+    )
+    labels = dict(Challenge.Difficulty.choices)
+    for row in rows:
+        category = categories[row["category_id"]]
+        challenges.append(ChallengeSnapshot(
+            id=row["id"],
+            slug=row["slug"],
+            title=row["title"],
+            description=row["description"],
+            difficulty=row["difficulty"],
+            difficulty_display=labels.get(row["difficulty"], row["difficulty"]),
+            points=row["points"],
+            category=category,
+            tools_count=_tools_count(row["topology"]),
+            max_state_bytes=row["max_state_bytes"],
+        ))
+    challenges = tuple(challenges)
+    return Catalog(
+        version=version,
+        categories=tuple(categories.values()),
+        challenges=challenges,
+        by_slug={c.slug: c for c in challenges},
+        by_id={c.id: c for c in challenges},
+    )
+
+
+def current_version() -> int:
+    """The shared catalog version, seeding it if the cache has none."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # A fresh value rather than 1, so a worker still holding an old
+        # snapshot can't mistake a re-seeded key for its own version.
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version() -> None:
+    """Invalidate every worker's snapshot."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    except Exception:
+        logger.exception("Failed to bump the catalog version")
+
+
+_catalog: Catalog | None = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """This worker's snapshot, reloaded at most once per version bump."""
+    global _catalog
+    try:
+        version = current_version()
+    except Exception:
+        logger.exception("Catalog version unavailable; loading from the database")
+        return load_catalog(version=-1)
+    catalog = _catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+    with _catalog_lock:
+        if _catalog is None or _catalog.version != version:
+            _catalog = load_catalog(version)
+        return _catalog
+
+
+def find_challenge(*, id: int | None = None, slug: str | None = None):
+    """Look a challenge up by id or slug without a query when it's active.
+
+    Inactive challenges aren't in the catalog; those come from the
+    database as model instances. Returns None when nothing matches.
+    """
+    from .models import Challenge
+
+    catalog = get_catalog()
+    found = catalog.by_id.get(id) if id is not None else catalog.get(slug)
+    if found is not None:
+        return found
+    lookup = {"id": id} if id is not None else {"slug": slug}
+    return Challenge.objects.select_related("category").filter(**lookup).first()
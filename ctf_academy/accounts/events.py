@@ -0,0 +1,205 @@
+"""Append-only progress event log (``ProgressEvent``).
+
+The progress repository records an event for every status transition and
+saved state once its transaction commits. Events wait in a per-process
+buffer and are inserted with ``bulk_create`` every
+``PROGRESS_EVENT_FLUSH_SECONDS`` or once a batch fills up, so logging
+costs the request path no queries of its own.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+
+# Events held while the database is unreachable; beyond this the oldest
+# are dropped rather than growing without bound.
+MAX_PENDING = 50_000
+
+PRUNE_BATCH_SIZE = 5000
+
+
+@dataclass(frozen=True)
+class Event:
+    user_id: int
+    challenge_id: int
+    kind: int
+    revision: int
+    created_at: datetime
+
+
+class EventBuffer:
+    """Events recorded in this process and not inserted yet."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: list[Event] = []
+
+    def extend(self, events: list[Event]) -> int:
+        """Queue ``events``; returns the number now pending."""
+        with self._lock:
+            self._pending.extend(events)
+            return len(self._pending)
+
+    def drain(self) -> list[Event]:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def restore(self, events: list[Event]) -> None:
+        """Put back events that failed to insert, ahead of newer ones."""
+        with self._lock:
+            self._pending[:0] = events
+            dropped = len(self._pending) - MAX_PENDING
+            if dropped > 0:
+                del self._pending[:dropped]
+                logger.warning("Progress event buffer full; dropped %s events", dropped)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+_buffer = EventBuffer()
+
+
+def record(user_id: int, challenge_id: int, kind: int, *, revision: int = 0, at=None,
+           using: str = "default") -> None:
+    """Log one event once the current transaction commits."""
+    record_many([(user_id, challenge_id, kind, revision)], at=at, using=using)
+
+
+def record_many(entries, *, at=None, using: str = "default") -> None:
+    """Log ``(user_id, challenge_id, kind, revision)`` events, all stamped
+    ``at`` (default: now), once the current transaction commits. Nothing
+    is logged if it rolls back."""
+    created_at = at or timezone.now()
+    events = [Event(user_id, challenge_id, kind, revision, created_at)
+              for user_id, challenge_id, kind, revision in entries]
+    if events:
+        transaction.on_commit(lambda: _enqueue(events), using=using)
+
+
+def _enqueue(events: list[Event]) -> None:
+    pending = _buffer.extend(events)
+    interval = getattr(settings, "PROGRESS_EVENT_FLUSH_SECONDS", 5)
+    if interval <= 0 or pending >= FLUSH_BATCH_SIZE:
+        flush()
+    else:
+        _ensure_flusher(interval)
+
+
+def flush() -> int:
+    """Insert every buffered event. Events from a failed batch go back
+    into the buffer. Returns the number inserted."""
+    from .models import ProgressEvent
+
+    events = _buffer.drain()
+    written = 0
+    for start in range(0, len(events), FLUSH_BATCH_SIZE):
+        batch = events[start:start + FLUSH_BATCH_SIZE]
+        try:
+            ProgressEvent.objects.bulk_create([
+                ProgressEvent(
+                    user_id=event.user_id,
+                    challenge_id=event.challenge_id,
+                    kind=event.kind,
+                    revision=event.revision,
+                    created_at=event.created_at,
+                )
+                for event in batch
+            ])
+        except Exception:
+            logger.exception("Progress event flush failed; re-queueing %s events", len(events) - start)
+            _buffer.restore(events[start:])
+            break
+        written += len(batch)
+    return written
+
+
+def _flush_loop(interval: int) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except Exception:
+            logger.exception("Progress event flusher error")
+        finally:
+            connection.close()
+
+
+_flusher: threading.Thread | None = None
+_flusher_lock = threading.Lock()
+
+
+def _ensure_flusher(interval: int) -> None:
+    """Start this process's background flusher on first use."""
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, args=(interval,), name="progress-event-flusher", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+
+# --- Retention ------------------------------------------------------------
+
+
+def prune(before: datetime, *, batch_size: int = PRUNE_BATCH_SIZE) -> int:
+    """Delete events older than ``before`` in batches of ``batch_size``
+    rows, each its own short transaction. Returns the number deleted."""
+    from .models import ProgressEvent
+
+    deleted = 0
+    while True:
+        ids = list(
+            ProgressEvent.objects.filter(created_at__lt=before)
+            .order_by("id").values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += ProgressEvent.objects.filter(id__in=ids).delete()[0]
+
+
+def compact(before: datetime) -> int:
+    """Fold SAVED events older than ``before`` into one row per user,
+    challenge and UTC day.
+
+    The latest row of each group is kept and its ``count`` becomes the
+    group's total. Works one day per transaction. Returns the number of
+    rows removed.
+    """
+    from .models import ProgressEvent
+
+    saved = ProgressEvent.objects.filter(kind=ProgressEvent.Kind.SAVED)
+    oldest = saved.filter(created_at__lt=before).order_by("created_at").values_list("created_at", flat=True).first()
+    if oldest is None:
+        return 0
+    removed = 0
+    day = oldest.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < before:
+        window = saved.filter(created_at__gte=day, created_at__lt=min(day + timedelta(days=1), before))
+        groups = window.values("user_id", "challenge_id").annotate(
+            keep=Max("id"), total=Sum("count"), rows=Count("id")
+        ).filter(rows__gt=1).order_by()
+        with transaction.atomic():
+            merged = [ProgressEvent(id=group["keep"], count=group["total"]) for group in groups]
+            if merged:
+                ProgressEvent.objects.bulk_update(merged, ["count"], batch_size=FLUSH_BATCH_SIZE)
+                keep = window.values("user_id", "challenge_id").annotate(keep=Max("id")).order_by().values("keep")
+                removed += window.exclude(id__in=keep).delete()[0]
+        day += timedelta(days=1)
+    return removed
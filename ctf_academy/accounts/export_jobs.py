@@ -0,0 +1,387 @@
+"""Admin exports written to a file in the background, for downloads too
+large to stream inside the request timeout.
+
+``enqueue`` records an ExportJob and hands it to a small worker pool
+(EXPORT_WORKERS threads; with 0, ``manage.py run_export_jobs`` picks it
+up). The worker appends the export to ``<EXPORT_ROOT>/<id>.<attempt>.part``
+a chunk of rows at a time. After each chunk it fsyncs the file and
+checkpoints the last primary key written and the file size. A job whose
+worker died stops sending heartbeats; whoever claims it next copies the
+checkpointed prefix into a part file of its own and carries on after that
+key. Each part file has a single writer, so a worker that was taken over
+but is still running can't touch the new one. Gzipped exports are written
+as one gzip member per chunk, so every checkpoint falls on a member
+boundary.
+
+Finished files are renamed to ``<EXPORT_ROOT>/<id>`` and deleted by
+``expire`` once EXPORT_RETENTION_HOURS have passed.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from . import exports
+
+logger = logging.getLogger(__name__)
+
+# ExportSpec.from_params keys kept on the job
+PARAMS = ("type", "format", "fields", "start", "end", "gzip")
+# Claims of one job before it is marked failed
+MAX_ATTEMPTS = 3
+# Bytes per read when serving a range
+READ_BYTES = 64 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    """The requested byte range starts past the end of the file."""
+
+
+class _Superseded(Exception):
+    """Another worker claimed the job since this one did."""
+
+
+def export_root() -> Path:
+    return Path(getattr(settings, "EXPORT_ROOT", "") or Path(settings.BASE_DIR) / "exports")
+
+
+def retention() -> timedelta:
+    return timedelta(hours=getattr(settings, "EXPORT_RETENTION_HOURS", 24))
+
+
+def stale_after() -> timedelta:
+    """How long a RUNNING job may go without a checkpoint before it is
+    taken over. Must be well above the time one chunk takes."""
+    return timedelta(seconds=getattr(settings, "EXPORT_STALE_SECONDS", 120))
+
+
+def file_path(job) -> Path:
+    return export_root() / str(job.pk)
+
+
+def part_path(job) -> Path:
+    """The part file of the job's current attempt."""
+    return export_root() / f"{job.pk}.{job.attempts}.part"
+
+
+def _part_files(job) -> dict[int, Path]:
+    """Every attempt's part file, by attempt."""
+    parts = {}
+    for path in export_root().glob(f"{job.pk}.*.part"):
+        attempt = path.name[len(str(job.pk)) + 1:-len(".part")]
+        if attempt.isdigit():
+            parts[int(attempt)] = path
+    return parts
+
+
+def _remove_parts(job, *, keep: Path | None = None) -> None:
+    for path in _part_files(job).values():
+        if path != keep:
+            path.unlink(missing_ok=True)
+
+
+def spec_of(job) -> exports.ExportSpec:
+    return exports.ExportSpec.from_params(job.params)
+
+
+def etag(job, size: int) -> str:
+    return f'"{job.pk}-{size}"'
+
+
+def job_payload(job) -> dict:
+    from .models import ExportJob
+
+    done = job.status == ExportJob.Status.DONE
+    return {
+        "id": str(job.pk),
+        "status": job.status,
+        "params": job.params,
+        "rows_written": job.rows_written,
+        "bytes_written": job.bytes_written,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "expires_at": job.expires_at.isoformat() if job.expires_at else None,
+        "status_url": reverse("admin_export_job_status", args=[job.pk]),
+        "download_url": reverse("admin_export_job_download", args=[job.pk]) if done else None,
+    }
+
+
+def enqueue(user, params):
+    """Validate ``params`` (raising exports.ExportError), record the job
+    and start it once the surrounding transaction commits."""
+    from .models import ExportJob
+
+    exports.ExportSpec.from_params(params)
+    expire()
+    job = ExportJob.objects.create(
+        requested_by=user, params={key: params[key] for key in PARAMS if params.get(key)}
+    )
+    transaction.on_commit(lambda: submit(job.pk))
+    return job
+
+
+def _claimable(now: datetime) -> Q:
+    from .models import ExportJob
+
+    return Q(status=ExportJob.Status.QUEUED) | Q(
+        status=ExportJob.Status.RUNNING, heartbeat_at__lt=now - stale_after()
+    )
+
+
+def pending():
+    """Jobs waiting for a worker: queued, or running without a recent heartbeat."""
+    from .models import ExportJob
+
+    return ExportJob.objects.filter(_claimable(timezone.now())).order_by("created_at")
+
+
+def claim(job_id):
+    """Take the job for this worker, or return None if it isn't claimable.
+
+    ``attempts`` goes up with every claim and fences the checkpoints, so a
+    worker that was taken over stops at its next one.
+    """
+    from .models import ExportJob
+
+    now = timezone.now()
+    claimable = ExportJob.objects.filter(_claimable(now), pk=job_id)
+    if claimable.filter(attempts__lt=MAX_ATTEMPTS).update(
+        status=ExportJob.Status.RUNNING, attempts=F("attempts") + 1, heartbeat_at=now
+    ):
+        return ExportJob.objects.get(pk=job_id)
+    for job in claimable:
+        job.status = ExportJob.Status.FAILED
+        job.error = job.error or f"Gave up after {job.attempts} attempts."
+        job.finished_at = now
+        job.save(update_fields=["status", "error", "finished_at"])
+        _remove_parts(job)
+    return None
+
+
+def _checkpoint(job, **fields) -> None:
+    from .models import ExportJob
+
+    fields["heartbeat_at"] = timezone.now()
+    if not ExportJob.objects.filter(pk=job.pk, status=ExportJob.Status.RUNNING, attempts=job.attempts).update(**fields):
+        raise _Superseded
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+
+def _append(fh: BinaryIO, data: bytes, *, compress: bool) -> None:
+    if data:
+        if compress:
+            compressor = exports.gzip_compressor()
+            data = compressor.compress(data) + compressor.flush()
+        fh.write(data)
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
+def _copy_checkpoint(job, fh: BinaryIO) -> bool:
+    """Copy the checkpointed prefix of an earlier attempt's part file into
+    ``fh``. False if no earlier file holds all of it.
+
+    The newest file at least ``bytes_written`` long is the one to copy:
+    every attempt since the checkpoint started from a copy of it.
+    """
+    earlier = sorted(_part_files(job).items(), reverse=True)
+    for attempt, path in earlier:
+        if attempt >= job.attempts:
+            continue
+        try:
+            with open(path, "rb") as src:
+                if os.fstat(src.fileno()).st_size < job.bytes_written:
+                    continue
+                remaining = job.bytes_written
+                while remaining > 0:
+                    data = src.read(min(READ_BYTES, remaining))
+                    if not data:
+                        break
+                    fh.write(data)
+                    remaining -= len(data)
+        except FileNotFoundError:
+            continue
+        if remaining == 0:
+            return True
+        fh.seek(0)
+        fh.truncate()
+    return False
+
+
+def _write(job, *, chunk_size: int) -> None:
+    from .models import ExportJob
+
+    spec = spec_of(job)
+    encoder = exports.Encoder(spec)
+    part = part_path(job)
+    part.parent.mkdir(parents=True, exist_ok=True)
+    with open(part, "w+b") as fh:
+        if job.bytes_written and not _copy_checkpoint(job, fh):
+            # The partial file is gone or short of the checkpoint: start over
+            job.last_pk, job.rows_written, job.bytes_written = None, 0, 0
+        _remove_parts(job, keep=part)
+        if job.bytes_written == 0:
+            _append(fh, encoder.header(), compress=spec.compress)
+            _checkpoint(job, last_pk=None, rows_written=0, bytes_written=fh.tell())
+        for batch in exports.batches(spec, after_pk=job.last_pk, chunk_size=chunk_size):
+            _append(fh, encoder.rows(batch, first=job.rows_written == 0), compress=spec.compress)
+            _checkpoint(
+                job, last_pk=batch[-1][0], rows_written=job.rows_written + len(batch), bytes_written=fh.tell()
+            )
+        # The footer is never checkpointed on its own: a crash before the
+        # job is done truncates it away again
+        _append(fh, encoder.footer(), compress=spec.compress)
+        size = fh.tell()
+    now = timezone.now()
+    # If the rename fails the job is not marked done; if the commit fails
+    # run() removes the renamed file
+    with transaction.atomic():
+        _checkpoint(
+            job,
+            status=ExportJob.Status.DONE,
+            bytes_written=size,
+            finished_at=now,
+            expires_at=now + retention(),
+        )
+        os.replace(part, file_path(job))
+
+
+def run(job_id, *, chunk_size: int = exports.CHUNK_SIZE) -> bool:
+    """Claim the job and write its file, resuming from the last checkpoint.
+    Returns True if this call finished it."""
+    from .models import ExportJob
+
+    job = claim(job_id)
+    if job is None:
+        return False
+    try:
+        _write(job, chunk_size=chunk_size)
+    except _Superseded:
+        logger.warning("Export job %s was taken over by another worker", job_id)
+        return False
+    except Exception as exc:
+        logger.exception("Export job %s failed", job_id)
+        if ExportJob.objects.filter(pk=job.pk, status=ExportJob.Status.RUNNING, attempts=job.attempts).update(
+            status=ExportJob.Status.FAILED, error=str(exc) or type(exc).__name__, finished_at=timezone.now()
+        ):
+            _remove_parts(job)
+            file_path(job).unlink(missing_ok=True)
+        return False
+    expire()
+    return True
+
+
+def expire(now: datetime | None = None) -> int:
+    """Delete the files of finished jobs past their expiry and mark the
+    jobs expired. Returns the number expired."""
+    from .models import ExportJob
+
+    now = now or timezone.now()
+    expired = 0
+    for job in ExportJob.objects.filter(status=ExportJob.Status.DONE, expires_at__lte=now).only("pk"):
+        if ExportJob.objects.filter(pk=job.pk, status=ExportJob.Status.DONE).update(status=ExportJob.Status.EXPIRED):
+            file_path(job).unlink(missing_ok=True)
+            expired += 1
+    return expired
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+# Job ids submitted to this process's pool and not yet finished
+_submitted: set = set()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.EXPORT_WORKERS, thread_name_prefix="export")
+    return _executor
+
+
+def _run_job(job_id) -> None:
+    try:
+        run(job_id)
+    except Exception:
+        logger.exception("Export job %s could not be run", job_id)
+    finally:
+        with _executor_lock:
+            _submitted.discard(job_id)
+        connection.close()
+
+
+def submit(job_id) -> bool:
+    """Run the job on the worker pool. Returns False when there is no pool
+    (``EXPORT_WORKERS = 0``) or the job is already waiting on it."""
+    if getattr(settings, "EXPORT_WORKERS", 0) <= 0:
+        return False
+    executor = _get_executor()
+    with _executor_lock:
+        if job_id in _submitted:
+            return False
+        _submitted.add(job_id)
+    executor.submit(_run_job, job_id)
+    return True
+
+
+def resume(job) -> bool:
+    """Resubmit a job left queued or abandoned by a worker that died."""
+    if not pending().filter(pk=job.pk).exists():
+        return False
+    return submit(job.pk)
+
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def byte_range(header: str, size: int) -> tuple[int, int] | None:
+    """``(first, last)`` byte positions (inclusive) for a single-range
+    ``Range`` header, or None to send the whole file (malformed or
+    multi-range headers are ignored). Raises RangeNotSatisfiable."""
+    match = _RANGE.fullmatch(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # bytes=-N: the last N bytes
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def read_range(fh: BinaryIO, start: int, length: int) -> Iterator[bytes]:
+    """``length`` bytes of ``fh`` from ``start``; closes it when done."""
+    try:
+        fh.seek(start)
+        while length > 0:
+            data = fh.read(min(READ_BYTES, length))
+            if not data:
+                return
+            length -= len(data)
+            yield data
+    finally:
+        fh.close()
@@ -0,0 +1,261 @@
+"""Admin data exports, encoded and streamed a chunk of rows at a time.
+
+An ``ExportSpec`` names a dataset (users, challenges or progress), the
+fields to include, an optional date range and the output format: ``json``
+(the original ``{"<dataset>": [...]}`` document), ``ndjson`` or ``csv``,
+optionally gzipped. Rows are read in primary key order through a
+server-side cursor (``QuerySet.iterator``), so memory stays flat however
+large the table is, and a reader can pick up after any primary key.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from itertools import islice
+from typing import Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+JSON = "json"
+NDJSON = "ndjson"
+CSV = "csv"
+FORMATS = (JSON, NDJSON, CSV)
+
+CONTENT_TYPES = {
+    JSON: "application/json",
+    NDJSON: "application/x-ndjson",
+    CSV: "text/csv; charset=utf-8",
+}
+
+# Rows fetched per round trip from the server-side cursor
+CHUNK_SIZE = 2000
+# Encoded bytes gathered before a piece is handed to the response
+BUFFER_BYTES = 64 * 1024
+
+
+class ExportError(ValueError):
+    """The export parameters are invalid."""
+
+
+@dataclass(frozen=True)
+class Dataset:
+    name: str
+    # Field paths (values_list lookups) a caller may ask for
+    fields: tuple[str, ...]
+    # What an export without ``fields`` includes
+    default_fields: tuple[str, ...]
+    # DateTimeField the date range applies to
+    date_field: str
+
+    def queryset(self):
+        from django.contrib.auth.models import User
+
+        from .models import Challenge, ChallengeProgress
+
+        if self.name == "users":
+            return User.objects.filter(is_active=True)
+        if self.name == "challenges":
+            return Challenge.objects.filter(is_active=True)
+        return ChallengeProgress.objects.all()
+
+
+DATASETS = {
+    dataset.name: dataset
+    for dataset in (
+        Dataset(
+            "users",
+            fields=("id", "username", "email", "first_name", "last_name", "date_joined", "last_login",
+                    "is_active", "is_staff"),
+            default_fields=("id", "username", "email", "date_joined", "is_active"),
+            date_field="date_joined",
+        ),
+        Dataset(
+            "challenges",
+            fields=("id", "title", "slug", "difficulty", "points", "category_id", "category__name",
+                    "created_at", "updated_at"),
+            default_fields=("id", "title", "slug", "difficulty", "points", "category__name"),
+            date_field="created_at",
+        ),
+        Dataset(
+            "progress",
+            fields=("id", "user_id", "user__username", "challenge_id", "challenge__title", "challenge__slug",
+                    "status", "started_at", "updated_at", "completed_at", "last_saved_ok"),
+            default_fields=("user__username", "challenge__title", "status", "started_at", "updated_at",
+                            "completed_at"),
+            date_field="updated_at",
+        ),
+    )
+}
+
+
+def _parse_bound(value: str, *, end: bool) -> datetime:
+    """A datetime, or a date meaning the start of that day (for ``end``,
+    the start of the next day, so the day itself is included)."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    dataset: str
+    fields: tuple[str, ...]
+    format: str = JSON
+    compress: bool = False
+    # Half-open range on the dataset's date_field: start <= date < end
+    start: datetime | None = None
+    end: datetime | None = None
+
+    @classmethod
+    def from_params(cls, params) -> "ExportSpec":
+        """Build a spec from request parameters: ``type``, ``format``,
+        ``fields`` (comma separated), ``start``, ``end`` and ``gzip``."""
+        dataset = DATASETS.get(params.get("type", "users"))
+        if dataset is None:
+            raise ExportError("Invalid export type")
+        fmt = params.get("format", JSON)
+        if fmt not in FORMATS:
+            raise ExportError(f"format must be one of: {', '.join(FORMATS)}.")
+        fields = dataset.default_fields
+        if params.get("fields"):
+            fields = tuple(dict.fromkeys(f.strip() for f in params["fields"].split(",") if f.strip()))
+            unknown = [f for f in fields if f not in dataset.fields]
+            if unknown or not fields:
+                raise ExportError(
+                    f"Unknown fields: {', '.join(unknown) or '(none)'}. "
+                    f"Available for {dataset.name}: {', '.join(dataset.fields)}."
+                )
+        bounds = {}
+        for name in ("start", "end"):
+            if params.get(name):
+                try:
+                    bounds[name] = _parse_bound(params[name], end=name == "end")
+                except ValueError:
+                    raise ExportError(f"{name} must be a date (YYYY-MM-DD) or ISO datetime.") from None
+        if "start" in bounds and "end" in bounds and bounds["start"] >= bounds["end"]:
+            raise ExportError("start must be before end.")
+        return cls(
+            dataset=dataset.name,
+            fields=fields,
+            format=fmt,
+            compress=params.get("gzip", "") in ("1", "true", "yes"),
+            **bounds,
+        )
+
+    @property
+    def content_type(self) -> str:
+        return "application/gzip" if self.compress else CONTENT_TYPES[self.format]
+
+    def filename(self, now: datetime | None = None) -> str:
+        stamp = timezone.localtime(now or timezone.now()).strftime("%Y%m%d-%H%M%S")
+        return f"{self.dataset}-{stamp}.{self.format}{'.gz' if self.compress else ''}"
+
+    def queryset(self):
+        """``(pk, *fields)`` tuples in primary key order."""
+        dataset = DATASETS[self.dataset]
+        qs = dataset.queryset()
+        if self.start is not None:
+            qs = qs.filter(**{f"{dataset.date_field}__gte": self.start})
+        if self.end is not None:
+            qs = qs.filter(**{f"{dataset.date_field}__lt": self.end})
+        return qs.order_by("pk").values_list("pk", *self.fields)
+
+
+def batches(spec: ExportSpec, *, after_pk=None, chunk_size: int = CHUNK_SIZE) -> Iterator[list[tuple]]:
+    """The spec's rows in lists of up to ``chunk_size``, each row
+    ``(pk, *fields)``, starting after ``after_pk`` when given."""
+    qs = spec.queryset()
+    if after_pk is not None:
+        qs = qs.filter(pk__gt=after_pk)
+    rows = qs.iterator(chunk_size=chunk_size)
+    while batch := list(islice(rows, chunk_size)):
+        yield batch
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+class Encoder:
+    """Turns rows into the bytes of one format. ``header`` and ``footer``
+    frame the document; ``rows`` encodes a batch, with ``first`` saying
+    whether anything came before it."""
+
+    def __init__(self, spec: ExportSpec):
+        self.spec = spec
+
+    def header(self) -> bytes:
+        if self.spec.format == JSON:
+            return f'{{"{self.spec.dataset}": ['.encode()
+        if self.spec.format == CSV:
+            return self._csv([self.spec.fields])
+        return b""
+
+    def rows(self, batch: Iterable[tuple], *, first: bool) -> bytes:
+        fields = self.spec.fields
+        if self.spec.format == CSV:
+            return self._csv([_csv_value(v) for v in row[1:]] for row in batch)
+        encoded = [json.dumps(dict(zip(fields, row[1:])), cls=DjangoJSONEncoder) for row in batch]
+        if self.spec.format == NDJSON:
+            return "".join(line + "\n" for line in encoded).encode()
+        text = ", ".join(encoded)
+        return (text if first or not text else ", " + text).encode()
+
+    def footer(self) -> bytes:
+        return b"]}" if self.spec.format == JSON else b""
+
+    @staticmethod
+    def _csv(rows) -> bytes:
+        out = io.StringIO()
+        csv.writer(out).writerows(rows)
+        return out.getvalue().encode()
+
+
+def gzip_compressor():
+    """A zlib compressor writing the gzip format."""
+    return zlib.compressobj(wbits=31)
+
+
+def stream(spec: ExportSpec, *, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """The whole export as a sequence of byte pieces of roughly
+    BUFFER_BYTES, gzipped if the spec asks for it."""
+    encoder = Encoder(spec)
+    compressor = gzip_compressor() if spec.compress else None
+
+    def pieces():
+        yield encoder.header()
+        first = True
+        for batch in batches(spec, chunk_size=chunk_size):
+            yield encoder.rows(batch, first=first)
+            first = False
+        yield encoder.footer()
+
+    buffer, size = [], 0
+    for piece in pieces():
+        if compressor is not None:
+            piece = compressor.compress(piece)
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if compressor is not None:
+        buffer.append(compressor.flush())
+    if rest := b"".join(buffer):
+        yield rest
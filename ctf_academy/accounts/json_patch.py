@@ -0,0 +1,132 @@
+"""JSON Patch (RFC 6902) over plain JSON values, with RFC 6901 pointers."""
+from __future__ import annotations
+
+import copy
+import re
+
+# Cap on operations per patch; a client with more should send a snapshot.
+MAX_OPERATIONS = 1000
+
+_INDEX_RE = re.compile(r"0|[1-9][0-9]*")
+
+
+class JsonPatchError(ValueError):
+    """The patch is malformed or does not apply to the document."""
+
+
+def parse_pointer(pointer) -> list[str]:
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith("/")):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    if pointer == "":
+        return []
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _index(array: list, token: str, *, allow_end: bool = False) -> int:
+    if allow_end and token == "-":
+        return len(array)
+    if not _INDEX_RE.fullmatch(token):
+        raise JsonPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(array) or (index == len(array) and not allow_end):
+        raise JsonPatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _get(doc, tokens: list[str]):
+    for token in tokens:
+        if isinstance(doc, dict):
+            if token not in doc:
+                raise JsonPatchError(f"Missing member: {token!r}")
+            doc = doc[token]
+        elif isinstance(doc, list):
+            doc = doc[_index(doc, token)]
+        else:
+            raise JsonPatchError(f"Cannot traverse into a scalar at {token!r}")
+    return doc
+
+
+def _add(doc, tokens: list[str], value):
+    if not tokens:
+        return value
+    parent, key = _get(doc, tokens[:-1]), tokens[-1]
+    if isinstance(parent, dict):
+        parent[key] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, key, allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Cannot add a member to a scalar at {key!r}")
+    return doc
+
+
+def _remove(doc, tokens: list[str]):
+    if not tokens:
+        raise JsonPatchError("Cannot remove the document root")
+    parent, key = _get(doc, tokens[:-1]), tokens[-1]
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise JsonPatchError(f"Missing member: {key!r}")
+        del parent[key]
+    elif isinstance(parent, list):
+        del parent[_index(parent, key)]
+    else:
+        raise JsonPatchError(f"Cannot remove a member from a scalar at {key!r}")
+    return doc
+
+
+def _json_equal(a, b) -> bool:
+    """Equality by JSON type: unlike ``==``, ``True`` is not ``1``."""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_json_equal(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_json_equal(x, y) for x, y in zip(a, b))
+    return type(a) is type(b) and a == b
+
+
+def apply_patch(document, operations):
+    """Return ``document`` with ``operations`` applied; the input is not modified.
+
+    Operations apply in order and the patch is atomic: any failure raises
+    ``JsonPatchError`` and nothing is returned.
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError("A patch must be a list of operations")
+    if len(operations) > MAX_OPERATIONS:
+        raise JsonPatchError(f"A patch may have at most {MAX_OPERATIONS} operations")
+    doc = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise JsonPatchError("Each operation must be an object")
+        op = operation.get("op")
+        path = parse_pointer(operation.get("path"))
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise JsonPatchError(f"'{op}' requires a value")
+        if op == "add":
+            doc = _add(doc, path, copy.deepcopy(operation["value"]))
+        elif op == "remove":
+            doc = _remove(doc, path)
+        elif op == "replace":
+            _get(doc, path)
+            if path:
+                doc = _remove(doc, path)
+            doc = _add(doc, path, copy.deepcopy(operation["value"]))
+        elif op in ("move", "copy"):
+            source = parse_pointer(operation.get("from"))
+            value = _get(doc, source)
+            if op == "move":
+                if path[:len(source)] == source and len(path) > len(source):
+                    raise JsonPatchError("Cannot move a value into one of its own children")
+                doc = _remove(doc, source)
+            else:
+                value = copy.deepcopy(value)
+            doc = _add(doc, path, value)
+        elif op == "test":
+            if not _json_equal(_get(doc, path), operation["value"]):
+                raise JsonPatchError(f"Test failed at {operation.get('path')!r}")
+        else:
+            raise JsonPatchError(f"Unknown operation: {op!r}")
+    return doc
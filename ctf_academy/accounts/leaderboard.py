@@ -0,0 +1,447 @@
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .avatars import avatar_url
+from .streaks import effective_streak, local_date
+
+logger = logging.getLogger(__name__)
+
+# Members sort by (points desc, user id asc). Ties break on the id rather
+# than the username because the database, the sorted set and the bisect list
+# would each order usernames by a different collation. The id leads the
+# member key zero-padded, so Redis's byte order among equal scores is numeric
+# order, and the username follows a NUL separator (never valid in a username).
+MEMBER_SEPARATOR = "\x00"
+MEMBER_ID_WIDTH = 20
+
+
+@dataclass(frozen=True)
+class LeaderboardEntry:
+    rank: int
+    user_id: int
+    username: str
+    points: int
+
+
+def _encode_member(user_id: int, username: str) -> str:
+    return f"{user_id:0{MEMBER_ID_WIDTH}d}{MEMBER_SEPARATOR}{username}"
+
+
+def _decode_member(member: str) -> tuple[int, str]:
+    user_id, _, username = member.partition(MEMBER_SEPARATOR)
+    return int(user_id), username
+
+
+def load_standings() -> list[tuple[int, str, int]]:
+    """Return ``(user_id, username, points)`` for every active user from the DB."""
+    from django.contrib.auth.models import User
+    from django.db.models.functions import Coalesce
+
+    return list(
+        User.objects.filter(is_active=True)
+        .annotate(total_points=Coalesce("score__points", 0))
+        .values_list("id", "username", "total_points")
+    )
+
+
+class LeaderboardStore:
+    """Ranked (points desc, user id asc) view of all active users.
+
+    Ranks are 1-based. Implementations load themselves from the database on
+    first use; ``rebuild`` replaces the whole board in one step. ``shared``
+    says whether every process sees the same board, and so whether a
+    management command can repair it.
+    """
+
+    shared = True
+
+    def rebuild(self, standings: Iterable[tuple[int, str, int]]) -> None:
+        raise NotImplementedError
+
+    def upsert(self, user_id: int, username: str, points: int) -> None:
+        raise NotImplementedError
+
+    def remove(self, user_id: int) -> None:
+        raise NotImplementedError
+
+    def rank(self, user_id: int) -> int | None:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def range(self, start: int, stop: int) -> list[LeaderboardEntry]:
+        """Entries at 0-based positions ``start`` (inclusive) to ``stop`` (exclusive)."""
+        raise NotImplementedError
+
+    def position(self, points: int, user_id: int) -> int:
+        """How many entries rank strictly before ``(points, user_id)``.
+
+        The position need not belong to an entry, so a cursor stays usable
+        after its user's score changes or the user leaves the board.
+        """
+        raise NotImplementedError
+
+    def top(self, n: int) -> list[LeaderboardEntry]:
+        return self.range(0, n)
+
+    def around(self, user_id: int, n: int) -> list[LeaderboardEntry]:
+        """Up to ``n`` entries either side of the user, plus the user."""
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(rank - 1 - n, 0)
+        return self.range(start, rank + n)
+
+    def entries(self) -> list[LeaderboardEntry]:
+        return self.range(0, self.count())
+
+    def ensure_loaded(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryLeaderboardStore(LeaderboardStore):
+    """In-process store: a sorted key list searched with bisect.
+
+    Used with the locmem cache, so each worker keeps its own copy. It loads
+    from the database on first access and again every
+    LEADERBOARD_RELOAD_SECONDS, which is what repairs drift here: nothing
+    outside the process can reach the copy.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._keys: list[tuple[int, int, str]] = []
+        self._by_user: dict[int, tuple[int, int, str]] = {}
+        self._loaded_at: float | None = None
+
+    def ensure_loaded(self) -> None:
+        if self._loaded_at is None:
+            self.rebuild(load_standings())
+            return
+        ttl = getattr(settings, "LEADERBOARD_RELOAD_SECONDS", 300)
+        if ttl <= 0 or time.monotonic() - self._loaded_at < ttl:
+            return
+        # One thread reloads; the others keep reading the current board
+        if self._reload_lock.acquire(blocking=False):
+            try:
+                self.rebuild(load_standings())
+            finally:
+                self._reload_lock.release()
+
+    def rebuild(self, standings):
+        keys = sorted((-points, user_id, username) for user_id, username, points in standings)
+        with self._lock:
+            self._keys = keys
+            self._by_user = {key[1]: key for key in keys}
+            self._loaded_at = time.monotonic()
+
+    def upsert(self, user_id, username, points):
+        self.ensure_loaded()
+        key = (-points, user_id, username)
+        with self._lock:
+            old = self._by_user.get(user_id)
+            if old == key:
+                return
+            if old is not None:
+                del self._keys[bisect.bisect_left(self._keys, old)]
+            bisect.insort(self._keys, key)
+            self._by_user[user_id] = key
+
+    def remove(self, user_id):
+        self.ensure_loaded()
+        with self._lock:
+            old = self._by_user.pop(user_id, None)
+            if old is not None:
+                del self._keys[bisect.bisect_left(self._keys, old)]
+
+    def rank(self, user_id):
+        self.ensure_loaded()
+        with self._lock:
+            key = self._by_user.get(user_id)
+            if key is None:
+                return None
+            return bisect.bisect_left(self._keys, key) + 1
+
+    def count(self):
+        self.ensure_loaded()
+        return len(self._keys)
+
+    def range(self, start, stop):
+        self.ensure_loaded()
+        with self._lock:
+            window = self._keys[max(start, 0):max(stop, 0)]
+        return [
+            LeaderboardEntry(rank=start + i + 1, user_id=user_id, username=username, points=-neg)
+            for i, (neg, user_id, username) in enumerate(window)
+        ]
+
+    def position(self, points, user_id):
+        self.ensure_loaded()
+        # (-points, user_id) sorts before every key that extends it
+        with self._lock:
+            return bisect.bisect_left(self._keys, (-points, user_id))
+
+
+# KEYS = sorted set; ARGV = score, zero-padded user id. Binary search over
+# the members sharing the score, which are in user id order.
+_POSITION_SCRIPT = """
+local lo = redis.call('ZCOUNT', KEYS[1], '-inf', '(' .. ARGV[1])
+local hi = lo + redis.call('ZCOUNT', KEYS[1], ARGV[1], ARGV[1])
+local width = string.len(ARGV[2])
+while lo < hi do
+    local mid = math.floor((lo + hi) / 2)
+    local member = redis.call('ZRANGE', KEYS[1], mid, mid)[1]
+    if string.sub(member, 1, width) < ARGV[2] then
+        lo = mid + 1
+    else
+        hi = mid
+    end
+end
+return lo
+"""
+
+
+class RedisLeaderboardStore(LeaderboardStore):
+    """Redis sorted set keyed by ``-points`` so ZRANK gives the leaderboard rank.
+
+    A hash maps user ids to their current member so renames and removals do
+    not need the old username.
+    """
+
+    def __init__(self, client, prefix: str = "leaderboard"):
+        self.client = client
+        self.zkey = f"{prefix}:z"
+        self.hkey = f"{prefix}:members"
+        # Versioned with the member format, so boards stored in an older
+        # format are rebuilt on first use
+        self.ready_key = f"{prefix}:ready:2"
+        self._position = client.register_script(_POSITION_SCRIPT)
+
+    def ensure_loaded(self) -> None:
+        if not self.client.exists(self.ready_key):
+            self.rebuild(load_standings())
+
+    def rebuild(self, standings):
+        tmp_z, tmp_h = f"{self.zkey}:tmp", f"{self.hkey}:tmp"
+        pipe = self.client.pipeline()
+        pipe.delete(tmp_z, tmp_h)
+        batch_z, batch_h = {}, {}
+        total = 0
+        for user_id, username, points in standings:
+            member = _encode_member(user_id, username)
+            batch_z[member] = -points
+            batch_h[str(user_id)] = member
+            total += 1
+            if len(batch_z) >= 1000:
+                pipe.zadd(tmp_z, batch_z)
+                pipe.hset(tmp_h, mapping=batch_h)
+                batch_z, batch_h = {}, {}
+        if batch_z:
+            pipe.zadd(tmp_z, batch_z)
+            pipe.hset(tmp_h, mapping=batch_h)
+        if total:
+            pipe.rename(tmp_z, self.zkey)
+            pipe.rename(tmp_h, self.hkey)
+        else:
+            pipe.delete(self.zkey, self.hkey)
+        pipe.set(self.ready_key, 1)
+        pipe.execute()
+
+    def _member(self, user_id: int) -> str | None:
+        member = self.client.hget(self.hkey, str(user_id))
+        return member.decode() if isinstance(member, bytes) else member
+
+    def upsert(self, user_id, username, points):
+        self.ensure_loaded()
+        member = _encode_member(user_id, username)
+        old = self._member(user_id)
+        pipe = self.client.pipeline()
+        if old is not None and old != member:
+            pipe.zrem(self.zkey, old)
+        pipe.zadd(self.zkey, {member: -points})
+        pipe.hset(self.hkey, str(user_id), member)
+        pipe.execute()
+
+    def remove(self, user_id):
+        self.ensure_loaded()
+        old = self._member(user_id)
+        if old is not None:
+            pipe = self.client.pipeline()
+            pipe.zrem(self.zkey, old)
+            pipe.hdel(self.hkey, str(user_id))
+            pipe.execute()
+
+    def rank(self, user_id):
+        self.ensure_loaded()
+        member = self._member(user_id)
+        if member is None:
+            return None
+        rank = self.client.zrank(self.zkey, member)
+        return None if rank is None else rank + 1
+
+    def count(self):
+        self.ensure_loaded()
+        return self.client.zcard(self.zkey)
+
+    def range(self, start, stop):
+        self.ensure_loaded()
+        start = max(start, 0)
+        if stop <= start:
+            return []
+        rows = self.client.zrange(self.zkey, start, stop - 1, withscores=True)
+        entries = []
+        for i, (member, score) in enumerate(rows):
+            if isinstance(member, bytes):
+                member = member.decode()
+            user_id, username = _decode_member(member)
+            entries.append(LeaderboardEntry(rank=start + i + 1, user_id=user_id, username=username, points=int(-score)))
+        return entries
+
+    def position(self, points, user_id):
+        self.ensure_loaded()
+        return int(self._position(keys=[self.zkey], args=[-points, f"{user_id:0{MEMBER_ID_WIDTH}d}"]))
+
+
+_store: LeaderboardStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_leaderboard_store() -> LeaderboardStore:
+    """Return the process-wide store: Redis when the default cache is django-redis."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+                if backend.startswith("django_redis"):
+                    from django_redis import get_redis_connection
+
+                    _store = RedisLeaderboardStore(get_redis_connection("default"))
+                else:
+                    _store = MemoryLeaderboardStore()
+    return _store
+
+
+def publish_score(user_id: int, username: str, points: int) -> None:
+    """Push a user's committed score to the store; drift is repaired by reconcile."""
+    try:
+        get_leaderboard_store().upsert(user_id, username, points)
+    except Exception:
+        logger.exception("Failed to publish leaderboard score for user %s", user_id)
+
+
+def withdraw_user(user_id: int) -> None:
+    """Drop a user from the store (deleted or deactivated)."""
+    try:
+        get_leaderboard_store().remove(user_id)
+    except Exception:
+        logger.exception("Failed to remove user %s from leaderboard", user_id)
+
+
+# --- Windowed reads -------------------------------------------------------
+
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(points: int, user_id: int) -> str:
+    """Opaque keyset cursor for the (points desc, user id asc) ordering."""
+    return urlsafe_base64_encode(json.dumps([points, user_id]).encode())
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    """Inverse of ``encode_cursor``; raises ValueError on malformed input."""
+    try:
+        points, user_id = json.loads(urlsafe_base64_decode(cursor))
+    except Exception as exc:
+        raise ValueError("Invalid cursor.") from exc
+    if not isinstance(points, int) or not isinstance(user_id, int):
+        raise ValueError("Invalid cursor.")
+    return points, user_id
+
+
+def _ranked_users():
+    from django.contrib.auth.models import User
+    from django.db.models import F
+    from django.db.models.functions import Coalesce
+
+    return User.objects.filter(is_active=True).annotate(
+        solved_count=Coalesce("score__solved_count", 0),
+        current_streak=Coalesce("score__current_streak", 0),
+        last_active_date=F("score__last_active_date"),
+        avatar_hash=F("profile__image_hash"),
+    )
+
+
+def rows_for_entries(entries: list[LeaderboardEntry]) -> list[dict]:
+    """Hydrate store entries (already in rank order) with DB stats. Entries
+    for users missing from the DB are dropped; the others keep their rank.
+
+    Points come from the entry, so a row's cursor matches its place in the
+    store even if the database has moved on since.
+    """
+    if not entries:
+        return []
+    users = {u.id: u for u in _ranked_users().filter(id__in=[e.user_id for e in entries])}
+    today = local_date(timezone.now())
+    return [
+        {
+            "rank": e.rank,
+            "id": u.id,
+            "username": u.username,
+            "points": e.points,
+            "challenges": u.solved_count,
+            "streak": effective_streak(u.current_streak, u.last_active_date, today),
+            "avatar_url": avatar_url(u.id, u.avatar_hash),
+        }
+        for e in entries
+        if (u := users.get(e.user_id)) is not None
+    ]
+
+
+def keyset_page(*, after: str | None = None, before: str | None = None, limit: int = PAGE_SIZE) -> list[dict]:
+    """One page of rows strictly after (or before) a cursor position.
+
+    The page is a rank range of the store, which already holds the order;
+    only the page's own users are read from the database.
+    """
+    store = get_leaderboard_store()
+    if before:
+        points, user_id = decode_cursor(before)
+        stop = store.position(points, user_id)
+        entries = store.range(max(stop - limit, 0), stop)
+    else:
+        start = 0
+        if after:
+            points, user_id = decode_cursor(after)
+            start = store.position(points, user_id + 1)
+        entries = store.range(start, start + limit)
+    return rows_for_entries(entries)
+
+
+def window_meta(rows: list[dict]) -> dict:
+    """Cursors and has-more flags for a window of rows."""
+    if not rows:
+        return {"prev": None, "next": None, "has_prev": False, "has_next": False}
+    first, last = rows[0], rows[-1]
+    return {
+        "prev": encode_cursor(first["points"], first["id"]),
+        "next": encode_cursor(last["points"], last["id"]),
+        "has_prev": first["rank"] > 1,
+        "has_next": last["rank"] < get_leaderboard_store().count(),
+    }
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import UserScore
+from accounts.streaks import streak_states_from_history
+
+
+class Command(BaseCommand):
+    help = "Recompute stored streaks on UserScore from existing completed_at data."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows per bulk update (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        states = streak_states_from_history()
+        scores = list(UserScore.objects.all())
+        for score in scores:
+            current, longest, last_active = states.get(score.user_id, (0, 0, None))
+            score.current_streak = current
+            score.longest_streak = longest
+            score.last_active_date = last_active
+        with transaction.atomic():
+            UserScore.objects.bulk_update(
+                scores,
+                ["current_streak", "longest_streak", "last_active_date"],
+                batch_size=options["batch_size"],
+            )
+
+        missing = len(states.keys() - {s.user_id for s in scores})
+        self.stdout.write(self.style.SUCCESS(f"Backfilled streaks for {len(scores)} users."))
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f"{missing} users with completions have no UserScore row; run rebuild_user_scores."
+            ))
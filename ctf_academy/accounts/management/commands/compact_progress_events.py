@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts import events
+
+
+class Command(BaseCommand):
+    help = "Fold old SAVED progress events into one row per user, challenge and day."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "PROGRESS_EVENT_COMPACT_DAYS", 30),
+            help="Compact events older than this many days (default: PROGRESS_EVENT_COMPACT_DAYS).",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options["days"])
+        removed = events.compact(before)
+        self.stdout.write(self.style.SUCCESS(f"Compacted away {removed} saved events older than {before:%Y-%m-%d}."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import autosave
+
+
+class Command(BaseCommand):
+    help = "Write buffered challenge autosaves to ChallengeProgress."
+
+    def handle(self, *args, **options):
+        if isinstance(autosave.get_autosave_buffer(), autosave.MemoryAutosaveBuffer):
+            raise CommandError(
+                "Autosaves are buffered inside each web process (the default cache is not "
+                "django-redis), so this command can't reach them. Each process flushes its "
+                "own buffer every AUTOSAVE_FLUSH_SECONDS."
+            )
+        written = autosave.flush()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {written} autosaved states."))
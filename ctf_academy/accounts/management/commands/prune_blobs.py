@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.blobs import PRUNE_GRACE, get_blob_store
+from accounts.models import AvatarThumbnail, UserProfile
+
+
+class Command(BaseCommand):
+    help = "Delete blobs that no profile image or avatar thumbnail references."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report unreferenced blobs without deleting them.",
+        )
+        parser.add_argument(
+            "--grace-minutes",
+            type=int,
+            default=int(PRUNE_GRACE.total_seconds() // 60),
+            help="Keep blobs stored within this many minutes, which an upload in progress "
+                 f"may be about to reference (default: {int(PRUNE_GRACE.total_seconds() // 60)}).",
+        )
+
+    def handle(self, *args, **options):
+        # Take the cutoff first: a blob stored after it is skipped even if
+        # its reference commits after the query below
+        stored_before = timezone.now() - timedelta(minutes=options["grace_minutes"])
+        referenced = set(UserProfile.objects.exclude(image_hash="").values_list("image_hash", flat=True))
+        referenced.update(AvatarThumbnail.objects.values_list("digest", flat=True))
+
+        store = get_blob_store()
+        orphans = [digest for digest in store.digests(stored_before) if digest not in referenced]
+        self.stdout.write(f"{len(orphans)} unreferenced blobs ({len(referenced)} referenced).")
+        if options["dry_run"] or not orphans:
+            return
+        for digest in orphans:
+            store.delete(digest)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {len(orphans)} blobs."))
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts import trends
+
+
+class Command(BaseCommand):
+    help = "Delete hourly completion buckets older than their retention period."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=trends.hourly_retention_days(),
+            help="Keep this many days of hourly buckets (default: COMPLETION_HOURLY_RETENTION_DAYS).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=trends.PRUNE_BATCH_SIZE,
+            help=f"Rows per delete (default: {trends.PRUNE_BATCH_SIZE}).",
+        )
+
+    def handle(self, *args, **options):
+        before = trends.hour_of(timezone.now() - timedelta(days=options["days"]))
+        deleted = trends.prune_hourly(before, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} hourly buckets before {before:%Y-%m-%d %H:00} UTC."))
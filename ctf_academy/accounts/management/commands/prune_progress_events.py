@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts import events
+from accounts.models import ProgressEvent
+
+
+class Command(BaseCommand):
+    help = "Delete progress events older than the retention period."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "PROGRESS_EVENT_RETENTION_DAYS", 365),
+            help="Keep this many days of events (default: PROGRESS_EVENT_RETENTION_DAYS).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=events.PRUNE_BATCH_SIZE,
+            help=f"Rows per delete (default: {events.PRUNE_BATCH_SIZE}).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report how many events would be deleted without deleting them.",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options["days"])
+        if options["dry_run"]:
+            count = ProgressEvent.objects.filter(created_at__lt=before).count()
+            self.stdout.write(f"{count} events older than {before:%Y-%m-%d %H:%M}.")
+            return
+        deleted = events.prune(before, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} events older than {before:%Y-%m-%d %H:%M}."))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import SyncReceipt
+
+
+class Command(BaseCommand):
+    help = "Delete progress sync receipts too old for a client to still be retrying."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=getattr(settings, "PROGRESS_SYNC_RECEIPT_HOURS", 24),
+            help="Keep receipts this many hours (default: PROGRESS_SYNC_RECEIPT_HOURS).",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(hours=options["hours"])
+        deleted, _ = SyncReceipt.objects.filter(created_at__lt=before).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} sync receipts."))
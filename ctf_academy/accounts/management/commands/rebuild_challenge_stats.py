@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from accounts import stats
+from accounts.models import Challenge
+
+
+class Command(BaseCommand):
+    help = "Verify the ChallengeStats rollup against ChallengeProgress and Favorite and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drift without rewriting the rollup.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recount every challenge, not just those found to differ.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = stats.verify()
+        self.stdout.write(f"{len(drifted)} challenges differ from the raw tables.")
+        if drifted:
+            shown = ", ".join(map(str, drifted[:50]))
+            self.stdout.write(f"Challenge ids: {shown}{' ...' if len(drifted) > 50 else ''}")
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING("Dry run: rollup left unchanged."))
+            return
+        challenge_ids = list(Challenge.objects.values_list("id", flat=True)) if options["all"] else drifted
+        if not challenge_ids:
+            self.stdout.write(self.style.SUCCESS("Challenge stats are in sync."))
+            return
+        fixed = stats.rebuild(challenge_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {fixed} of {len(challenge_ids)} challenges."))
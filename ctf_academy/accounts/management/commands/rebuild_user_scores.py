@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from accounts.leaderboard import get_leaderboard_store, load_standings
+from accounts.models import ChallengeProgress, UserScore
+from accounts.streaks import streak_states_from_history
+
+
+class Command(BaseCommand):
+    help = "Rebuild the UserScore table (points, solves, streaks) from completed ChallengeProgress rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows per bulk insert (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        totals = (
+            ChallengeProgress.objects.filter(status=ChallengeProgress.Status.COMPLETED)
+            .values("user_id")
+            .annotate(
+                points=Sum("challenge__points"),
+                solved_count=Count("id"),
+                last_solved_at=Max("completed_at"),
+            )
+            .order_by()
+        )
+        streaks = streak_states_from_history()
+        rows = []
+        for t in totals:
+            current, longest, last_active = streaks.get(t["user_id"], (0, 0, None))
+            rows.append(UserScore(
+                user_id=t["user_id"],
+                points=t["points"] or 0,
+                solved_count=t["solved_count"],
+                last_solved_at=t["last_solved_at"],
+                current_streak=current,
+                longest_streak=longest,
+                last_active_date=last_active,
+            ))
+        with transaction.atomic():
+            UserScore.objects.all().delete()
+            UserScore.objects.bulk_create(rows, batch_size=options["batch_size"])
+        store = get_leaderboard_store()
+        if store.shared:
+            store.rebuild(load_standings())
+        else:
+            self.stdout.write(
+                "The leaderboard is kept inside each web process; they pick up the rebuilt "
+                "scores within LEADERBOARD_RELOAD_SECONDS."
+            )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt scores for {len(rows)} users."))
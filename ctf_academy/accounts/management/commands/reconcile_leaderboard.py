@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.leaderboard import get_leaderboard_store, load_standings
+
+
+class Command(BaseCommand):
+    help = "Compare the leaderboard store with UserScore and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drift without rewriting the store.",
+        )
+
+    def handle(self, *args, **options):
+        store = get_leaderboard_store()
+        if not store.shared:
+            raise CommandError(
+                "The leaderboard is kept inside each web process (the default cache is not "
+                "django-redis), so this command can't reach it. Each process reloads its board "
+                "from UserScore every LEADERBOARD_RELOAD_SECONDS."
+            )
+        expected = {user_id: (username, points) for user_id, username, points in load_standings()}
+        actual = {e.user_id: (e.username, e.points) for e in store.entries()}
+
+        missing = expected.keys() - actual.keys()
+        extra = actual.keys() - expected.keys()
+        changed = [uid for uid in expected.keys() & actual.keys() if expected[uid] != actual[uid]]
+        drift = len(missing) + len(extra) + len(changed)
+
+        self.stdout.write(
+            f"{len(missing)} missing, {len(extra)} stale, {len(changed)} out of date "
+            f"({len(expected)} users expected)."
+        )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Leaderboard is in sync."))
+            return
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING("Dry run: store left unchanged."))
+            return
+        store.rebuild((uid, username, points) for uid, (username, points) in expected.items())
+        self.stdout.write(self.style.SUCCESS(f"Repaired {drift} leaderboard entries."))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts import export_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued admin export jobs, resume ones whose worker died, "
+        "and delete expired export files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for jobs instead of exiting when none are left.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds between polls with --loop (default: 5).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            finished = 0
+            for job_id in export_jobs.pending().values_list("pk", flat=True):
+                if export_jobs.run(job_id):
+                    finished += 1
+                    self.stdout.write(f"Finished export {job_id}.")
+            expired = export_jobs.expire()
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS(f"Finished {finished} exports, expired {expired}."))
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_scores(apps, schema_editor):
+    from django.db.models import Count, Max, Sum
+
+    ChallengeProgress = apps.get_model('accounts', 'ChallengeProgress')
+    UserScore = apps.get_model('accounts', 'UserScore')
+    totals = (
+        ChallengeProgress.objects.filter(status='completed')
+        .values('user_id')
+        .annotate(points=Sum('challenge__points'), solved_count=Count('id'), last_solved_at=Max('completed_at'))
+        .order_by()
+    )
+    UserScore.objects.bulk_create(
+        [
+            UserScore(
+                user_id=t['user_id'],
+                points=t['points'] or 0,
+                solved_count=t['solved_count'],
+                last_solved_at=t['last_solved_at'],
+            )
+            for t in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_add_challengeprogress_created_at'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserScore',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('points', models.PositiveIntegerField(default=0, help_text='Sum of points over all completed challenges.')),
+                ('solved_count', models.PositiveIntegerField(default=0, help_text='Number of completed challenges.')),
+                ('last_solved_at', models.DateTimeField(blank=True, help_text='Timestamp of the most recent completion.', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-points'], name='accounts_us_points_16ed58_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:54
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# accounts.streaks as of this migration, frozen here so later changes to the
+# streak rules don't alter what this migration writes.
+def _local_date(value):
+    return timezone.localtime(value).date()
+
+
+def _streak_state(days):
+    current = longest = 0
+    previous = None
+    for day in sorted(days):
+        current = current + 1 if previous == day - timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest, previous
+
+
+def backfill_streaks(apps, schema_editor):
+    ChallengeProgress = apps.get_model('accounts', 'ChallengeProgress')
+    UserScore = apps.get_model('accounts', 'UserScore')
+    days = defaultdict(set)
+    rows = ChallengeProgress.objects.filter(status='completed', completed_at__isnull=False)
+    for user_id, completed_at in rows.values_list('user_id', 'completed_at').iterator(chunk_size=2000):
+        days[user_id].add(_local_date(completed_at))
+    scores = list(UserScore.objects.filter(user_id__in=days.keys()))
+    for score in scores:
+        score.current_streak, score.longest_streak, score.last_active_date = _streak_state(days[score.user_id])
+    UserScore.objects.bulk_update(scores, ['current_streak', 'longest_streak', 'last_active_date'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_userscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userscore',
+            name='current_streak',
+            field=models.PositiveIntegerField(default=0, help_text='Consecutive local days with a solve, ending on last_active_date.'),
+        ),
+        migrations.AddField(
+            model_name='userscore',
+            name='last_active_date',
+            field=models.DateField(blank=True, help_text='Local date of the most recent solve.', null=True),
+        ),
+        migrations.AddField(
+            model_name='userscore',
+            name='longest_streak',
+            field=models.PositiveIntegerField(default=0, help_text='Longest run of consecutive solve days.'),
+        ),
+        migrations.RunPython(backfill_streaks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_userscore_streaks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvatarThumbnail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.PositiveSmallIntegerField(help_text='Edge length in pixels.')),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnails', to='accounts.userprofile')),
+            ],
+            options={
+                'unique_together': {('profile', 'size')},
+            },
+        ),
+    ]
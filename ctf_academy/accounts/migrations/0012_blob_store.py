@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:20
+
+import hashlib
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 200
+
+
+def move_images_to_blobs(apps, schema_editor):
+    """Copy inline image bytes into Blob rows and reference them by digest."""
+    Blob = apps.get_model('accounts', 'Blob')
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    AvatarThumbnail = apps.get_model('accounts', 'AvatarThumbnail')
+
+    def store(data):
+        data = bytes(data)
+        digest = hashlib.sha256(data).hexdigest()
+        Blob.objects.bulk_create([Blob(digest=digest, data=data, size=len(data))], ignore_conflicts=True)
+        return digest
+
+    profiles = UserProfile.objects.filter(image_data__isnull=False).only('pk', 'image_data')
+    for profile in profiles.iterator(chunk_size=BATCH_SIZE):
+        if profile.image_data:
+            UserProfile.objects.filter(pk=profile.pk).update(image_hash=store(profile.image_data))
+
+    for thumb in AvatarThumbnail.objects.only('pk', 'data').iterator(chunk_size=BATCH_SIZE):
+        AvatarThumbnail.objects.filter(pk=thumb.pk).update(digest=store(thumb.data))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_avatarthumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 digest of the re-encoded profile image in the blob store.', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='avatarthumbnail',
+            name='digest',
+            field=models.CharField(default='', help_text='SHA-256 digest of the JPEG in the blob store.', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(move_images_to_blobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='image_data',
+        ),
+        migrations.RemoveField(
+            model_name='avatarthumbnail',
+            name='data',
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:03
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+INDEX_NAME = 'accounts_challenge_search_gin'
+
+
+def create_search_index(apps, schema_editor):
+    """GIN index and initial tsvectors; Postgres only."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS "{INDEX_NAME}" ON "accounts_challenge" USING gin ("search_vector");'
+    )
+    schema_editor.execute(
+        """
+        UPDATE "accounts_challenge" AS ch SET "search_vector" =
+            setweight(to_tsvector('english', coalesce(ch."title", '')), 'A')
+            || setweight(to_tsvector('english', coalesce(cat."name", '')), 'B')
+            || setweight(to_tsvector('english', coalesce(ch."description", '')), 'C')
+        FROM "accounts_category" AS cat
+        WHERE cat."id" = ch."category_id";
+        """
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS "{INDEX_NAME}";')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_blob_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_challenge_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengeprogress',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='challengeprogress',
+            name='state_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
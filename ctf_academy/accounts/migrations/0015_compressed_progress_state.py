@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:17
+
+import hashlib
+import json
+import zlib
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+# accounts.state_codec format 1 with the zlib codec (id 1), frozen here so
+# later codec changes don't alter what this migration writes.
+HEADER = bytes((1, 1))
+
+
+def _canonical(state):
+    return json.dumps(state, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def compress_states(apps, schema_editor):
+    """Move last_state into compressed state_data, one primary-key batch at a time."""
+    ChallengeProgress = apps.get_model('accounts', 'ChallengeProgress')
+    rows = ChallengeProgress.objects.filter(last_state__isnull=False).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk).only('pk', 'last_state')[:BATCH_SIZE])
+        if not batch:
+            break
+        for progress in batch:
+            encoded = _canonical(progress.last_state)
+            progress.state_data = HEADER + zlib.compress(encoded)
+            progress.state_hash = hashlib.sha256(encoded).hexdigest()
+        ChallengeProgress.objects.bulk_update(batch, ['state_data', 'state_hash'])
+        last_pk = batch[-1].pk
+
+
+def decompress_states(apps, schema_editor):
+    ChallengeProgress = apps.get_model('accounts', 'ChallengeProgress')
+    rows = ChallengeProgress.objects.filter(state_data__isnull=False).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk).only('pk', 'state_data')[:BATCH_SIZE])
+        if not batch:
+            break
+        for progress in batch:
+            data = bytes(progress.state_data)
+            payload = zlib.decompress(data[2:]) if data[1] == 1 else data[2:]
+            progress.last_state = json.loads(payload)
+        ChallengeProgress.objects.bulk_update(batch, ['last_state'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_challengeprogress_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='max_state_bytes',
+            field=models.PositiveIntegerField(blank=True, help_text='Optional: size limit for saved editor state, in bytes of JSON. Defaults to PROGRESS_STATE_MAX_BYTES.', null=True),
+        ),
+        migrations.AddField(
+            model_name='challengeprogress',
+            name='state_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(compress_states, decompress_states),
+        migrations.RemoveField(
+            model_name='challengeprogress',
+            name='last_state',
+        ),
+    ]
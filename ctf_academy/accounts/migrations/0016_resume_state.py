@@ -0,0 +1,89 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import Q
+
+
+BATCH_SIZE = 1000
+
+
+def copy_states(apps, schema_editor):
+    """Copy resume state into ResumeState, committing one primary-key batch
+    at a time so no lock on the progress table is held for long."""
+    ChallengeProgress = apps.get_model('accounts', 'ChallengeProgress')
+    ResumeState = apps.get_model('accounts', 'ResumeState')
+    alias = schema_editor.connection.alias
+    rows = ChallengeProgress.objects.using(alias).filter(
+        Q(state_data__isnull=False) | Q(revision__gt=0)
+    ).order_by('pk').values_list('pk', 'state_data', 'state_hash', 'revision')
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=alias):
+            batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+            ResumeState.objects.using(alias).bulk_create(
+                [
+                    ResumeState(progress_id=pk, state_data=data, state_hash=state_hash, revision=revision)
+                    for pk, data, state_hash, revision in batch
+                ],
+                ignore_conflicts=True,
+            )
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+
+
+def restore_states(apps, schema_editor):
+    ChallengeProgress = apps.get_model('accounts', 'ChallengeProgress')
+    ResumeState = apps.get_model('accounts', 'ResumeState')
+    alias = schema_editor.connection.alias
+    rows = ResumeState.objects.using(alias).order_by('pk')
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=alias):
+            batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+            ChallengeProgress.objects.using(alias).bulk_update(
+                [
+                    ChallengeProgress(pk=s.pk, state_data=s.state_data, state_hash=s.state_hash, revision=s.revision)
+                    for s in batch
+                ],
+                ['state_data', 'state_hash', 'revision'],
+            )
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # Batches in copy_states commit separately
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0015_compressed_progress_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumeState',
+            fields=[
+                ('progress', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resume_state', serialize=False, to='accounts.challengeprogress')),
+                ('state_data', models.BinaryField(blank=True, null=True)),
+                ('state_hash', models.CharField(blank=True, default='', max_length=64)),
+                ('revision', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(copy_states, restore_states),
+        migrations.RemoveField(
+            model_name='challengeprogress',
+            name='revision',
+        ),
+        migrations.RemoveField(
+            model_name='challengeprogress',
+            name='state_data',
+        ),
+        migrations.RemoveField(
+            model_name='challengeprogress',
+            name='state_hash',
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:35
+
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+BATCH_SIZE = 1000
+
+
+def fill_stats(apps, schema_editor):
+    """Give every challenge a ChallengeStats row with its progress and
+    favorites counted, a batch of challenges at a time. Solve times are summed per row in whole
+    seconds, as accounts.stats does."""
+    Challenge = apps.get_model('accounts', 'Challenge')
+    ChallengeProgress = apps.get_model('accounts', 'ChallengeProgress')
+    ChallengeStats = apps.get_model('accounts', 'ChallengeStats')
+    Favorite = apps.get_model('accounts', 'Favorite')
+    alias = schema_editor.connection.alias
+    challenge_ids = list(Challenge.objects.using(alias).order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(challenge_ids), BATCH_SIZE):
+        batch = challenge_ids[start:start + BATCH_SIZE]
+        totals = defaultdict(Counter)
+        progress = ChallengeProgress.objects.using(alias).filter(challenge_id__in=batch)
+        for row in progress.values('challenge_id', 'status').annotate(n=Count('id')).order_by():
+            totals[row['challenge_id']][row['status']] += row['n']
+        solved = progress.filter(
+            status='completed', started_at__isnull=False, completed_at__isnull=False
+        ).values_list('challenge_id', 'started_at', 'completed_at')
+        for challenge_id, started_at, completed_at in solved.iterator(chunk_size=2000):
+            totals[challenge_id]['solve_seconds'] += int((completed_at - started_at).total_seconds())
+            totals[challenge_id]['solve_count'] += 1
+        favorites = Favorite.objects.using(alias).filter(challenge_id__in=batch)
+        for row in favorites.values('challenge_id').annotate(n=Count('id')).order_by():
+            totals[row['challenge_id']]['favorites'] += row['n']
+        ChallengeStats.objects.using(alias).bulk_create([
+            ChallengeStats(
+                challenge_id=challenge_id,
+                attempted=counts['attempted'],
+                in_progress=counts['in_progress'],
+                completed=counts['completed'],
+                unsolved=counts['unsolved'],
+                favorites=counts['favorites'],
+                solve_seconds=counts['solve_seconds'],
+                solve_count=counts['solve_count'],
+            )
+            for challenge_id, counts in ((pk, totals[pk]) for pk in batch)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0018_syncreceipt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChallengeStats',
+            fields=[
+                ('challenge', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='accounts.challenge')),
+                ('attempted', models.IntegerField(default=0)),
+                ('in_progress', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('unsolved', models.IntegerField(default=0)),
+                ('favorites', models.IntegerField(default=0)),
+                ('solve_seconds', models.BigIntegerField(default=0)),
+                ('solve_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'challenge stats',
+            },
+        ),
+        migrations.AddField(
+            model_name='challengeprogress',
+            name='previous_status',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
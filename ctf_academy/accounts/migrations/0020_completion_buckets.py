@@ -0,0 +1,82 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:40
+
+from datetime import timedelta, timezone as dt_timezone
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+
+BATCH_SIZE = 1000
+
+
+def fill_buckets(apps, schema_editor):
+    """Count existing completions into the buckets: every day, and the hours
+    within COMPLETION_HOURLY_RETENTION_DAYS."""
+    ChallengeProgress = apps.get_model('accounts', 'ChallengeProgress')
+    DailyCompletion = apps.get_model('accounts', 'DailyCompletion')
+    HourlyCompletion = apps.get_model('accounts', 'HourlyCompletion')
+    alias = schema_editor.connection.alias
+    completed = ChallengeProgress.objects.using(alias).filter(status='completed', completed_at__isnull=False)
+    retention = getattr(settings, 'COMPLETION_HOURLY_RETENTION_DAYS', 30)
+    sources = [(DailyCompletion, 'day', completed, TruncDate('completed_at'))]
+    if retention > 0:
+        since = timezone.now() - timedelta(days=retention)
+        sources.append((
+            HourlyCompletion, 'hour', completed.filter(completed_at__gte=since),
+            TruncHour('completed_at', tzinfo=dt_timezone.utc),
+        ))
+    for model, field, rows, trunc in sources:
+        counts = rows.annotate(bucket=trunc).values(
+            'bucket', 'challenge_id', 'challenge__category_id'
+        ).annotate(n=Count('id')).order_by()
+        batch = []
+        for row in counts.iterator(chunk_size=BATCH_SIZE):
+            batch.append(model(**{field: row['bucket']}, challenge_id=row['challenge_id'],
+                               category_id=row['challenge__category_id'], count=row['n']))
+            if len(batch) >= BATCH_SIZE:
+                model.objects.using(alias).bulk_create(batch)
+                batch = []
+        model.objects.using(alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0019_challengestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('day', models.DateField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.category')),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.challenge')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'day'], name='accounts_da_categor_957e98_idx')],
+                'unique_together': {('day', 'challenge')},
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('hour', models.DateTimeField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.category')),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.challenge')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'hour'], name='accounts_ho_categor_ed13c3_idx')],
+                'unique_together': {('hour', 'challenge')},
+            },
+        ),
+        migrations.RunPython(fill_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated manually: index for keyset pagination of the admin user screens
+# (accounts.user_stats orders auth_user by date_joined, id).
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0020_completion_buckets"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS "accounts_user_date_joined_id" ON "auth_user" ("date_joined", "id");',
+            reverse_sql='DROP INDEX IF EXISTS "accounts_user_date_joined_id";',
+        ),
+    ]
@@ -1,6 +1,12 @@
 # In accounts/models.py
+import uuid
+from datetime import timedelta
+
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.conf import settings
 from django.urls import reverse
 from django.db.models.signals import post_save
@@ -8,6 +14,11 @@ from django.dispatch import receiver
 from django.utils.text import slugify
 from django.utils import timezone
 
+from .leaderboard import publish_score
+from .progress import progress_repository
+from .state_codec import decode_state, encode_state
+from .streaks import effective_streak, local_date, streak_states_from_history
+
 # class Category(models.Model):
 #     name = models.CharField(max_length=100, unique=True)
 #     slug = models.SlugField(max_length=100, unique=True)
@@ -45,12 +56,76 @@ from django.utils import timezone
 #         return reverse('challenge_detail', args=[str(self.id)])
     
 
-class UserProfile(models.Model):
+class DirtyFieldsMixin:
+    """
+    Remember the values a row was loaded (or last saved) with, so callers
+    can write back only the columns that actually changed.
+    """
+
+    # auto_now timestamps are bumped by save() itself, not by the caller.
+    DIRTY_IGNORED_FIELDS: tuple[str, ...] = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_fields()
+        return instance
+
+    def _tracked_fields(self):
+        deferred = self.get_deferred_fields()
+        return [
+            f for f in self._meta.concrete_fields
+            if not f.primary_key and f.attname not in deferred
+            and f.name not in self.DIRTY_IGNORED_FIELDS
+        ]
+
+    def _snapshot_fields(self):
+        self._loaded_values = {f.attname: getattr(self, f.attname) for f in self._tracked_fields()}
+
+    def get_dirty_fields(self) -> list[str]:
+        """Names of fields changed since the last load or save (all of them if unsaved)."""
+        loaded = getattr(self, "_loaded_values", None)
+        fields = self._tracked_fields()
+        if loaded is None or self._state.adding:
+            return [f.name for f in fields]
+        return [f.name for f in fields if f.attname in loaded and getattr(self, f.attname) != loaded[f.attname]]
+
+    def is_dirty(self) -> bool:
+        return bool(self.get_dirty_fields())
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            self._snapshot_fields()
+        else:
+            loaded = getattr(self, "_loaded_values", {})
+            for name in update_fields:
+                field = self._meta.get_field(name)
+                loaded[field.attname] = getattr(self, field.attname)
+            self._loaded_values = loaded
+
+    def save_dirty(self) -> bool:
+        """Save only the changed fields (plus auto_now ones). Returns False if nothing changed."""
+        dirty = self.get_dirty_fields()
+        if self._state.adding:
+            self.save()
+            return True
+        if not dirty:
+            return False
+        self.save(update_fields=[*dirty, *self.DIRTY_IGNORED_FIELDS])
+        return True
+
+
+class UserProfile(DirtyFieldsMixin, models.Model):
     """
     Extended user profile linked to Django's built-in User model.
-    Stores additional user information such as a base64-encoded image.
+    The profile image lives in the blob store and is referenced by hash,
+    so loading a profile never pulls image bytes.
     """
 
+    DIRTY_IGNORED_FIELDS = ("updated_at",)
+
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -58,10 +133,11 @@ class UserProfile(models.Model):
         help_text="The user account that owns this profile."
     )
 
-    image_data = models.BinaryField(
+    image_hash = models.CharField(
+        max_length=64,
         blank=True,
-        null=True,
-        help_text="Base64-encoded profile image stored as binary data."
+        default="",
+        help_text="SHA-256 digest of the re-encoded profile image in the blob store."
     )
 
     bio = models.TextField(
@@ -77,23 +153,60 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"Profile of {self.user.username}"
 
+    @property
+    def has_image(self) -> bool:
+        return bool(self.image_hash)
+
     def set_base64_image(self, base64_str: str):
         """
-        Store a base64-encoded image string as binary data.
+        Store a base64-encoded image in the blob store and reference it.
         """
         import base64
-        self.image_data = base64.b64decode(base64_str)
+        from .blobs import get_blob_store
+        self.image_hash = get_blob_store().put(base64.b64decode(base64_str))
 
     def get_base64_image(self) -> str | None:
         """
         Return the image as a base64-encoded string, or None if empty.
         """
         import base64
-        if self.image_data:
-            return base64.b64encode(self.image_data).decode('utf-8')
+        from .blobs import get_blob_store
+        if self.image_hash:
+            data = get_blob_store().read(self.image_hash)
+            if data:
+                return base64.b64encode(data).decode('utf-8')
         return None
 
 
+class Blob(models.Model):
+    """Content-addressed bytes, keyed by SHA-256 (DB backend of the blob store)."""
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"{self.digest[:12]}… ({self.size} bytes)"
+
+
+class AvatarThumbnail(models.Model):
+    """Pre-generated square JPEG of a profile image at one fixed size."""
+    profile = models.ForeignKey(
+        UserProfile,
+        on_delete=models.CASCADE,
+        related_name="thumbnails"
+    )
+    size = models.PositiveSmallIntegerField(help_text="Edge length in pixels.")
+    digest = models.CharField(max_length=64, help_text="SHA-256 digest of the JPEG in the blob store.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("profile", "size")
+
+    def __str__(self) -> str:
+        return f"{self.profile} @ {self.size}px"
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
@@ -142,6 +255,12 @@ class Challenge(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    max_state_bytes = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Optional: size limit for saved editor state, in bytes of JSON. Defaults to PROGRESS_STATE_MAX_BYTES."
+    )
+
     # Future placeholders for when we start simulating challenges
     entrypoint = models.CharField(
         max_length=100,
@@ -154,6 +273,10 @@ class Challenge(models.Model):
         help_text="JSON topology of simulated hosts and connections."
     )
 
+    # Maintained by accounts.search.refresh_search_vectors; the GIN index on
+    # it is created by migration 0013 on Postgres only.
+    search_vector = SearchVectorField(null=True, editable=False)
+
     def save(self, *args, **kwargs):
         # Auto-generate slug from title if not manually provided
         if not self.slug:
@@ -194,9 +317,13 @@ class ChallengeProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="challenge_progress")
     challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name="progress")
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.ATTEMPTED)
+    # Status before the latest repository write ("" after an insert). The
+    # upserts set it in the same statement that changes status, so each
+    # write can report its transition to ChallengeStats without a read
+    previous_status = models.CharField(max_length=20, blank=True, default="", editable=False)
 
-    # Optional state for resuming work (editor contents, cursor, etc.)
-    last_state = models.JSONField(blank=True, null=True)
+    # Resume state (editor contents, etc.) lives in ResumeState, so status
+    # and listing queries on this table never read it
 
     # If the client failed to save progress last time
     last_saved_ok = models.BooleanField(default=True)
@@ -218,11 +345,339 @@ class ChallengeProgress(models.Model):
             models.Index(fields=["user", "status"]),
         ]
 
-    def mark_completed(self):
-        self.status = self.Status.COMPLETED
-        if not self.completed_at:
-            self.completed_at = timezone.now()
-        self.save(update_fields=["status", "completed_at", "updated_at"])
+    def mark_completed(self) -> bool:
+        """Mark this progress row COMPLETED and credit the user's score.
+
+        Delegates to the progress repository, whose guarded upsert lets
+        concurrent requests award points only once. Returns True if this
+        call completed it.
+        """
+        result = progress_repository.complete(
+            self.user_id, self.challenge_id, self.challenge.points, self.user.username
+        )
+        self.status = result.status
+        if result.completed_at is not None:
+            self.completed_at = result.completed_at
+        return result.changed
+
+    def __str__(self) -> str:
+        return f"{self.user.username} → {self.challenge.title} [{self.status}]"
+
+
+class ResumeState(models.Model):
+    """Saved editor state for resuming a challenge, one row per progress row.
+
+    Only challenge_detail and save_progress read it; writes go through
+    the progress repository.
+    """
+    progress = models.OneToOneField(
+        ChallengeProgress, on_delete=models.CASCADE, primary_key=True, related_name="resume_state"
+    )
+    # Compressed by accounts.state_codec; read it as last_state
+    state_data = models.BinaryField(blank=True, null=True, editable=False)
+    # sha256 of the state's canonical JSON, so unchanged saves are skipped
+    state_hash = models.CharField(max_length=64, blank=True, default="")
+    # Bumped on every state change; clients send the revision they last saw
+    # and stale saves from another tab are rejected
+    revision = models.PositiveIntegerField(default=0)
+
+    @property
+    def last_state(self):
+        """The resume state, decompressed on access rather than on load."""
+        return decode_state(self.state_data)
+
+    @last_state.setter
+    def last_state(self, value):
+        self.state_data = encode_state(value)
+
+    def __str__(self) -> str:
+        return f"Resume state for progress {self.progress_id} (revision {self.revision})"
+
+
+class ChallengeStats(models.Model):
+    """Per-challenge rollup of progress and favorites for the admin views.
+
+    Adjusted in the same transaction as every progress and favorite
+    change (the progress repository and accounts.signals call
+    accounts.stats). Check or repair it with ``rebuild_challenge_stats``.
+    """
+    challenge = models.OneToOneField(
+        Challenge, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    # Progress rows per status; the field names match Status values. Not
+    # PositiveIntegerField, so drift can't make a decrement fail a write
+    attempted = models.IntegerField(default=0)
+    in_progress = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    unsolved = models.IntegerField(default=0)
+    favorites = models.IntegerField(default=0)
+    # Sum of completed_at - started_at, in whole seconds, over the
+    # completions that have both, and how many there are
+    solve_seconds = models.BigIntegerField(default=0)
+    solve_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "challenge stats"
+
+    @property
+    def total(self) -> int:
+        return self.attempted + self.in_progress + self.completed + self.unsolved
+
+    @property
+    def average_solve_minutes(self) -> float:
+        return self.solve_seconds / self.solve_count / 60 if self.solve_count else 0
+
+    def __str__(self) -> str:
+        return f"Stats for challenge {self.challenge_id}"
+
+
+class CompletionBucket(models.Model):
+    """Completions of one challenge within one time bucket.
+
+    Bumped by accounts.trends in the same transaction as the completion,
+    so trend queries read a row per bucket and challenge instead of
+    grouping ChallengeProgress. ``category`` is the challenge's category
+    when it was solved, so a window can be filtered without a join.
+    """
+    challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name="+")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="+")
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailyCompletion(CompletionBucket):
+    # Calendar day in TIME_ZONE
+    day = models.DateField()
+
+    class Meta:
+        unique_together = ("day", "challenge")
+        indexes = [models.Index(fields=["category", "day"])]
+
+    def __str__(self) -> str:
+        return f"{self.day}: challenge {self.challenge_id} x{self.count}"
+
+
+class HourlyCompletion(CompletionBucket):
+    """Like DailyCompletion, per hour; only the last
+    COMPLETION_HOURLY_RETENTION_DAYS are kept (``prune_completion_buckets``)."""
+    # Start of the hour
+    hour = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("hour", "challenge")
+        indexes = [models.Index(fields=["category", "hour"])]
+
+    def __str__(self) -> str:
+        return f"{self.hour:%Y-%m-%d %H:00}: challenge {self.challenge_id} x{self.count}"
+
+
+class ProgressEvent(models.Model):
+    """Append-only log of progress transitions and saves, for analytics.
+
+    Rows are written by the progress repository through the buffer in
+    accounts.events and never updated, except that ``compact_progress_events``
+    folds old SAVED rows into one per user, challenge and day. Trimmed by
+    ``prune_progress_events``.
+    """
+    class Kind(models.IntegerChoices):
+        ATTEMPTED = 1, "Attempted"
+        IN_PROGRESS = 2, "In Progress"
+        COMPLETED = 3, "Completed"
+        SAVED = 4, "Saved"
+
+    id = models.BigAutoField(primary_key=True)
+    # No foreign key constraints: the log outlives deleted users and
+    # challenges, and inserts don't wait on locks in either table
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    challenge = models.ForeignKey(
+        Challenge, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    kind = models.PositiveSmallIntegerField(choices=Kind.choices)
+    # Resume state revision written by a SAVED event; 0 for transitions
+    revision = models.PositiveIntegerField(default=0)
+    # Number of events this row stands for once compacted
+    count = models.PositiveIntegerField(default=1)
+    # When the event happened, not when the buffer flushed it
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["user", "challenge", "created_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id}/{self.challenge_id} {self.get_kind_display()} at {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class SyncReceipt(models.Model):
+    """Result of an applied progress sync operation, by the client's
+    idempotency key.
+
+    Written in the same transaction as the operation, so a retried batch
+    gets the original results back instead of applying twice. Expired by
+    ``prune_sync_receipts``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    key = models.CharField(max_length=64)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ("user", "key")
+
+    def __str__(self) -> str:
+        return f"{self.user_id}:{self.key}"
+
+
+class ExportJob(models.Model):
+    """An admin export written to a file under EXPORT_ROOT in the background.
+
+    Run by accounts.export_jobs. After every chunk of rows the worker
+    records the last primary key written and the file size at that point,
+    so a job whose worker died resumes from there. The file is deleted
+    once ``expires_at`` passes.
+    """
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+        EXPIRED = "expired", "Expired"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name="+")
+    # accounts.exports.ExportSpec parameters, re-parsed by the worker
+    params = models.JSONField()
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    # Checkpoint: rows up to last_pk are in the first bytes_written bytes
+    last_pk = models.BigIntegerField(null=True, blank=True)
+    rows_written = models.BigIntegerField(default=0)
+    bytes_written = models.BigIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped at every checkpoint; a RUNNING job that stops bumping it is
+    # taken over after EXPORT_STALE_SECONDS
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self) -> str:
+        return f"Export {self.id} ({self.get_status_display()})"
+
+
+class UserScore(models.Model):
+    """Denormalized per-user score, maintained incrementally on completion.
+
+    Rows are created lazily on a user's first solve; users without a row
+    have zero points. Rebuild with ``manage.py rebuild_user_scores``.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="score",
+    )
+    points = models.PositiveIntegerField(
+        default=0,
+        help_text="Sum of points over all completed challenges."
+    )
+    solved_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of completed challenges."
+    )
+    last_solved_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="Timestamp of the most recent completion."
+    )
+    current_streak = models.PositiveIntegerField(
+        default=0,
+        help_text="Consecutive local days with a solve, ending on last_active_date."
+    )
+    longest_streak = models.PositiveIntegerField(
+        default=0,
+        help_text="Longest run of consecutive solve days."
+    )
+    last_active_date = models.DateField(
+        blank=True,
+        null=True,
+        help_text="Local date of the most recent solve."
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-points"]),
+        ]
+
+    @classmethod
+    def record_completion(cls, user_id: int, points: int, completed_at) -> "UserScore":
+        """Add one solve worth ``points`` to the user's score row and return it.
+
+        The streak advances in the same UPDATE: a solve on the day after
+        ``last_active_date`` extends it, a later day restarts it at 1, and
+        same-day or backdated solves leave it unchanged.
+        """
+        day = local_date(completed_at)
+        streak = Case(
+            When(last_active_date__gte=day, then=F("current_streak")),
+            When(last_active_date=day - timedelta(days=1), then=F("current_streak") + 1),
+            default=Value(1),
+        )
+        score, _ = cls.objects.get_or_create(user_id=user_id)
+        cls.objects.filter(user_id=user_id).update(
+            points=F("points") + points,
+            solved_count=F("solved_count") + 1,
+            last_solved_at=Greatest(Coalesce("last_solved_at", Value(completed_at)), Value(completed_at)),
+            current_streak=streak,
+            longest_streak=Greatest(F("longest_streak"), streak),
+            last_active_date=Greatest(Coalesce("last_active_date", Value(day)), Value(day)),
+            updated_at=timezone.now(),
+        )
+        score.refresh_from_db()
+        return score
+
+    @classmethod
+    def recompute(cls, user_id: int) -> "UserScore | None":
+        """Rebuild one user's row from their completed progress, for edits
+        ``record_completion`` can't express (un-completing, deleting or
+        re-dating a solve). Returns None for a user with no row and no solves."""
+        totals = ChallengeProgress.objects.filter(
+            user_id=user_id, status=ChallengeProgress.Status.COMPLETED
+        ).aggregate(
+            points=models.Sum("challenge__points"),
+            solved_count=models.Count("id"),
+            last_solved_at=models.Max("completed_at"),
+        )
+        current, longest, last_active = streak_states_from_history([user_id]).get(user_id, (0, 0, None))
+        values = {
+            "points": totals["points"] or 0,
+            "solved_count": totals["solved_count"],
+            "last_solved_at": totals["last_solved_at"],
+            "current_streak": current,
+            "longest_streak": longest,
+            "last_active_date": last_active,
+        }
+        if not cls.objects.filter(user_id=user_id).update(**values, updated_at=timezone.now()):
+            if not values["solved_count"]:
+                return None
+            return cls.objects.create(user_id=user_id, **values)
+        return cls.objects.get(user_id=user_id)
+
+    @property
+    def streak(self) -> int:
+        """Current streak with read-time expiry applied."""
+        return effective_streak(self.current_streak, self.last_active_date)
 
     def __str__(self) -> str:
-        return f"{self.user.username} → {self.challenge.title} [{self.status}]"
\ No newline at end of file
+        return f"{self.user.username}: {self.points} pts ({self.solved_count} solved)"
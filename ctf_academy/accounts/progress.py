@@ -0,0 +1,713 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from datetime import timezone as dt_timezone
+from dataclasses import dataclass, replace
+from typing import Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, CharField, F, Q, Value, When
+from django.db.models.functions import Coalesce
+
+from . import events, stats, trends
+from .state_codec import decode_state, encode_state
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_TTL = 60 * 60
+
+# Marker status for favorite rows in the combined summary query.
+_FAVORITE = "__favorite__"
+
+
+def _version_key(user_id: int) -> str:
+    return f"progress:version:{user_id}"
+
+
+def _summary_key(user_id: int, version: int) -> str:
+    return f"progress:summary:{user_id}:{version}"
+
+
+@dataclass(frozen=True)
+class ProgressSummary:
+    """One user's challenge statuses and favorites."""
+    statuses: dict[int, str]
+    favorites: frozenset[int]
+
+    def status(self, challenge_id: int) -> str | None:
+        return self.statuses.get(challenge_id)
+
+    def is_completed(self, challenge_id: int) -> bool:
+        from .models import ChallengeProgress
+
+        return self.statuses.get(challenge_id) == ChallengeProgress.Status.COMPLETED
+
+    def is_in_progress(self, challenge_id: int) -> bool:
+        from .models import ChallengeProgress
+
+        return self.statuses.get(challenge_id) == ChallengeProgress.Status.IN_PROGRESS
+
+    def is_incomplete(self, challenge_id: int) -> bool:
+        """Started (attempted, in progress or unsolved) but not completed."""
+        return challenge_id in self.statuses and not self.is_completed(challenge_id)
+
+    def counters(self, challenges: Iterable) -> dict:
+        """Totals, completion counts and points over a set of catalog challenges."""
+        totals = {"total": 0, "points_total": 0, "completed": 0, "in_progress": 0,
+                  "incomplete": 0, "favorites": 0, "points_earned": 0}
+        for ch in challenges:
+            totals["total"] += 1
+            totals["points_total"] += ch.points
+            if self.is_completed(ch.id):
+                totals["completed"] += 1
+                totals["points_earned"] += ch.points
+            elif ch.id in self.statuses:
+                totals["incomplete"] += 1
+                if self.is_in_progress(ch.id):
+                    totals["in_progress"] += 1
+            if ch.id in self.favorites:
+                totals["favorites"] += 1
+        return totals
+
+
+def load_progress_summary(user_id: int) -> ProgressSummary:
+    """Statuses and favorites for a user in a single UNION ALL query."""
+    from .models import ChallengeProgress, Favorite
+
+    progress = ChallengeProgress.objects.filter(user_id=user_id).values_list("challenge_id", "status")
+    favorites = (
+        Favorite.objects.filter(user_id=user_id)
+        .annotate(kind=Value(_FAVORITE, output_field=CharField()))
+        .values_list("challenge_id", "kind")
+    )
+    statuses, favorite_ids = {}, set()
+    for challenge_id, status in progress.union(favorites, all=True):
+        if status == _FAVORITE:
+            favorite_ids.add(challenge_id)
+        else:
+            statuses[challenge_id] = status
+    return ProgressSummary(statuses=statuses, favorites=frozenset(favorite_ids))
+
+
+def _current_version(user_id: int) -> int:
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed with a timestamp so an evicted key never reuses an old version
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_progress_summary(user_id: int) -> ProgressSummary:
+    """Cached summary, valid until the user's progress version is bumped."""
+    try:
+        key = _summary_key(user_id, _current_version(user_id))
+        summary = cache.get(key)
+    except Exception:
+        logger.exception("Progress summary cache unavailable for user %s", user_id)
+        return load_progress_summary(user_id)
+    if summary is None:
+        summary = load_progress_summary(user_id)
+        cache.set(key, summary, SUMMARY_TTL)
+    return summary
+
+
+def bump_progress_version(user_id: int) -> None:
+    """Invalidate a user's cached summary."""
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+    except Exception:
+        logger.exception("Failed to bump progress version for user %s", user_id)
+
+
+def progress_changed(user_id: int) -> None:
+    """Bump the user's summary version once the current transaction commits.
+
+    Signals cover model saves and deletes; call this after queryset
+    ``update()`` calls, which send no signals.
+    """
+    transaction.on_commit(lambda: bump_progress_version(user_id))
+
+
+# --- Writes ---------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class ProgressWrite:
+    """Outcome of a repository write: the row's status afterwards and
+    whether this call changed it."""
+    status: str
+    changed: bool
+    completed_at: object = None
+
+
+@dataclass(frozen=True)
+class ChallengeSession:
+    """What challenge_detail needs when a user opens a challenge."""
+    status: str
+    # The previous session's last autosave never succeeded
+    unsaved: bool
+    is_favorite: bool
+    state_data: bytes | None = None
+    state_hash: str = ""
+    revision: int = 0
+
+    @property
+    def last_state(self):
+        """The resume state, decompressed on access."""
+        return decode_state(self.state_data)
+
+
+def _as_datetime(value):
+    """Normalise a RETURNING timestamp to an aware datetime.
+
+    Postgres returns aware datetimes; SQLite returns naive UTC datetimes
+    or strings, depending on type detection.
+    """
+    from django.utils import timezone
+    from django.utils.dateparse import parse_datetime
+
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value, dt_timezone.utc)
+    return value
+
+
+class ProgressRepository:
+    """Single-statement writes to ChallengeProgress.
+
+    Each write is one ``INSERT ... ON CONFLICT (user_id, challenge_id) DO
+    UPDATE ... RETURNING`` with the allowed status transitions encoded in
+    SQL: COMPLETED is never downgraded, and ATTEMPTED/UNSOLVED move forward
+    to IN_PROGRESS. Backends without conflict targets or RETURNING fall back
+    to a conditional UPDATE plus INSERT in a transaction.
+
+    Every write also sets ``previous_status`` to the status it replaced and
+    returns it, so the transition it made is applied to ChallengeStats in
+    the same transaction.
+    """
+
+    def __init__(self, using: str = "default"):
+        self.using = using
+
+    @property
+    def connection(self):
+        from django.db import connections
+
+        return connections[self.using]
+
+    def _supports_upsert(self) -> bool:
+        features = self.connection.features
+        return features.supports_update_conflicts_with_target and features.can_return_rows_from_bulk_insert
+
+    def _previous_status_sql(self) -> str:
+        from .models import ChallengeProgress
+
+        qn = self.connection.ops.quote_name
+        return f"{qn('previous_status')} = {qn(ChallengeProgress._meta.db_table)}.{qn('status')}, "
+
+    def _upsert(self, insert: dict, assignments: str, where: str = "", extra_params=()) -> tuple | None:
+        """Run the upsert and return ``(status, completed_at,
+        previous_status, started_at)``, or None if the ``where`` guard
+        skipped the update."""
+        rows = self._upsert_many(
+            [insert], self._previous_status_sql() + assignments, where, extra_params,
+            returning=("status", "completed_at", "previous_status", "started_at"),
+        )
+        if not rows:
+            return None
+        status, completed_at, previous_status, started_at = rows[0]
+        return status, _as_datetime(completed_at), previous_status, _as_datetime(started_at)
+
+    def _upsert_many(self, inserts: list[dict], assignments: str, where: str = "", extra_params=(), *,
+                     model=None, conflict=("user_id", "challenge_id"),
+                     returning=("status", "completed_at")) -> list[tuple]:
+        """Multi-row upsert into ``model`` (ChallengeProgress by default);
+        ``inserts`` must not repeat a key. Returns the ``returning`` columns
+        of the rows inserted or updated. Without ``assignments`` existing
+        rows are left alone and only inserted rows come back."""
+        from .models import ChallengeProgress
+
+        conn = self.connection
+        qn = conn.ops.quote_name
+        table = qn((model or ChallengeProgress)._meta.db_table)
+        columns = ", ".join(qn(c) for c in inserts[0])
+        row_sql = f"({', '.join(['%s'] * len(inserts[0]))})"
+        sql = (
+            f"INSERT INTO {table} ({columns}) VALUES {', '.join([row_sql] * len(inserts))} "
+            f"ON CONFLICT ({', '.join(qn(c) for c in conflict)}) "
+            f"{f'DO UPDATE SET {assignments}' if assignments else 'DO NOTHING'}"
+            f"{f' WHERE {where}' if where else ''} "
+            f"RETURNING {', '.join(qn(c) for c in returning)}"
+        )
+        params = [value for insert in inserts for value in insert.values()]
+        with conn.cursor() as cursor:
+            cursor.execute(sql, [*params, *extra_params])
+            return cursor.fetchall()
+
+    def _insert_values(self, user_id: int, challenge_id: int, now, **values) -> dict:
+        from .models import ChallengeProgress
+
+        conn = self.connection
+        ts = conn.ops.adapt_datetimefield_value(now)
+        row = {
+            "user_id": user_id,
+            "challenge_id": challenge_id,
+            "status": ChallengeProgress.Status.ATTEMPTED,
+            "previous_status": "",
+            "last_saved_ok": True,
+            "created_at": ts,
+            "started_at": ts,
+            "updated_at": ts,
+            "completed_at": None,
+        }
+        for name, value in values.items():
+            field = ChallengeProgress._meta.get_field(name)
+            row[name] = field.get_db_prep_save(value, conn)
+        return row
+
+    def _fallback(self, user_id: int, challenge_id: int, create: dict, update: dict, guard=None) -> tuple | None:
+        from django.db import IntegrityError
+
+        from .models import ChallengeProgress
+
+        qs = ChallengeProgress.objects.using(self.using).filter(user_id=user_id, challenge_id=challenge_id)
+        # Right-hand sides see the row as it was, so this is the old status
+        update = {"previous_status": F("status"), **update}
+        returning = ("status", "completed_at", "previous_status", "started_at")
+        with transaction.atomic(using=self.using):
+            if qs.filter(guard or Q()).update(**update):
+                return qs.values_list(*returning).get()
+            if qs.exists():
+                return None
+            try:
+                # bulk_create sends no signals; the caller applies the stats
+                obj = ChallengeProgress(user_id=user_id, challenge_id=challenge_id, **create)
+                with transaction.atomic(using=self.using):
+                    ChallengeProgress.objects.using(self.using).bulk_create([obj])
+                return obj.status, obj.completed_at, obj.previous_status, obj.started_at
+            except IntegrityError:
+                # Lost an insert race; apply the update to the winner's row
+                if qs.filter(guard or Q()).update(**update):
+                    return qs.values_list(*returning).get()
+                return None
+
+    def _touch_sql(self) -> tuple[str, list]:
+        """Assignments marking a progress row as saved: flag the save ok and
+        move ATTEMPTED forward to IN_PROGRESS."""
+        from .models import ChallengeProgress
+
+        S = ChallengeProgress.Status
+        qn = self.connection.ops.quote_name
+        status = f"{qn(ChallengeProgress._meta.db_table)}.{qn('status')}"
+        return (
+            self._previous_status_sql() +
+            f"{qn('last_saved_ok')} = EXCLUDED.{qn('last_saved_ok')}, "
+            f"{qn('status')} = CASE WHEN {status} = %s THEN %s ELSE {status} END, "
+            f"{qn('updated_at')} = EXCLUDED.{qn('updated_at')}",
+            [S.ATTEMPTED, S.IN_PROGRESS],
+        )
+
+    def _touch_fallback(self, user_id: int, challenge_id: int, now) -> tuple:
+        """``(progress_id, status, previous_status)`` after the touch."""
+        from .models import ChallengeProgress
+
+        S = ChallengeProgress.Status
+        status, _, previous_status, _ = self._fallback(
+            user_id, challenge_id,
+            create={"status": S.IN_PROGRESS, "last_saved_ok": True},
+            update={
+                "last_saved_ok": True,
+                "status": Case(When(status=S.ATTEMPTED, then=Value(S.IN_PROGRESS)), default=F("status")),
+                "updated_at": now,
+            },
+        )
+        progress_id = ChallengeProgress.objects.using(self.using).filter(
+            user_id=user_id, challenge_id=challenge_id
+        ).values_list("pk", flat=True).get()
+        return progress_id, status, previous_status
+
+    def _write_states(self, states: dict[int, tuple]) -> set[int]:
+        """Upsert ResumeState rows from ``{progress_id: (state, state_hash, revision)}``.
+
+        Only a higher revision replaces a stored one, so a write-behind
+        flush can never overwrite a newer state written directly. Returns
+        the progress ids actually written.
+        """
+        from django.db import IntegrityError
+
+        from .models import ResumeState
+
+        if self._supports_upsert():
+            qn = self.connection.ops.quote_name
+            table = qn(ResumeState._meta.db_table)
+            field = ResumeState._meta.get_field("state_data")
+            inserts = [
+                {
+                    "progress_id": progress_id,
+                    "state_data": field.get_db_prep_save(encode_state(state), self.connection),
+                    "state_hash": state_hash,
+                    "revision": revision,
+                }
+                for progress_id, (state, state_hash, revision) in states.items()
+            ]
+            rows = self._upsert_many(
+                inserts,
+                ", ".join(f"{qn(c)} = EXCLUDED.{qn(c)}" for c in ("state_data", "state_hash", "revision")),
+                where=f"{table}.{qn('revision')} < EXCLUDED.{qn('revision')}",
+                model=ResumeState,
+                conflict=("progress_id",),
+                returning=("progress_id",),
+            )
+            return {progress_id for progress_id, in rows}
+        written = set()
+        for progress_id, (state, state_hash, revision) in states.items():
+            values = {"state_data": encode_state(state), "state_hash": state_hash, "revision": revision}
+            qs = ResumeState.objects.using(self.using).filter(pk=progress_id, revision__lt=revision)
+            with transaction.atomic(using=self.using):
+                if qs.update(**values):
+                    written.add(progress_id)
+                    continue
+                try:
+                    with transaction.atomic(using=self.using):
+                        ResumeState.objects.using(self.using).create(progress_id=progress_id, **values)
+                    written.add(progress_id)
+                except IntegrityError:
+                    # Exists at this revision or later, or lost an insert race
+                    if qs.update(**values):
+                        written.add(progress_id)
+        return written
+
+    def state_version(self, user_id: int, challenge_id: int) -> tuple[int, str]:
+        """The stored ``(revision, state_hash)``; ``(0, "")`` if there is none."""
+        from .models import ResumeState
+
+        row = ResumeState.objects.using(self.using).filter(
+            progress__user_id=user_id, progress__challenge_id=challenge_id
+        ).values_list("revision", "state_hash").first()
+        return row or (0, "")
+
+    def stored_state(self, user_id: int, challenge_id: int) -> tuple[int, str, object]:
+        """``state_version`` plus the stored state itself."""
+        from .models import ResumeState
+
+        row = ResumeState.objects.using(self.using).filter(
+            progress__user_id=user_id, progress__challenge_id=challenge_id
+        ).values_list("revision", "state_hash", "state_data").first()
+        if row is None:
+            return 0, "", None
+        revision, state_hash, data = row
+        return revision, state_hash, decode_state(data)
+
+    def mark_saved(self, user_id: int, challenge_id: int) -> None:
+        """Set ``last_saved_ok`` again after an unchanged save.
+
+        Opening a challenge clears the flag; when the stored state is already
+        the latest there is nothing to write but the flag. Only matches a
+        cleared flag, so it is a no-op update otherwise.
+        """
+        from .models import ChallengeProgress
+
+        ChallengeProgress.objects.using(self.using).filter(
+            user_id=user_id, challenge_id=challenge_id, last_saved_ok=False
+        ).update(last_saved_ok=True)
+
+    def save_state(self, user_id: int, challenge_id: int, last_state, *, state_hash: str,
+                   revision: int) -> ProgressWrite:
+        """Store resume state as ``revision``, flag the save ok, and move
+        ATTEMPTED to IN_PROGRESS.
+
+        Skipped (``changed=False``, nothing written) if the stored state
+        already has this revision or a later one.
+        """
+        from django.utils import timezone
+
+        from .models import ChallengeProgress, ProgressEvent
+
+        now = timezone.now()
+        with transaction.atomic(using=self.using):
+            if self._supports_upsert():
+                assignments, params = self._touch_sql()
+                progress_id, status, previous_status, completed_at = self._upsert_many(
+                    [self._insert_values(user_id, challenge_id, now, status=ChallengeProgress.Status.IN_PROGRESS)],
+                    assignments,
+                    extra_params=params,
+                    returning=("id", "status", "previous_status", "completed_at"),
+                )[0]
+            else:
+                progress_id, status, previous_status = self._touch_fallback(user_id, challenge_id, now)
+                completed_at = ChallengeProgress.objects.using(self.using).filter(
+                    pk=progress_id
+                ).values_list("completed_at", flat=True).get()
+            if not self._write_states({progress_id: (last_state, state_hash, revision)}):
+                transaction.set_rollback(True, using=self.using)
+                return ProgressWrite(status=status, changed=False)
+            stats.apply({challenge_id: stats.transition(previous_status, status)}, using=self.using)
+            progress_changed(user_id)
+            events.record(user_id, challenge_id, ProgressEvent.Kind.SAVED, revision=revision, at=now, using=self.using)
+        return ProgressWrite(status=status, changed=True, completed_at=_as_datetime(completed_at))
+
+    def save_states(self, entries: Iterable[tuple[int, int, object, str, int]]) -> int:
+        """``save_state`` for many ``(user_id, challenge_id, last_state,
+        state_hash, revision)`` at once.
+
+        Two multi-row upserts where supported: progress rows, then states.
+        The highest revision per key wins. Returns the number of states
+        written.
+        """
+        from django.utils import timezone
+
+        from .models import ChallengeProgress, ProgressEvent
+
+        latest: dict[tuple[int, int], tuple] = {}
+        for user_id, challenge_id, state, state_hash, revision in entries:
+            key = (user_id, challenge_id)
+            if key not in latest or latest[key][2] < revision:
+                latest[key] = (state, state_hash, revision)
+        if not latest:
+            return 0
+        now = timezone.now()
+        with transaction.atomic(using=self.using):
+            if self._supports_upsert():
+                assignments, params = self._touch_sql()
+                rows = self._upsert_many(
+                    [
+                        self._insert_values(user_id, challenge_id, now, status=ChallengeProgress.Status.IN_PROGRESS)
+                        for user_id, challenge_id in latest
+                    ],
+                    assignments,
+                    extra_params=params,
+                    returning=("id", "user_id", "challenge_id", "status", "previous_status"),
+                )
+                touched = {(user_id, challenge_id): (pk, *change) for pk, user_id, challenge_id, *change in rows}
+            else:
+                touched = {key: self._touch_fallback(*key, now) for key in latest}
+            progress_ids = {key: pk for key, (pk, _, _) in touched.items()}
+            deltas = {}
+            for (_, challenge_id), (_, status, previous_status) in touched.items():
+                deltas.setdefault(challenge_id, Counter()).update(stats.transition(previous_status, status))
+            stats.apply(deltas, using=self.using)
+            written = self._write_states({progress_ids[key]: value for key, value in latest.items()})
+            for user_id in {user_id for user_id, _ in latest}:
+                progress_changed(user_id)
+            events.record_many(
+                [
+                    (*key, ProgressEvent.Kind.SAVED, value[2])
+                    for key, value in latest.items() if progress_ids[key] in written
+                ],
+                at=now, using=self.using,
+            )
+        return len(written)
+
+    def _session_read(self, user_id: int, challenge_id: int) -> tuple:
+        """``(progress_id, status, last_saved_ok, state_data, state_hash,
+        revision, is_favorite)`` in one query; the progress and state
+        columns are None when there is no progress row yet."""
+        from .models import ChallengeProgress, Favorite, ResumeState
+
+        qn = self.connection.ops.quote_name
+        progress = qn(ChallengeProgress._meta.db_table)
+        state = qn(ResumeState._meta.db_table)
+        favorite = qn(Favorite._meta.db_table)
+        sql = (
+            f"SELECT p.{qn('id')}, p.{qn('status')}, p.{qn('last_saved_ok')}, "
+            f"s.{qn('state_data')}, s.{qn('state_hash')}, s.{qn('revision')}, "
+            f"EXISTS (SELECT 1 FROM {favorite} f WHERE f.{qn('user_id')} = %s AND f.{qn('challenge_id')} = %s) "
+            f"FROM (SELECT 1 AS one) AS {qn('session')} "
+            f"LEFT JOIN {progress} p ON p.{qn('user_id')} = %s AND p.{qn('challenge_id')} = %s "
+            f"LEFT JOIN {state} s ON s.{qn('progress_id')} = p.{qn('id')}"
+        )
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, [user_id, challenge_id, user_id, challenge_id])
+            return cursor.fetchone()
+
+    def open_session(self, user_id: int, challenge_id: int, *, readonly: bool = False) -> ChallengeSession:
+        """Load a user's progress, resume state and favorite flag for a
+        challenge, and record that it was opened.
+
+        One read, then at most one conditional write. Opening creates the
+        progress row (ATTEMPTED when read-only). Opening for work moves
+        ATTEMPTED/UNSOLVED to IN_PROGRESS and clears ``last_saved_ok``
+        until the first autosave lands, so an abandoned session shows the
+        unsaved warning next time. Already-open rows aren't rewritten.
+        """
+        from django.utils import timezone
+
+        from .models import ChallengeProgress, ProgressEvent
+
+        S = ChallengeProgress.Status
+        progress_id, status, saved_ok, state_data, state_hash, revision, is_favorite = self._session_read(
+            user_id, challenge_id
+        )
+        session = ChallengeSession(
+            status=status or S.ATTEMPTED,
+            unsaved=progress_id is not None and not saved_ok and status != S.COMPLETED,
+            is_favorite=bool(is_favorite),
+            state_data=state_data,
+            state_hash=state_hash or "",
+            revision=revision or 0,
+        )
+        if readonly:
+            if progress_id is None and self._create_attempted(user_id, challenge_id):
+                progress_changed(user_id)
+                events.record(user_id, challenge_id, ProgressEvent.Kind.ATTEMPTED, using=self.using)
+            return session
+        reopenable = (S.ATTEMPTED, S.UNSOLVED)
+        if progress_id is not None and status not in reopenable and not saved_ok:
+            return session
+        now = timezone.now()
+        with transaction.atomic(using=self.using):
+            row = self._reopen(user_id, challenge_id, now)
+            if row is not None:
+                stats.apply({challenge_id: stats.transition(row[2], row[0])}, using=self.using)
+        if row is not None and row[0] != row[2]:
+            progress_changed(user_id)
+            if row[0] == S.IN_PROGRESS:
+                events.record(user_id, challenge_id, ProgressEvent.Kind.IN_PROGRESS, at=now, using=self.using)
+            return replace(session, status=row[0])
+        return session
+
+    def _reopen(self, user_id: int, challenge_id: int, now) -> tuple | None:
+        from .models import ChallengeProgress
+
+        S = ChallengeProgress.Status
+        reopenable = (S.ATTEMPTED, S.UNSOLVED)
+        if self._supports_upsert():
+            qn = self.connection.ops.quote_name
+            table = qn(ChallengeProgress._meta.db_table)
+            return self._upsert(
+                self._insert_values(user_id, challenge_id, now, status=S.IN_PROGRESS, last_saved_ok=False),
+                f"{qn('status')} = CASE WHEN {table}.{qn('status')} IN (%s, %s) THEN %s ELSE {table}.{qn('status')} END, "
+                f"{qn('last_saved_ok')} = EXCLUDED.{qn('last_saved_ok')}, "
+                f"{qn('updated_at')} = EXCLUDED.{qn('updated_at')}",
+                where=f"{table}.{qn('status')} IN (%s, %s) OR {table}.{qn('last_saved_ok')}",
+                extra_params=[*reopenable, S.IN_PROGRESS, *reopenable],
+            )
+        return self._fallback(
+            user_id, challenge_id,
+            create={"status": S.IN_PROGRESS, "last_saved_ok": False},
+            update={
+                "status": Case(When(status__in=reopenable, then=Value(S.IN_PROGRESS)), default=F("status")),
+                "last_saved_ok": False,
+                "updated_at": now,
+            },
+            guard=Q(status__in=reopenable) | Q(last_saved_ok=True),
+        )
+
+    def _create_attempted(self, user_id: int, challenge_id: int) -> bool:
+        """Insert an ATTEMPTED row unless one exists; True if this call did."""
+        from django.db import IntegrityError
+        from django.utils import timezone
+
+        from .models import ChallengeProgress
+
+        S = ChallengeProgress.Status
+        with transaction.atomic(using=self.using):
+            if self._supports_upsert():
+                created = bool(self._upsert_many(
+                    [self._insert_values(user_id, challenge_id, timezone.now())], "", returning=("id",)
+                ))
+            else:
+                try:
+                    with transaction.atomic(using=self.using):
+                        ChallengeProgress.objects.using(self.using).bulk_create(
+                            [ChallengeProgress(user_id=user_id, challenge_id=challenge_id, status=S.ATTEMPTED)]
+                        )
+                    created = True
+                except IntegrityError:
+                    created = False
+            if created:
+                stats.apply({challenge_id: stats.transition("", S.ATTEMPTED)}, using=self.using)
+        return created
+
+    def mark_in_progress(self, user_id: int, challenge_id: int) -> ProgressWrite:
+        """Move to IN_PROGRESS unless already there or COMPLETED."""
+        from django.utils import timezone
+
+        from .models import ChallengeProgress, ProgressEvent
+
+        S = ChallengeProgress.Status
+        now = timezone.now()
+        with transaction.atomic(using=self.using):
+            if self._supports_upsert():
+                qn = self.connection.ops.quote_name
+                status = f"{qn(ChallengeProgress._meta.db_table)}.{qn('status')}"
+                row = self._upsert(
+                    self._insert_values(user_id, challenge_id, now, status=S.IN_PROGRESS),
+                    f"{qn('status')} = EXCLUDED.{qn('status')}, {qn('updated_at')} = EXCLUDED.{qn('updated_at')}",
+                    where=f"{status} NOT IN (%s, %s)",
+                    extra_params=[S.IN_PROGRESS, S.COMPLETED],
+                )
+            else:
+                row = self._fallback(
+                    user_id, challenge_id,
+                    create={"status": S.IN_PROGRESS},
+                    update={"status": S.IN_PROGRESS, "updated_at": now},
+                    guard=~Q(status__in=[S.IN_PROGRESS, S.COMPLETED]),
+                )
+            if row is not None:
+                stats.apply({challenge_id: stats.transition(row[2], row[0])}, using=self.using)
+        if row is None:
+            # Guard skipped the write: the row is already IN_PROGRESS or COMPLETED
+            status = ChallengeProgress.objects.using(self.using).filter(
+                user_id=user_id, challenge_id=challenge_id
+            ).values_list("status", flat=True).get()
+            return ProgressWrite(status=status, changed=False)
+        progress_changed(user_id)
+        events.record(user_id, challenge_id, ProgressEvent.Kind.IN_PROGRESS, at=now, using=self.using)
+        return ProgressWrite(status=row[0], changed=True, completed_at=row[1])
+
+    def complete(self, user_id: int, challenge_id: int, points: int, username: str) -> ProgressWrite:
+        """Mark COMPLETED and credit the score, at most once per user and challenge.
+
+        The guard on the upsert makes concurrent calls race safely: only
+        the call that actually flips the row gets a row back and awards
+        points.
+        """
+        from django.utils import timezone
+
+        from .leaderboard import publish_score
+        from .models import ChallengeProgress, ProgressEvent, UserScore
+
+        S = ChallengeProgress.Status
+        now = timezone.now()
+        with transaction.atomic(using=self.using):
+            if self._supports_upsert():
+                qn = self.connection.ops.quote_name
+                table = qn(ChallengeProgress._meta.db_table)
+                row = self._upsert(
+                    self._insert_values(user_id, challenge_id, now, status=S.COMPLETED, completed_at=now),
+                    f"{qn('status')} = EXCLUDED.{qn('status')}, "
+                    f"{qn('completed_at')} = COALESCE({table}.{qn('completed_at')}, EXCLUDED.{qn('completed_at')}), "
+                    f"{qn('updated_at')} = EXCLUDED.{qn('updated_at')}",
+                    where=f"{table}.{qn('status')} <> %s",
+                    extra_params=[S.COMPLETED],
+                )
+            else:
+                row = self._fallback(
+                    user_id, challenge_id,
+                    create={"status": S.COMPLETED, "completed_at": now},
+                    update={"status": S.COMPLETED, "completed_at": Coalesce("completed_at", Value(now)), "updated_at": now},
+                    guard=~Q(status=S.COMPLETED),
+                )
+            if row is None:
+                return ProgressWrite(status=S.COMPLETED, changed=False)
+            completed_at = row[1] or now
+            stats.apply({challenge_id: stats.transition(row[2], S.COMPLETED, row[3], completed_at)}, using=self.using)
+            trends.record(challenge_id, completed_at, using=self.using)
+            score = UserScore.record_completion(user_id, points, completed_at)
+            transaction.on_commit(lambda: publish_score(score.user_id, username, score.points), using=self.using)
+            progress_changed(user_id)
+            events.record(user_id, challenge_id, ProgressEvent.Kind.COMPLETED, at=now, using=self.using)
+        return ProgressWrite(status=S.COMPLETED, changed=True, completed_at=completed_at)
+
+
+progress_repository = ProgressRepository()
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import SafeString, mark_safe
+
+from .catalog import Catalog, ChallengeSnapshot, get_catalog
+
+logger = logging.getLogger(__name__)
+
+# Postgres text search configuration used for the tsvector column and queries.
+SEARCH_CONFIG = "english"
+
+# Field weights: title matches outrank category matches outrank body matches.
+FIELD_WEIGHTS = {"title": 3.0, "category": 2.0, "description": 1.0}
+
+# Minimum trigram similarity for a misspelled term to match a known word.
+TRIGRAM_THRESHOLD = 0.3
+MAX_EXPANSIONS = 5
+
+SNIPPET_CHARS = 160
+SUGGEST_LIMIT = 8
+
+# Sentinels marking matches in raw snippets; replaced with <mark> after escaping.
+_START, _STOP = "\x02", "\x03"
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def trigrams(token: str) -> set[str]:
+    """pg_trgm-style trigrams: the word padded with two leading and one trailing space."""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _render_snippet(raw: str) -> SafeString:
+    return mark_safe(escape(raw).replace(_START, "<mark>").replace(_STOP, "</mark>"))
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    challenge: ChallengeSnapshot
+    score: float
+    snippet: SafeString
+
+
+class MemorySearchIndex:
+    """Inverted index over a catalog snapshot, with trigram lookup for typos.
+
+    Built once per catalog version; queries never touch the database.
+    """
+
+    def __init__(self, catalog: Catalog):
+        self.version = catalog.version
+        self.catalog = catalog
+        postings: dict[str, dict[int, float]] = defaultdict(dict)
+        for ch in catalog.challenges:
+            for field, weight in FIELD_WEIGHTS.items():
+                text = ch.category.name if field == "category" else getattr(ch, field)
+                for token, tf in Counter(tokenize(text)).items():
+                    postings[token][ch.id] = postings[token].get(ch.id, 0.0) + weight * (1 + math.log(tf))
+        total = max(len(catalog.challenges), 1)
+        self.idf = {token: math.log(1 + total / len(docs)) for token, docs in postings.items()}
+        self.postings = dict(postings)
+        self.vocabulary = sorted(self.postings)
+        self.trigram_index: dict[str, set[str]] = defaultdict(set)
+        for token in self.vocabulary:
+            for gram in trigrams(token):
+                self.trigram_index[gram].add(token)
+
+    def expand(self, term: str, prefix: bool = False) -> list[tuple[str, float]]:
+        """Indexed words a query term matches, each with a similarity in (0, 1]."""
+        if term in self.postings and not prefix:
+            return [(term, 1.0)]
+        matches: dict[str, float] = {}
+        if prefix:
+            start = bisect.bisect_left(self.vocabulary, term)
+            for token in self.vocabulary[start:]:
+                if not token.startswith(term):
+                    break
+                matches[token] = 1.0 if token == term else 0.9
+        if not matches:
+            grams = trigrams(term)
+            shared = Counter(t for gram in grams for t in self.trigram_index.get(gram, ()))
+            for token, common in shared.items():
+                similarity = common / (len(grams) + len(trigrams(token)) - common)
+                if similarity >= TRIGRAM_THRESHOLD:
+                    matches[token] = similarity
+        best = sorted(matches.items(), key=lambda item: (-item[1], item[0]))
+        return best[:MAX_EXPANSIONS]
+
+    def score(self, query: str, prefix: bool = False) -> tuple[dict[int, float], set[str]]:
+        """Scores for challenges matching every term, and the words that matched."""
+        terms = tokenize(query)
+        if not terms:
+            return {}, set()
+        scores: dict[int, float] | None = None
+        matched: set[str] = set()
+        for i, term in enumerate(terms):
+            term_scores: dict[int, float] = {}
+            for token, similarity in self.expand(term, prefix=prefix and i == len(terms) - 1):
+                matched.add(token)
+                idf = self.idf[token]
+                for cid, weight in self.postings[token].items():
+                    term_scores[cid] = max(term_scores.get(cid, 0.0), similarity * idf * weight)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {cid: s + term_scores[cid] for cid, s in scores.items() if cid in term_scores}
+            if not scores:
+                return {}, matched
+        return scores, matched
+
+    def search(self, query: str, limit: int | None = None) -> list[SearchHit]:
+        scores, matched = self.score(query)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [
+            SearchHit(self.catalog.by_id[cid], score, self.snippet(self.catalog.by_id[cid], matched))
+            for cid, score in ranked
+        ]
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_LIMIT) -> list[ChallengeSnapshot]:
+        scores, _ = self.score(prefix, prefix=True)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [self.catalog.by_id[cid] for cid, _ in ranked]
+
+    @staticmethod
+    def snippet(ch: ChallengeSnapshot, words: set[str]) -> SafeString:
+        """A window of the description around the first match, matches marked."""
+        text = ch.description or ch.title
+        spans = [m.span() for m in _TOKEN_RE.finditer(text) if m.group().casefold() in words]
+        start = 0
+        if spans and len(text) > SNIPPET_CHARS:
+            start = max(0, min(spans[0][0] - SNIPPET_CHARS // 4, len(text) - SNIPPET_CHARS))
+        end = min(len(text), start + SNIPPET_CHARS)
+        parts, pos = [], start
+        for s, e in spans:
+            if s < start or e > end:
+                continue
+            parts += [text[pos:s], _START, text[s:e], _STOP]
+            pos = e
+        parts.append(text[pos:end])
+        raw = "".join(parts)
+        if start > 0:
+            raw = "…" + raw
+        if end < len(text):
+            raw += "…"
+        return _render_snippet(raw)
+
+
+_index: MemorySearchIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_memory_index() -> MemorySearchIndex:
+    """The index for the current catalog snapshot, rebuilt when it changes."""
+    global _index
+    catalog = get_catalog()
+    index = _index
+    if index is not None and index.catalog is catalog:
+        return index
+    with _index_lock:
+        if _index is None or _index.catalog is not catalog:
+            _index = MemorySearchIndex(catalog)
+        return _index
+
+
+class PostgresSearchBackend:
+    """Ranked search over ``Challenge.search_vector`` (GIN-indexed tsvector).
+
+    Hits are mapped back onto catalog snapshots. Queries with no lexeme
+    match (usually typos) fall back to the in-memory trigram index.
+    """
+
+    def search(self, query: str, limit: int | None = None) -> list[SearchHit]:
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+        from django.db.models import F
+
+        from .models import Challenge
+
+        catalog = get_catalog()
+        ts_query = SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+        rows = (
+            Challenge.objects.filter(is_active=True, search_vector=ts_query)
+            .annotate(
+                rank=SearchRank(F("search_vector"), ts_query),
+                headline=SearchHeadline(
+                    "description", ts_query, config=SEARCH_CONFIG,
+                    start_sel=_START, stop_sel=_STOP, max_words=30, min_words=12,
+                ),
+            )
+            .order_by("-rank", "id")
+            .values_list("id", "rank", "headline")[:limit]
+        )
+        hits = [
+            SearchHit(catalog.by_id[cid], rank, _render_snippet(headline or ""))
+            for cid, rank, headline in rows
+            if cid in catalog.by_id
+        ]
+        return hits or get_memory_index().search(query, limit)
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_LIMIT) -> list[ChallengeSnapshot]:
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        from django.db.models import F
+
+        from .models import Challenge
+
+        terms = tokenize(prefix)
+        if not terms:
+            return []
+        catalog = get_catalog()
+        # Every term must match; the last one may be a partial word
+        raw = " & ".join([*terms[:-1], f"{terms[-1]}:*"])
+        ts_query = SearchQuery(raw, config=SEARCH_CONFIG, search_type="raw")
+        ids = (
+            Challenge.objects.filter(is_active=True, search_vector=ts_query)
+            .annotate(rank=SearchRank(F("search_vector"), ts_query))
+            .order_by("-rank", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        return [catalog.by_id[cid] for cid in ids if cid in catalog.by_id]
+
+
+class MemorySearchBackend:
+    def search(self, query: str, limit: int | None = None) -> list[SearchHit]:
+        return get_memory_index().search(query, limit)
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_LIMIT) -> list[ChallengeSnapshot]:
+        return get_memory_index().suggest(prefix, limit)
+
+
+def get_search_backend():
+    """Postgres full-text search when available, the in-memory index otherwise."""
+    if connection.vendor == "postgresql":
+        return PostgresSearchBackend()
+    return MemorySearchBackend()
+
+
+def refresh_search_vectors(challenge_ids=None, category_id=None) -> None:
+    """Recompute ``search_vector`` for the given challenges (all if none given).
+
+    A no-op off Postgres, where the column is unused.
+    """
+    if connection.vendor != "postgresql":
+        return
+    from django.contrib.postgres.search import SearchVector
+    from django.db.models import OuterRef, Subquery
+
+    from .models import Category, Challenge
+
+    qs = Challenge.objects.all()
+    if challenge_ids is not None:
+        qs = qs.filter(pk__in=challenge_ids)
+    if category_id is not None:
+        qs = qs.filter(category_id=category_id)
+    category_name = Subquery(Category.objects.filter(pk=OuterRef("category_id")).values("name")[:1])
+    qs.update(
+        search_vector=(
+            SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector(category_name, weight="B", config=SEARCH_CONFIG)
+            + SearchVector("description", weight="C", config=SEARCH_CONFIG)
+        )
+    )
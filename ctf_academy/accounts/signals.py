@@ -1,12 +1,188 @@
 # accounts/signals.py
-from django.db.models.signals import post_save
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .catalog import bump_version
+from .leaderboard import publish_score, withdraw_user
+from .progress import progress_changed
+from .search import refresh_search_vectors
+from . import stats, trends
+from .models import Category, Challenge, ChallengeProgress, ChallengeStats, Favorite, UserProfile, UserScore
+
+# Fields whose change moves a user on (or off) the leaderboard.
+LEADERBOARD_FIELDS = {"username", "is_active"}
+
+# ChallengeProgress fields the ChallengeStats rollup and completion buckets
+# depend on.
+STATS_FIELDS = ("status", "started_at", "completed_at")
 
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
-    else:
-        instance.profile.save()
+        return
+    # Only a profile already loaded on this user can carry unsaved edits;
+    # don't fetch one just to write it back unchanged.
+    if User.profile.related.is_cached(instance):
+        instance.profile.save_dirty()
+
+
+@receiver(post_save, sender=User)
+def sync_leaderboard_membership(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save with update_fields=["last_login"]; nothing to do for those.
+    if update_fields is not None and not LEADERBOARD_FIELDS.intersection(update_fields):
+        return
+    if not instance.is_active:
+        transaction.on_commit(lambda: withdraw_user(instance.pk))
+        return
+    points = 0
+    if not created:
+        points = UserScore.objects.filter(user_id=instance.pk).values_list("points", flat=True).first() or 0
+    user_id, username = instance.pk, instance.username
+    transaction.on_commit(lambda: publish_score(user_id, username, points))
+
+
+@receiver(post_delete, sender=User)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: withdraw_user(user_id))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Challenge)
+@receiver(post_delete, sender=Challenge)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(bump_version)
+
+
+@receiver(post_save, sender=Challenge)
+def index_challenge(sender, instance, **kwargs):
+    challenge_id = instance.pk
+    transaction.on_commit(lambda: refresh_search_vectors(challenge_ids=[challenge_id]))
+
+
+@receiver(post_save, sender=Challenge)
+def create_challenge_stats(sender, instance, created, raw=False, **kwargs):
+    # Writers then only ever UPDATE the row
+    if created and not raw:
+        ChallengeStats.objects.get_or_create(challenge=instance)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created, **kwargs):
+    if created:
+        return
+    category_id = instance.pk
+    transaction.on_commit(lambda: refresh_search_vectors(category_id=category_id))
+
+
+@receiver(post_save, sender=ChallengeProgress)
+@receiver(post_delete, sender=ChallengeProgress)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def invalidate_progress_summary(sender, instance, **kwargs):
+    progress_changed(instance.user_id)
+
+
+# The progress repository writes with raw SQL (no signals) and adjusts
+# ChallengeStats, the completion buckets and UserScore itself; these cover
+# ORM saves, such as the admin, and deletes.
+@receiver(pre_save, sender=ChallengeProgress)
+def remember_progress_stats(sender, instance, update_fields=None, **kwargs):
+    instance._stats_before = None
+    if instance.pk is None or (update_fields is not None and not set(STATS_FIELDS).intersection(update_fields)):
+        return
+    instance._stats_before = (
+        ChallengeProgress.objects.filter(pk=instance.pk).values_list(*STATS_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=ChallengeProgress)
+def update_stats_for_progress(sender, instance, created, **kwargs):
+    before = getattr(instance, "_stats_before", None)
+    if not created and before is None:
+        return
+    delta = stats.contribution(instance.status, instance.started_at, instance.completed_at)
+    if before is not None:
+        delta.subtract(stats.contribution(*before))
+    stats.apply({instance.challenge_id: delta})
+
+
+@receiver(post_delete, sender=ChallengeProgress)
+def remove_progress_from_stats(sender, instance, **kwargs):
+    delta = stats.contribution(instance.status, instance.started_at, instance.completed_at)
+    stats.apply({instance.challenge_id: Counter({field: -n for field, n in delta.items()})}, create=False)
+
+
+def _completed_at(status, completed_at):
+    return completed_at if status == ChallengeProgress.Status.COMPLETED else None
+
+
+@receiver(post_save, sender=ChallengeProgress)
+def update_trends_for_progress(sender, instance, created, **kwargs):
+    before = getattr(instance, "_stats_before", None)
+    if not created and before is None:
+        return
+    was = _completed_at(before[0], before[2]) if before else None
+    now = _completed_at(instance.status, instance.completed_at)
+    if was == now:
+        return
+    if was is not None:
+        trends.record(instance.challenge_id, was, -1)
+    if now is not None:
+        trends.record(instance.challenge_id, now)
+
+
+@receiver(post_delete, sender=ChallengeProgress)
+def remove_progress_from_trends(sender, instance, **kwargs):
+    completed_at = _completed_at(instance.status, instance.completed_at)
+    if completed_at is not None:
+        trends.record(instance.challenge_id, completed_at, -1)
+
+
+def _solve(status, completed_at):
+    """What a progress row adds to its user's UserScore: nothing, or one
+    solve at ``completed_at``."""
+    return (completed_at,) if status == ChallengeProgress.Status.COMPLETED else None
+
+
+def _rescore(user_id):
+    score = UserScore.recompute(user_id)
+    username = User.objects.filter(pk=user_id, is_active=True).values_list("username", flat=True).first()
+    if username is not None:
+        points = score.points if score else 0
+        transaction.on_commit(lambda: publish_score(user_id, username, points))
+
+
+@receiver(post_save, sender=ChallengeProgress)
+def update_score_for_progress(sender, instance, created, **kwargs):
+    before = getattr(instance, "_stats_before", None)
+    if not created and before is None:
+        return
+    was = _solve(before[0], before[2]) if before else None
+    if was != _solve(instance.status, instance.completed_at):
+        _rescore(instance.user_id)
+
+
+@receiver(post_delete, sender=ChallengeProgress)
+def remove_progress_from_score(sender, instance, origin=None, **kwargs):
+    # Deleting the user removes the score row too
+    if isinstance(origin, User) or getattr(origin, "model", None) is User:
+        return
+    if _solve(instance.status, instance.completed_at):
+        _rescore(instance.user_id)
+
+
+@receiver(post_save, sender=Favorite)
+def count_favorite(sender, instance, created, **kwargs):
+    if created:
+        stats.apply({instance.challenge_id: Counter(favorites=1)})
+
+
+@receiver(post_delete, sender=Favorite)
+def uncount_favorite(sender, instance, **kwargs):
+    stats.apply({instance.challenge_id: Counter(favorites=-1)}, create=False)
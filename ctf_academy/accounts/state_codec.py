@@ -0,0 +1,134 @@
+"""Storage format for challenge resume state (``ResumeState.state_data``).
+
+A stored state is a one-byte format version, a one-byte codec id, and the
+state's canonical JSON compressed by that codec. Decoding goes by the id in
+the header, so rows written with an older default codec stay readable.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import zlib
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+FORMAT_VERSION = 1
+
+DEFAULT_MAX_BYTES = 256 * 1024
+
+
+class StateFormatError(ValueError):
+    """Stored state bytes are truncated, of an unknown version or codec."""
+
+
+class StateTooLarge(ValueError):
+    def __init__(self, size: int, limit: int):
+        super().__init__(f"State is {size} bytes; the limit is {limit}")
+        self.size = size
+        self.limit = limit
+
+
+class StateCodec:
+    """Compression for stored state. ``codec_id`` is written into every
+    row, so it must never be reused for a different codec."""
+    codec_id: int
+    name: str
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class RawCodec(StateCodec):
+    codec_id = 0
+    name = "raw"
+
+    def compress(self, data):
+        return data
+
+    def decompress(self, data):
+        return data
+
+
+class ZlibCodec(StateCodec):
+    codec_id = 1
+    name = "zlib"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+_codecs: dict[int, StateCodec] = {}
+
+
+def register_codec(codec: StateCodec) -> None:
+    existing = _codecs.get(codec.codec_id)
+    if existing is not None and existing.name != codec.name:
+        raise ValueError(f"Codec id {codec.codec_id} is already used by {existing.name!r}")
+    _codecs[codec.codec_id] = codec
+
+
+register_codec(RawCodec())
+register_codec(ZlibCodec())
+
+
+def get_codec() -> StateCodec:
+    """The codec new states are written with: ``PROGRESS_STATE_CODEC`` is a
+    registered name or the dotted path of a StateCodec subclass."""
+    name = getattr(settings, "PROGRESS_STATE_CODEC", "zlib")
+    for codec in _codecs.values():
+        if codec.name == name:
+            return codec
+    codec = import_string(name)()
+    register_codec(codec)
+    return codec
+
+
+def dumps(state) -> bytes:
+    """Canonical JSON: sorted keys, no whitespace. Hashes and size limits
+    are measured on this encoding."""
+    return json.dumps(state, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def state_digest(state) -> str:
+    """sha256 of the state's canonical JSON.
+
+    challenge.js hashes the same encoding, so either side can tell an
+    unchanged state without comparing bodies.
+    """
+    return hashlib.sha256(dumps(state)).hexdigest()
+
+
+def encode_state(state, codec: StateCodec | None = None) -> bytes | None:
+    if state is None:
+        return None
+    codec = codec or get_codec()
+    return bytes((FORMAT_VERSION, codec.codec_id)) + codec.compress(dumps(state))
+
+
+def decode_state(data):
+    if data is None:
+        return None
+    data = bytes(data)  # psycopg2 returns memoryview for bytea
+    if len(data) < 2 or data[0] != FORMAT_VERSION:
+        raise StateFormatError("Unrecognised state format")
+    codec = _codecs.get(data[1])
+    if codec is None:
+        raise StateFormatError(f"Unknown state codec id {data[1]}")
+    return json.loads(codec.decompress(data[2:]))
+
+
+def state_limit(challenge) -> int:
+    """Maximum canonical JSON size of a saved state for ``challenge``."""
+    return getattr(challenge, "max_state_bytes", None) or getattr(
+        settings, "PROGRESS_STATE_MAX_BYTES", DEFAULT_MAX_BYTES
+    )
@@ -582,10 +582,91 @@ document.addEventListener("DOMContentLoaded", () => {
                 const text = editor ? editor.value : null;
                 return { text };
             }
+            // Patches address `text` as lines (as autosave.save_patch does), so
+            // an edit only carries the lines it changed; the saved shape is unchanged
+            function patchView(state){
+                return state && typeof state.text === 'string' ? { ...state, text: state.text.split('\n') } : state;
+            }
+            // Revision and hash of the state the server holds; saves are based
+            // on the revision, and a state matching the hash isn't re-sent
+            let revision = parseInt(area.getAttribute('data-state-revision'), 10) || 0;
+            let stateHash = area.getAttribute('data-state-hash') || null;
+            let stale = false;
+            // The state the server holds at `revision` (patch base), and the last
+            // state sent, in case its response was lost
+            let baseState = null;
+            let forceSnapshot = false;
+            let lastSent = null;
+            let sizeWarned = false;
+            // Same encoding as state_codec.state_digest: sorted keys, no whitespace
+            function canonicalJSON(value){
+                if(Array.isArray(value)) return '[' + value.map(canonicalJSON).join(',') + ']';
+                if(value && typeof value === 'object'){
+                    return '{' + Object.keys(value).sort()
+                        .map(k => JSON.stringify(k) + ':' + canonicalJSON(value[k])).join(',') + '}';
+                }
+                return JSON.stringify(value === undefined ? null : value);
+            }
+            async function digestState(state){
+                if(!(window.crypto && crypto.subtle)) return null;  // insecure context: server hashes
+                const bytes = new TextEncoder().encode(canonicalJSON(state));
+                const hash = await crypto.subtle.digest('SHA-256', bytes);
+                return Array.from(new Uint8Array(hash)).map(b => b.toString(16).padStart(2, '0')).join('');
+            }
+            function escapePointer(key){
+                return String(key).replace(/~/g, '~0').replace(/\//g, '~1');
+            }
+            function sameJSON(a, b){
+                return a === b || (typeof a === 'object' && typeof b === 'object' && canonicalJSON(a) === canonicalJSON(b));
+            }
+            // RFC 6902 operations turning `a` into `b`. Arrays keep their common
+            // head and tail, so editing a few lines patches only those lines.
+            function diffState(a, b, path = '', ops = []){
+                if(sameJSON(a, b)) return ops;
+                if(Array.isArray(a) && Array.isArray(b)){
+                    let start = 0;
+                    while(start < a.length && start < b.length && sameJSON(a[start], b[start])) start++;
+                    let endA = a.length, endB = b.length;
+                    while(endA > start && endB > start && sameJSON(a[endA - 1], b[endB - 1])){ endA--; endB--; }
+                    const common = Math.min(endA, endB) - start;
+                    for(let i = start; i < start + common; i++) diffState(a[i], b[i], path + '/' + i, ops);
+                    for(let i = endA - 1; i >= start + common; i--) ops.push({ op: 'remove', path: path + '/' + i });
+                    for(let i = start + common; i < endB; i++) ops.push({ op: 'add', path: path + '/' + i, value: b[i] });
+                    return ops;
+                }
+                const isObject = v => v !== null && typeof v === 'object' && !Array.isArray(v);
+                if(isObject(a) && isObject(b)){
+                    for(const k of Object.keys(a)){
+                        if(!(k in b)) ops.push({ op: 'remove', path: path + '/' + escapePointer(k) });
+                    }
+                    for(const k of Object.keys(b)){
+                        const p = path + '/' + escapePointer(k);
+                        if(k in a) diffState(a[k], b[k], p, ops);
+                        else ops.push({ op: 'add', path: p, value: b[k] });
+                    }
+                    return ops;
+                }
+                ops.push({ op: 'replace', path, value: b });
+                return ops;
+            }
+            function saveBody(state, hash, extra = {}){
+                const snapshot = JSON.stringify({ last_state: state, state_hash: hash, base_revision: revision, ...extra });
+                if(baseState === null || forceSnapshot) return snapshot;
+                const patch = JSON.stringify({ patch: diffState(patchView(baseState), patchView(state)), state_hash: hash, base_revision: revision, ...extra });
+                return patch.length < snapshot.length ? patch : snapshot;
+            }
             async function saveOnce(){
+                if(stale) return;
                 try{
-                    const body = JSON.stringify({ last_state: collectState() });
-                    await fetch(saveUrl, {
+                    const state = collectState();
+                    const hash = await digestState(state);
+                    // The first save goes out even when unchanged: opening the
+                    // challenge cleared the server's saved flag and this sets it again
+                    if(hash && hash === stateHash && baseState !== null) return;
+                    const body = saveBody(state, hash);
+                    const previous = lastSent;
+                    lastSent = { state, hash };
+                    const res = await fetch(saveUrl, {
                         method: 'POST',
                         headers: {
                             'Content-Type': 'application/json',
@@ -594,6 +675,29 @@ document.addEventListener("DOMContentLoaded", () => {
                         },
                         body
                     });
+                    const data = await res.json().catch(() => null);
+                    if(res.ok && data){
+                        revision = data.revision;
+                        stateHash = data.state_hash;
+                        baseState = state;
+                        forceSnapshot = false;
+                    }else if(res.status === 413){
+                        // Over the challenge's size limit; keep trying in case it shrinks
+                        if(!sizeWarned) alert((data && data.message) || 'Your work is too large to save.');
+                        sizeWarned = true;
+                    }else if(res.status === 422){
+                        // Patch didn't apply on the server; send the whole state next time
+                        forceSnapshot = true;
+                    }else if(res.status === 409 && data && previous && data.state_hash === previous.hash){
+                        // The server has our previous save; only its response was lost
+                        revision = data.revision;
+                        stateHash = data.state_hash;
+                        baseState = previous.state;
+                    }else if(res.status === 409){
+                        // Another window saved a newer state; stop rather than overwrite it
+                        stale = true;
+                        alert((data && data.message) || 'This challenge was saved from another window.');
+                    }
                 }catch(e){
                     // ignore
                 }
@@ -602,8 +706,10 @@ document.addEventListener("DOMContentLoaded", () => {
             const interval = setInterval(saveOnce, 15000);
             window.addEventListener('beforeunload', () => {
                 clearInterval(interval);
+                if(stale) return;
                 if(navigator.sendBeacon){
-                    const data = new Blob([JSON.stringify({ last_state: collectState() })], {type:'application/json'});
+                    // final: the server writes this one through instead of buffering it
+                    const data = new Blob([saveBody(collectState(), null, { final: true })], {type:'application/json'});
                     navigator.sendBeacon(saveUrl, data);
                 }else{
                     saveOnce();
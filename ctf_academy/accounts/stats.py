@@ -0,0 +1,159 @@
+"""ChallengeStats rollup: per-challenge status counts, favorites and solve times.
+
+Writers describe what a change did to a challenge's numbers as a delta
+(``{field: change}``) and ``apply`` adds it to the stats row inside their
+own transaction. ``expected`` recomputes the numbers from the raw tables
+for ``rebuild_challenge_stats``.
+"""
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+STAT_FIELDS = ("attempted", "in_progress", "completed", "unsolved", "favorites", "solve_seconds", "solve_count")
+
+
+def solve_seconds(started_at, completed_at) -> int | None:
+    if started_at is None or completed_at is None:
+        return None
+    return int((completed_at - started_at).total_seconds())
+
+
+def contribution(status: str, started_at=None, completed_at=None) -> Counter:
+    """What one progress row adds to its challenge's stats."""
+    from .models import ChallengeProgress
+
+    counts = Counter()
+    if status:
+        counts[status] += 1
+    if status == ChallengeProgress.Status.COMPLETED:
+        seconds = solve_seconds(started_at, completed_at)
+        if seconds is not None:
+            counts["solve_seconds"] += seconds
+            counts["solve_count"] += 1
+    return counts
+
+
+def transition(previous: str, status: str, started_at=None, completed_at=None) -> Counter:
+    """Delta for a repository write that moved a row from ``previous``
+    ("" for an insert) to ``status``. Repository writes never leave
+    COMPLETED, so only the new status can carry a solve time."""
+    if previous == status:
+        return Counter()
+    delta = contribution(status, started_at, completed_at)
+    delta.subtract(contribution(previous))
+    return delta
+
+
+def apply(deltas: dict[int, Counter], *, create: bool = True, using: str = "default") -> None:
+    """Add ``{challenge_id: delta}`` to the stats rows.
+
+    Rows are updated in challenge id order, so concurrent writers touching
+    several challenges lock them in the same order. A missing row is
+    created unless ``create`` is False (deletes, which may be cascading
+    from the challenge itself).
+    """
+    from django.utils import timezone
+
+    from .models import ChallengeStats
+
+    now = timezone.now()
+    for challenge_id in sorted(deltas):
+        delta = {field: n for field, n in deltas[challenge_id].items() if n}
+        if not delta:
+            continue
+        qs = ChallengeStats.objects.using(using).filter(challenge_id=challenge_id)
+        changes = {field: F(field) + n for field, n in delta.items()}
+        if qs.update(**changes, updated_at=now) or not create:
+            continue
+        try:
+            with transaction.atomic(using=using):
+                ChallengeStats.objects.using(using).create(challenge_id=challenge_id, **delta)
+        except IntegrityError:
+            # Another writer created it first
+            qs.update(**changes, updated_at=now)
+
+
+def expected(challenge_ids=None) -> dict[int, Counter]:
+    """Stats recomputed from ChallengeProgress and Favorite, for every
+    challenge with either (or just ``challenge_ids``)."""
+    from .models import ChallengeProgress, Favorite
+
+    progress = ChallengeProgress.objects.all()
+    favorites = Favorite.objects.all()
+    if challenge_ids is not None:
+        progress = progress.filter(challenge_id__in=challenge_ids)
+        favorites = favorites.filter(challenge_id__in=challenge_ids)
+    totals: dict[int, Counter] = defaultdict(Counter)
+    for row in progress.values("challenge_id", "status").annotate(n=Count("id")).order_by():
+        totals[row["challenge_id"]][row["status"]] += row["n"]
+    # Solve times row by row, rounded exactly as the writers round them
+    completed = progress.filter(status=ChallengeProgress.Status.COMPLETED).values_list(
+        "challenge_id", "started_at", "completed_at"
+    )
+    for challenge_id, started_at, completed_at in completed.iterator(chunk_size=2000):
+        seconds = solve_seconds(started_at, completed_at)
+        if seconds is not None:
+            totals[challenge_id]["solve_seconds"] += seconds
+            totals[challenge_id]["solve_count"] += 1
+    for row in favorites.values("challenge_id").annotate(n=Count("id")).order_by():
+        totals[row["challenge_id"]]["favorites"] += row["n"]
+    return totals
+
+
+def stored(challenge_ids=None) -> dict[int, Counter]:
+    from .models import ChallengeStats
+
+    rows = ChallengeStats.objects.all()
+    if challenge_ids is not None:
+        rows = rows.filter(challenge_id__in=challenge_ids)
+    return {
+        row["challenge_id"]: Counter({field: row[field] for field in STAT_FIELDS if row[field]})
+        for row in rows.values("challenge_id", *STAT_FIELDS)
+    }
+
+
+def _differs(a: Counter, b: Counter) -> bool:
+    return any(a[field] != b[field] for field in STAT_FIELDS)
+
+
+def verify() -> list[int]:
+    """Ids of challenges whose stored stats don't match the raw tables.
+
+    Reads without locks, so a challenge written to during the check may be
+    reported; ``rebuild`` rechecks each one under its row lock.
+    """
+    want, have = expected(), stored()
+    return sorted(cid for cid in want.keys() | have.keys() if _differs(want.get(cid, Counter()), have.get(cid, Counter())))
+
+
+def rebuild(challenge_ids) -> int:
+    """Recompute the given challenges' stats; returns how many were wrong.
+
+    Each challenge is fixed in its own transaction with the stats row
+    locked first. Writers adjust the row in their own transaction, so any
+    change committed before the lock is in the recount and any later one
+    waits and applies its delta on top.
+    """
+    from .models import Challenge, ChallengeStats
+
+    fixed = 0
+    existing = set(Challenge.objects.filter(id__in=challenge_ids).values_list("id", flat=True))
+    for challenge_id in sorted(challenge_ids):
+        with transaction.atomic():
+            if challenge_id in existing:
+                ChallengeStats.objects.get_or_create(challenge_id=challenge_id)
+            row = ChallengeStats.objects.select_for_update().filter(challenge_id=challenge_id).first()
+            want = expected([challenge_id]).get(challenge_id, Counter())
+            if row is None:
+                continue
+            have = Counter({field: getattr(row, field) for field in STAT_FIELDS})
+            if not _differs(want, have):
+                continue
+            for field in STAT_FIELDS:
+                setattr(row, field, want[field])
+            row.save()
+            fixed += 1
+    return fixed
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Iterable
+
+from django.utils import timezone
+
+
+def local_date(value) -> date:
+    """Calendar date of a timestamp in the active time zone."""
+    return timezone.localtime(value).date()
+
+
+def effective_streak(current: int, last_active: date | None, today: date | None = None) -> int:
+    """Stored streak, or 0 once a full day has passed without a solve.
+
+    This is the read-time expiry: the stored value is only reset by the
+    next completion, so readers must not trust it past yesterday.
+    """
+    if not current or last_active is None:
+        return 0
+    today = today or local_date(timezone.now())
+    return current if last_active >= today - timedelta(days=1) else 0
+
+
+def compute_streak_state(days: Iterable[date]) -> tuple[int, int, date | None]:
+    """Return ``(current, longest, last_active)`` for a set of active days.
+
+    ``current`` is the run ending on the last active day; apply
+    ``effective_streak`` to get the value as of today.
+    """
+    current = longest = 0
+    previous = None
+    for day in sorted(set(days)):
+        current = current + 1 if previous == day - timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest, previous
+
+
+def streak_states_from_history(user_ids=None) -> dict[int, tuple[int, int, date | None]]:
+    """Recompute ``compute_streak_state`` for every user (or those in
+    ``user_ids``) from ``completed_at``."""
+    from collections import defaultdict
+
+    from .models import ChallengeProgress
+
+    days = defaultdict(set)
+    rows = ChallengeProgress.objects.filter(
+        status=ChallengeProgress.Status.COMPLETED, completed_at__isnull=False
+    ).values_list("user_id", "completed_at")
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    for user_id, completed_at in rows.iterator(chunk_size=2000):
+        days[user_id].add(local_date(completed_at))
+    return {user_id: compute_streak_state(d) for user_id, d in days.items()}
@@ -0,0 +1,197 @@
+"""Batched progress sync: ordered operations applied in one transaction.
+
+A batch is a list of operations, each an object with a client-chosen
+idempotency ``key``, an ``op`` and the ``challenge`` id (or ``slug``):
+
+- ``save_state``: ``last_state``, or ``patch`` with ``base_revision``; the
+  optional fields are those of save_progress
+- ``set_status``: ``status`` of ``in_progress`` or ``completed``
+- ``favorite``: ``favorite`` true or false
+
+Operations apply in order. If one fails the whole batch rolls back and
+nothing is recorded. Each applied operation leaves a SyncReceipt, so when
+a client retries a batch, operations it already applied return their
+stored result instead of running again.
+"""
+from __future__ import annotations
+
+import logging
+
+from django.db import IntegrityError, transaction
+
+from . import autosave
+from .catalog import find_challenge
+from .json_patch import JsonPatchError
+from .progress import progress_repository
+from .state_codec import StateTooLarge, state_limit
+
+logger = logging.getLogger(__name__)
+
+MAX_OPERATIONS = 100
+MAX_KEY_LENGTH = 64
+
+SAVE_STATE = "save_state"
+SET_STATUS = "set_status"
+FAVORITE = "favorite"
+
+
+class SyncError(Exception):
+    """An operation was rejected; ``index`` and ``key`` identify it."""
+
+    def __init__(self, message: str, *, code: str, status: int = 400, data: dict | None = None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status = status
+        self.data = data or {}
+        self.index: int | None = None
+        self.key: str | None = None
+
+
+def _challenge(operation: dict):
+    slug, challenge_id = operation.get("slug"), operation.get("challenge")
+    if isinstance(slug, str) and slug:
+        return find_challenge(slug=slug)
+    if type(challenge_id) is int:
+        return find_challenge(id=challenge_id)
+    return None
+
+
+def _parse(operations) -> list[tuple[str, str, object, dict]]:
+    """Validate the batch up front: ``(key, op, challenge, operation)`` each."""
+    if not isinstance(operations, list) or not operations:
+        raise SyncError("operations must be a non-empty list.", code="invalid_batch")
+    if len(operations) > MAX_OPERATIONS:
+        raise SyncError(f"A batch may have at most {MAX_OPERATIONS} operations.", code="batch_too_large")
+    parsed, seen = [], set()
+    for index, operation in enumerate(operations):
+        try:
+            if not isinstance(operation, dict):
+                raise SyncError("Each operation must be an object.", code="invalid_operation")
+            key = operation.get("key")
+            if not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH:
+                raise SyncError(f"key must be a string of 1 to {MAX_KEY_LENGTH} characters.", code="invalid_key")
+            if key in seen:
+                raise SyncError("Duplicate key in batch.", code="duplicate_key")
+            seen.add(key)
+            name = operation.get("op")
+            if name not in _HANDLERS:
+                raise SyncError(f"Unknown op: {name!r}.", code="unknown_op")
+            challenge = _challenge(operation)
+            if challenge is None:
+                raise SyncError("Challenge not found.", code="challenge_not_found", status=404)
+        except SyncError as e:
+            e.index, e.key = index, operation.get("key") if isinstance(operation, dict) else None
+            raise
+        parsed.append((key, name, challenge, operation))
+    return parsed
+
+
+def _save_state(user, challenge, operation: dict) -> dict:
+    base_revision = operation.get("base_revision")
+    if base_revision is not None and (type(base_revision) is not int or base_revision < 0):
+        raise SyncError("base_revision must be a non-negative integer.", code="invalid_base_revision")
+    state_hash = operation.get("state_hash")
+    state_hash = state_hash if isinstance(state_hash, str) else None
+    try:
+        if "patch" in operation:
+            if base_revision is None:
+                raise SyncError("A patch requires base_revision.", code="invalid_base_revision")
+            result = autosave.save_patch(
+                user.id, challenge.id, operation["patch"], base_revision=base_revision,
+                state_hash=state_hash, final=True, max_bytes=state_limit(challenge),
+            )
+        else:
+            result = autosave.save(
+                user.id, challenge.id, operation.get("last_state"), base_revision=base_revision,
+                state_hash=state_hash, final=True, max_bytes=state_limit(challenge),
+            )
+    except JsonPatchError as e:
+        raise SyncError(f"Patch rejected: {e}", code="patch_rejected", status=422, data={"snapshot_required": True})
+    except StateTooLarge as e:
+        raise SyncError(str(e), code="state_too_large", status=413, data={"limit": e.limit})
+    if result.outcome == autosave.CONFLICT:
+        raise SyncError(
+            "This challenge was saved from another window.", code="conflict", status=409,
+            data={"revision": result.revision, "state_hash": result.state_hash},
+        )
+    return {
+        "unchanged": result.outcome == autosave.UNCHANGED,
+        "revision": result.revision,
+        "state_hash": result.state_hash,
+    }
+
+
+def _set_status(user, challenge, operation: dict) -> dict:
+    status = operation.get("status")
+    if status == "in_progress":
+        result = progress_repository.mark_in_progress(user.id, challenge.id)
+        return {"status": result.status}
+    if status == "completed":
+        result = progress_repository.complete(user.id, challenge.id, challenge.points, user.username)
+        return {"status": result.status, "points_awarded": challenge.points if result.changed else 0}
+    raise SyncError("status must be in_progress or completed.", code="invalid_status")
+
+
+def _favorite(user, challenge, operation: dict) -> dict:
+    from .models import Favorite
+
+    value = operation.get("favorite")
+    if not isinstance(value, bool):
+        raise SyncError("favorite must be true or false.", code="invalid_favorite")
+    if value:
+        Favorite.objects.get_or_create(user_id=user.id, challenge_id=challenge.id)
+    else:
+        Favorite.objects.filter(user_id=user.id, challenge_id=challenge.id).delete()
+    return {"favorite": value}
+
+
+_HANDLERS = {
+    SAVE_STATE: _save_state,
+    SET_STATUS: _set_status,
+    FAVORITE: _favorite,
+}
+
+
+def _apply(user, parsed) -> list[dict]:
+    from .models import SyncReceipt
+
+    receipts = dict(
+        SyncReceipt.objects.filter(user_id=user.id, key__in=[key for key, *_ in parsed]).values_list("key", "result")
+    )
+    results, applied = [], []
+    for index, (key, name, challenge, operation) in enumerate(parsed):
+        if key in receipts:
+            results.append({**receipts[key], "replayed": True})
+            continue
+        try:
+            result = {"key": key, "op": name, "challenge": challenge.id, **_HANDLERS[name](user, challenge, operation)}
+        except SyncError as e:
+            e.index, e.key = index, key
+            raise
+        results.append(result)
+        applied.append(SyncReceipt(user_id=user.id, key=key, result=result))
+    SyncReceipt.objects.bulk_create(applied)
+    return results
+
+
+def apply_batch(user, operations) -> list[dict]:
+    """Apply ``operations`` for ``user`` atomically; one result per operation.
+
+    Raises ``SyncError`` for the first operation that is invalid or fails,
+    after rolling back the ones before it.
+    """
+    parsed = _parse(operations)
+    # Saves here write through to the database inside the transaction; get
+    # states still in the write-behind buffer there first, so a rolled-back
+    # batch can't take them with it
+    autosave.persist_pending(user.id, {challenge.id for _, name, challenge, _ in parsed if name == SAVE_STATE})
+    try:
+        with transaction.atomic():
+            return _apply(user, parsed)
+    except IntegrityError:
+        # A concurrent retry of this batch committed its receipts first;
+        # applying again now replays them
+        logger.info("Sync receipts for user %s raced; replaying", user.id)
+        with transaction.atomic():
+            return _apply(user, parsed)
@@ -0,0 +1,18 @@
+from django import template
+
+from accounts.avatars import DEFAULT_AVATAR_SIZE, avatar_url as build_avatar_url
+from accounts.models import UserProfile
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar_url(user, size=DEFAULT_AVATAR_SIZE):
+    """Avatar thumbnail URL for ``user`` without loading the image bytes.
+
+    Usage: ``{% avatar_url user 64 %}``. Falls back to the default image.
+    """
+    image_hash = None
+    if getattr(user, "is_authenticated", False):
+        image_hash = UserProfile.objects.filter(user_id=user.id).values_list("image_hash", flat=True).first()
+    return build_avatar_url(getattr(user, "id", None), image_hash, size)
@@ -1,3 +1,103 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from . import autosave
+from .models import Category, Challenge, ChallengeProgress, UserProfile
+from .progress import progress_repository
+
+PASSWORD = "correct-horse-battery"
+
+
+def profile_updates(queries):
+    table = UserProfile._meta.db_table
+    return [q["sql"] for q in queries if q["sql"].startswith("UPDATE") and table in q["sql"]]
+
+
+# Run requests on the test thread so their queries are counted.
+@override_settings(REQUEST_TIMEOUT_SECONDS=0, AVATAR_WORKERS=0)
+class ProfileWriteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", "alice@example.com", PASSWORD)
+        self.form = {
+            "first_name": "", "last_name": "", "username": "alice",
+            "email": "alice@example.com", "bio": "",
+        }
+
+    def test_profile_tracks_dirty_fields(self):
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.get_dirty_fields(), [])
+        profile.bio = "hello"
+        self.assertEqual(profile.get_dirty_fields(), ["bio"])
+        with self.assertNumQueries(1):
+            self.assertTrue(profile.save_dirty())
+        with self.assertNumQueries(0):
+            self.assertFalse(profile.save_dirty())
+
+    def test_user_save_does_not_touch_profile(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = "Alice"
+        # The user UPDATE plus the leaderboard points lookup.
+        with self.assertNumQueries(2):
+            user.save()
+
+    def test_user_save_persists_loaded_profile_edits(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.profile.bio = "set through the user"
+        with CaptureQueriesContext(connection) as ctx:
+            user.save()
+        updates = profile_updates(ctx.captured_queries)
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn("image_hash", updates[0])
+        self.assertEqual(UserProfile.objects.get(user=user).bio, "set through the user")
+
+        with CaptureQueriesContext(connection) as ctx:
+            user.save()
+        self.assertEqual(profile_updates(ctx.captured_queries), [])
+
+    def test_login_query_count(self):
+        # Authenticate, create the session, update last_login, cycle the session key.
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                reverse("login_page"), {"username": "alice", "password": PASSWORD}
+            )
+        self.assertEqual(response.status_code, 302)
+
+    def test_profile_edit_query_count(self):
+        self.client.login(username="alice", password=PASSWORD)
+        url = reverse("profile_page")
+
+        # Name change: the user row is written, the profile row is not.
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(url, dict(self.form, first_name="Alice"))
+        self.assertEqual(len(ctx.captured_queries), 5)
+        self.assertEqual(profile_updates(ctx.captured_queries), [])
+
+        # Bio change: one narrow profile UPDATE on top of that.
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(url, dict(self.form, first_name="Alice", bio="Hi there"))
+        self.assertEqual(len(ctx.captured_queries), 6)
+        self.assertEqual(len(profile_updates(ctx.captured_queries)), 1)
+
+        # Resubmitting the same form writes nothing.
+        with self.assertNumQueries(3):
+            self.client.post(url, dict(self.form, first_name="Alice", bio="Hi there"))
+
+
+@override_settings(AUTOSAVE_MODE="write_through")
+class AutosaveFlagTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("bob", "bob@example.com", PASSWORD)
+        category = Category.objects.create(name="Web", slug="web")
+        self.challenge = Challenge.objects.create(category=category, title="Intro", points=10)
+
+    def test_unchanged_save_clears_unsaved_flag(self):
+        user_id, challenge_id = self.user.id, self.challenge.id
+        autosave.save(user_id, challenge_id, {"text": "hi"})
+        self.assertFalse(progress_repository.open_session(user_id, challenge_id).unsaved)
+        result = autosave.save(user_id, challenge_id, {"text": "hi"}, final=True)
+        self.assertEqual(result.outcome, autosave.UNCHANGED)
+        self.assertTrue(ChallengeProgress.objects.get(user=self.user, challenge=self.challenge).last_saved_ok)
+        self.assertFalse(progress_repository.open_session(user_id, challenge_id).unsaved)
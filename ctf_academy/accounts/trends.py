@@ -0,0 +1,132 @@
+"""Completion trends, from the DailyCompletion and HourlyCompletion buckets.
+
+``record`` adds a completion to its buckets as it happens. ``series`` reads
+a window back as a dense list with a zero for every empty bucket. A window
+costs one indexed range scan over at most buckets x challenges rows, so a
+year of history costs the same whatever the size of ChallengeProgress.
+
+Days are calendar days in TIME_ZONE; hours are UTC hours, so consecutive
+buckets are always an hour apart.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+DAY = "day"
+HOUR = "hour"
+
+# Longest window, in buckets, series() will build
+MAX_POINTS = {DAY: 2 * 366, HOUR: 31 * 24}
+
+PRUNE_BATCH_SIZE = 5000
+
+
+def hourly_retention_days() -> int:
+    """Days of hourly buckets kept; 0 turns hourly buckets off."""
+    return getattr(settings, "COMPLETION_HOURLY_RETENTION_DAYS", 30)
+
+
+def day_of(at: datetime) -> date:
+    return timezone.localtime(at, timezone.get_default_timezone()).date()
+
+
+def hour_of(at: datetime) -> datetime:
+    return at.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _bucket(bucket: str):
+    """``(model, field, step)`` for a bucket size."""
+    from .models import DailyCompletion, HourlyCompletion
+
+    if bucket == DAY:
+        return DailyCompletion, "day", timedelta(days=1)
+    if bucket == HOUR:
+        return HourlyCompletion, "hour", timedelta(hours=1)
+    raise ValueError(f"Unknown bucket: {bucket!r}")
+
+
+def _bump(model, field: str, key, challenge_id: int, delta: int, using: str) -> None:
+    from .models import Challenge
+
+    qs = model.objects.using(using).filter(**{field: key}, challenge_id=challenge_id)
+    if qs.update(count=F("count") + delta) or delta < 0:
+        return
+    category_id = Challenge.objects.using(using).filter(pk=challenge_id).values_list("category_id", flat=True).first()
+    if category_id is None:
+        return
+    try:
+        with transaction.atomic(using=using):
+            model.objects.using(using).create(
+                **{field: key}, challenge_id=challenge_id, category_id=category_id, count=delta
+            )
+    except IntegrityError:
+        # Another completion created the bucket first
+        qs.update(count=F("count") + delta)
+
+
+def record(challenge_id: int, at: datetime, delta: int = 1, *, using: str = "default") -> None:
+    """Add ``delta`` completions of ``challenge_id`` at ``at`` to its
+    buckets; a negative ``delta`` takes completions back."""
+    for bucket, key in ((DAY, day_of(at)), (HOUR, hour_of(at))):
+        if bucket == HOUR and hourly_retention_days() <= 0:
+            continue
+        model, field, _ = _bucket(bucket)
+        _bump(model, field, key, challenge_id, delta, using)
+
+
+def series(
+    start,
+    end,
+    *,
+    bucket: str = DAY,
+    challenge_id: int | None = None,
+    category_id: int | None = None,
+) -> list[tuple[date | datetime, int]]:
+    """Completions per bucket from ``start`` to ``end`` inclusive, zero-filled.
+
+    ``start`` and ``end`` are dates for DAY and datetimes for HOUR (rounded
+    down to the hour). Raises ValueError for an empty window or one longer
+    than MAX_POINTS buckets.
+    """
+    model, field, step = _bucket(bucket)
+    if bucket == HOUR:
+        start, end = hour_of(start), hour_of(end)
+    points = (end - start) // step + 1
+    if points <= 0:
+        raise ValueError("The window ends before it starts.")
+    if points > MAX_POINTS[bucket]:
+        raise ValueError(f"A {bucket} series can have at most {MAX_POINTS[bucket]} points.")
+    qs = model.objects.filter(**{f"{field}__range": (start, end)})
+    if challenge_id is not None:
+        qs = qs.filter(challenge_id=challenge_id)
+    if category_id is not None:
+        qs = qs.filter(category_id=category_id)
+    counts = dict(qs.values_list(field).annotate(n=Sum("count")).order_by())
+    return [(start + step * i, counts.get(start + step * i, 0)) for i in range(points)]
+
+
+def last_days(days: int, **filters) -> list[tuple[date, int]]:
+    """Daily series for the ``days`` days ending today."""
+    today = day_of(timezone.now())
+    return series(today - timedelta(days=days - 1), today, **filters)
+
+
+def prune_hourly(before: datetime, *, batch_size: int = PRUNE_BATCH_SIZE) -> int:
+    """Delete hourly buckets older than ``before`` in batches of
+    ``batch_size`` rows. Returns the number deleted."""
+    from .models import HourlyCompletion
+
+    deleted = 0
+    while True:
+        ids = list(
+            HourlyCompletion.objects.filter(hour__lt=before)
+            .order_by("id").values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += HourlyCompletion.objects.filter(id__in=ids).delete()[0]
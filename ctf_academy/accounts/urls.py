@@ -9,10 +9,16 @@ from .views import (
     enter_user_view,
     exit_user_view,
     profile_page,
+    avatar_image,
     MyTokenObtainPairView,
     challenges_page,
     challenge_detail,
     leaderboards_page,
+    leaderboard_api,
+    search_api,
+    progress_summary_api,
+    progress_sync_api,
+    search_suggest_api,
     completed_challenges_page,
     incomplete_challenges_page,
     save_progress,
@@ -32,7 +38,11 @@ from .views import (
     admin_user_progress,
     admin_challenge_analytics,
     admin_category_stats,
+    admin_completion_trend,
     admin_export_data,
+    admin_export_jobs,
+    admin_export_job_status,
+    admin_export_job_download,
 )
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -51,13 +61,19 @@ urlpatterns = [
     path("about/", about_page, name="about_page"),
     
     path("profile/", profile_page, name="profile_page"),
+    path("avatars/<int:user_id>/<int:size>/", avatar_image, name="avatar_image"),
 
     # CHALLENGES
     path("challenges/", challenges_page, name="challenges_page"),
     path("leaderboards/", leaderboards_page, name="leaderboards_page"),
+    path("api/leaderboard/", leaderboard_api, name="leaderboard_api"),
+    path("api/search/", search_api, name="search_api"),
+    path("api/search/suggest/", search_suggest_api, name="search_suggest_api"),
     path("challenges/completed/", completed_challenges_page, name="completed_challenges_page"),
     path("challenges/incomplete/", incomplete_challenges_page, name="incomplete_challenges_page"),
     path("challenges/progress/save/<int:challenge_id>/", save_progress, name="save_progress"),
+    path("api/progress/summary/", progress_summary_api, name="progress_summary_api"),
+    path("api/progress/sync/", progress_sync_api, name="progress_sync_api"),
     path("challenges/status/update/<int:challenge_id>/", update_challenge_status, name="update_challenge_status"),
     path("challenges/<slug:slug>/", challenge_detail, name="challenge_detail"),
     path("favorites/", favorites_page, name="favorites_page"),
@@ -86,5 +102,9 @@ urlpatterns = [
     # Analytics (View Only)
     path("api/admin/challenges/<int:challenge_id>/analytics/", admin_challenge_analytics, name="admin_challenge_analytics"),
     path("api/admin/category-stats/", admin_category_stats, name="admin_category_stats"),
+    path("api/admin/completion-trend/", admin_completion_trend, name="admin_completion_trend"),
     path("api/admin/export/", admin_export_data, name="admin_export_data"),
+    path("api/admin/exports/", admin_export_jobs, name="admin_export_jobs"),
+    path("api/admin/exports/<uuid:job_id>/", admin_export_job_status, name="admin_export_job_status"),
+    path("api/admin/exports/<uuid:job_id>/download/", admin_export_job_download, name="admin_export_job_download"),
 ]
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""Per-user stats for the admin user screens, a keyset page at a time.
+
+Users are listed newest first on ``(date_joined, id)``. A page is one
+query: points and solves come from UserScore and favorites from a
+correlated count, so the cost doesn't grow with the page size or the
+number of users before the cursor.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime
+
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(date_joined: datetime, user_id: int) -> str:
+    """Opaque keyset cursor for the (date_joined desc, id desc) ordering."""
+    return urlsafe_base64_encode(json.dumps([date_joined.isoformat(), user_id]).encode())
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of ``encode_cursor``; raises ValueError on malformed input."""
+    try:
+        joined, user_id = json.loads(urlsafe_base64_decode(cursor))
+        date_joined = parse_datetime(joined)
+    except Exception as exc:
+        raise ValueError("Invalid cursor.") from exc
+    if date_joined is None or not isinstance(user_id, int):
+        raise ValueError("Invalid cursor.")
+    return date_joined, user_id
+
+
+def search(users, query: str):
+    """Users whose username, email or name contains ``query``."""
+    if not query:
+        return users
+    return users.filter(
+        Q(username__icontains=query) | Q(email__icontains=query)
+        | Q(first_name__icontains=query) | Q(last_name__icontains=query)
+    )
+
+
+def with_stats(users):
+    """Annotate ``points``, ``completed_count`` and ``favorite_count``."""
+    from .models import Favorite
+
+    favorites = (
+        Favorite.objects.filter(user_id=OuterRef("pk"))
+        .order_by().values("user_id").annotate(n=Count("id")).values("n")
+    )
+    return users.annotate(
+        points=Coalesce("score__points", 0),
+        completed_count=Coalesce("score__solved_count", 0),
+        favorite_count=Coalesce(Subquery(favorites, output_field=IntegerField()), 0),
+    )
+
+
+def keyset_page(users, *, after: str | None = None, before: str | None = None, limit: int = PAGE_SIZE):
+    """One page of ``users`` (with stats) strictly after or before a cursor.
+
+    Returns ``(users, meta)``; ``meta`` has the ``prev`` and ``next``
+    cursors and ``has_prev`` and ``has_next`` flags.
+    """
+    users = with_stats(users)
+    if before:
+        date_joined, user_id = decode_cursor(before)
+        users = users.filter(Q(date_joined__gt=date_joined) | Q(date_joined=date_joined, id__gt=user_id))
+        page = list(users.order_by("date_joined", "id")[:limit + 1])
+        more, page = len(page) > limit, page[:limit][::-1]
+        has_prev, has_next = more, True
+    else:
+        if after:
+            date_joined, user_id = decode_cursor(after)
+            users = users.filter(Q(date_joined__lt=date_joined) | Q(date_joined=date_joined, id__lt=user_id))
+        page = list(users.order_by("-date_joined", "-id")[:limit + 1])
+        more, page = len(page) > limit, page[:limit]
+        has_prev, has_next = bool(after), more
+    if not page:
+        return [], {"prev": None, "next": None, "has_prev": bool(after), "has_next": bool(before)}
+    first, last = page[0], page[-1]
+    return page, {
+        "prev": encode_cursor(first.date_joined, first.id),
+        "next": encode_cursor(last.date_joined, last.id),
+        "has_prev": has_prev,
+        "has_next": has_next,
+    }
@@ -9,15 +9,30 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from .models import Challenge, Category, UserProfile, Favorite, ChallengeProgress
+from .models import Challenge, Category, UserProfile, Favorite, ChallengeProgress, ChallengeStats, UserScore, AvatarThumbnail, ExportJob
+from django.db import transaction
 from django.db.models import Sum, Q, Case, When, IntegerField
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, JsonResponse, FileResponse, HttpResponseBadRequest, Http404, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+import os
 import traceback
+from urllib.parse import urlencode
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 
 # --- ADDED IMPORTS FOR JWT AND API PROTECTION ---
 from .serializers import MyTokenObtainPairSerializer
+from . import autosave, avatars, export_jobs, exports, leaderboard, sync, trends, user_stats
+from .catalog import DIFFICULTY_ORDER, find_challenge, get_catalog
+from .json_patch import JsonPatchError
+from .state_codec import StateTooLarge, state_limit
+from .progress import get_progress_summary, progress_changed, progress_repository
+from .search import SUGGEST_LIMIT, get_search_backend
+from .api import error_response, success_response
+from .blobs import get_blob_store
+from .leaderboard import get_leaderboard_store
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import IsAuthenticated
 
@@ -28,9 +43,7 @@ import json
 
 
 from django.db.models import Count, Sum, Q
-from django.db.models.functions import TruncDate
 from datetime import timedelta
-from django.core.paginator import Paginator
 from django.utils import timezone
 
 
@@ -225,38 +238,59 @@ def profile_page(request):
             changes_made = True
 
         # --- Handle image update (base64 or file upload) ---
+        # Raw bytes are validated here and re-encoded by the avatar pipeline;
+        # the original upload itself is never stored.
         import base64
+        image_bytes = None
         if base64_image:
             try:
-                profile.set_base64_image(base64_image)
-                changes_made = True
+                image_bytes = base64.b64decode(base64_image)
+                avatars.validate_upload(image_bytes)
+            except avatars.AvatarUploadError as e:
+                messages.error(request, str(e))
+                return redirect("profile_page")
             except Exception as e:
                 messages.error(request, f"Error saving base64 image: {e}")
                 return redirect("profile_page")
 
         elif image_file:
+            max_bytes = settings.AVATAR_MAX_UPLOAD_BYTES
+            if image_file.size > max_bytes:
+                messages.error(request, f"Image is too large (max {max_bytes // (1024 * 1024)} MB).")
+                return redirect("profile_page")
             try:
-                # Convert uploaded file → base64 → binary
-                encoded = base64.b64encode(image_file.read()).decode('utf-8')
-                profile.set_base64_image(encoded)
-                changes_made = True
+                image_bytes = image_file.read()
+                avatars.validate_upload(image_bytes)
+            except avatars.AvatarUploadError as e:
+                messages.error(request, str(e))
+                return redirect("profile_page")
             except Exception as e:
                 messages.error(request, f"Error saving image file: {e}")
                 return redirect("profile_page")
 
         # --- Save changes ---
-        if changes_made:
-            user.save()
-            profile.save()
-            messages.success(request, "Profile updated successfully!")
+        if changes_made or image_bytes:
+            if changes_made:
+                user.save()
+                profile.save_dirty()
+            queued = False
+            if image_bytes:
+                try:
+                    queued = avatars.submit_upload(user.id, image_bytes)
+                except avatars.AvatarUploadError as e:
+                    messages.error(request, str(e))
+                    return redirect("profile_page")
+            if queued:
+                messages.success(request, "Profile updated successfully! Your new picture will appear shortly.")
+            else:
+                messages.success(request, "Profile updated successfully!")
         else:
             messages.info(request, "No changes were made.")
 
         return redirect("profile_page")
 
     # --- Prepare data for rendering ---
-    image_base64 = profile.get_base64_image()
-    image_uri = f"data:image/jpeg;base64,{image_base64}" if image_base64 else None
+    image_uri = avatars.avatar_url(user.id, profile.image_hash, 256) if profile.has_image else None
 
     return render(request, "accounts/profile.html", {
         "user": user,
@@ -265,147 +299,109 @@ def profile_page(request):
     })
 
 
+def _avatar_etag(request, user_id: int, size: int):
+    digest = AvatarThumbnail.objects.filter(
+        profile__user_id=user_id, size=size
+    ).values_list("digest", flat=True).first()
+    return avatars.avatar_etag(digest) if digest else None
+
+
+@login_required
+@cache_control(private=True, max_age=avatars.AVATAR_CACHE_SECONDS)
+@condition(etag_func=_avatar_etag)
+def avatar_image(request, user_id: int, size: int):
+    """Serve a user's avatar thumbnail; conditional GETs get a 304 via the ETag.
+
+    The body is streamed straight from the blob store file, so the server
+    can use sendfile instead of copying bytes through Python.
+    """
+    if size not in avatars.AVATAR_SIZES:
+        raise Http404("Unsupported avatar size.")
+    profile = UserProfile.objects.filter(user_id=user_id).exclude(image_hash="").first()
+    digest = avatars.thumbnail_digest(profile, size) if profile else None
+    fh = get_blob_store().open(digest) if digest else None
+    if fh is None:
+        raise Http404("No avatar.")
+    response = FileResponse(fh, content_type=avatars.AVATAR_CONTENT_TYPE)
+    response["ETag"] = avatars.avatar_etag(digest)
+    return response
+
+
 @login_required
 def challenges_page(request):
     user = request.user
 
-    # --- Basic collections ---
-    categories = Category.objects.all().order_by("name")
-    qs = Challenge.objects.filter(is_active=True).select_related("category")
+    # --- Basic collections (served from the in-process catalog snapshot) ---
+    catalog = get_catalog()
+    categories = catalog.categories
+    challenges = catalog.challenges
 
     # --- Filters from query string ---
     q = request.GET.get("q", "").strip()
     category_slug = request.GET.get("category", "")
     difficulty = request.GET.get("difficulty", "")
-    sort_by = request.GET.get("sort_by", "id")  # default sort by id
+    sort_by = request.GET.get("sort_by", "relevance")  # search rank, or id when not searching
     # Independent filters: status axis and favorites axis
     status_filter = request.GET.get("status", "")  # '', 'completed', 'incomplete'
     favorites_filter = request.GET.get("favorites", "")  # '', '1'
 
     if category_slug:
-        qs = qs.filter(category__slug=category_slug)
+        challenges = [c for c in challenges if c.category.slug == category_slug]
 
     if difficulty:
-        qs = qs.filter(difficulty=difficulty)
+        challenges = [c for c in challenges if c.difficulty == difficulty]
 
+    # --- Full-text search: ranked hits with highlighted snippets ---
+    search_rank = {}
     if q:
-        qs = qs.filter(
-            Q(title__icontains=q) |
-            Q(description__icontains=q) |
-            Q(category__name__icontains=q)
-        )
+        hits = get_search_backend().search(q)
+        search_rank = {hit.challenge.id: i for i, hit in enumerate(hits)}
+        snippets = {hit.challenge.id: hit.snippet for hit in hits}
+        challenges = [
+            c.with_user_state(snippet=snippets[c.id]) for c in challenges if c.id in search_rank
+        ]
 
     # --- Sort mapping ---
-    sort_options = {
-        "id": "id",
-        "points": "-points",
-        "difficulty": "difficulty",
-        "title": "title",
+    sort_keys = {
+        "relevance": lambda c: (search_rank.get(c.id, 0), c.id),
+        "id": lambda c: c.id,
+        "points": lambda c: (-c.points, c.id),
+        "difficulty": lambda c: (DIFFICULTY_ORDER.get(c.difficulty, 4), c.id),
+        "title": lambda c: c.title,
     }
+    challenges = sorted(challenges, key=sort_keys.get(sort_by, sort_keys["relevance"]))
 
-    qs = qs.order_by(sort_options.get(sort_by, "id"))
-
-    if sort_by == "difficulty":
-        qs = qs.annotate(
-            difficulty_order=Case(
-                When(difficulty="easy", then=1),
-                When(difficulty="medium", then=2),
-                When(difficulty="hard", then=3),
-                default=4,
-                output_field=IntegerField()
-            )
-        ).order_by("difficulty_order")
+    # --- Per-user state: statuses and favorites, cached per user ---
+    summary = get_progress_summary(user.id)
 
     # --- Apply status filter BEFORE computing stats (since user expects counts for filtered set) ---
     if status_filter == "completed":
-        completed_ids = ChallengeProgress.objects.filter(
-            user=user, status=ChallengeProgress.Status.COMPLETED
-        ).values_list("challenge_id", flat=True)
-        qs = qs.filter(id__in=completed_ids)
+        challenges = [c for c in challenges if summary.is_completed(c.id)]
     elif status_filter == "incomplete":
         # Incomplete defined as any progress not completed (attempted, in progress, unsolved)
-        incom_ids = ChallengeProgress.objects.filter(
-            user=user,
-        ).exclude(status=ChallengeProgress.Status.COMPLETED).values_list("challenge_id", flat=True)
-        qs = qs.filter(id__in=incom_ids)
+        challenges = [c for c in challenges if summary.is_incomplete(c.id)]
 
     if favorites_filter == "1":
-        fav_ids = Favorite.objects.filter(user=user).values_list("challenge_id", flat=True)
-        qs = qs.filter(id__in=fav_ids)
-
-    # --- Stats: totals & points for current filtered queryset ---
-    total_count = qs.count()
-    points_total = qs.aggregate(total_points=Sum("points"))["total_points"] or 0
-
-    completed_count = 0
-    in_progress_count = 0
-    points_earned = 0
-
-    try:
-        # Check if using legacy model structure (safeguard)
-        if hasattr(Challenge, "completed_by"):
-            completed_qs = qs.filter(completed_by=user)
-            completed_count = completed_qs.count()
-            points_earned = completed_qs.aggregate(points=Sum("points"))["points"] or 0
-
-            challenges = list(qs)
-            completed_ids = set(completed_qs.values_list("id", flat=True))
-            for ch in challenges:
-                ch.is_completed = (ch.id in completed_ids)
-                ch.is_in_progress = False # Legacy model fallback
-                try:
-                    ch.tools_count = len(ch.topology.get("tools", [])) if ch.topology else 0
-                except Exception:
-                    ch.tools_count = 0
-        else:
-            # Standard ChallengeProgress path
-            progress_qs = ChallengeProgress.objects.filter(user=user, challenge__in=qs)
-            completed_count = progress_qs.filter(status=ChallengeProgress.Status.COMPLETED).count()
-            in_progress_count = progress_qs.filter(status=ChallengeProgress.Status.IN_PROGRESS).count()
-            points_earned = progress_qs.filter(status=ChallengeProgress.Status.COMPLETED).aggregate(points=Sum("challenge__points"))["points"] or 0
-
-            challenges = list(qs)
-            prog_map = {p.challenge_id: p.status for p in progress_qs}
-            
-            for ch in challenges:
-                status = prog_map.get(ch.id)
-                ch.is_completed = (status == ChallengeProgress.Status.COMPLETED)
-                ch.is_in_progress = (status == ChallengeProgress.Status.IN_PROGRESS) # <--- Logic Added Here
-                try:
-                    ch.tools_count = len(ch.topology.get("tools", [])) if ch.topology else 0
-                except Exception:
-                    ch.tools_count = 0
+        challenges = [c for c in challenges if c.id in summary.favorites]
 
-    except Exception:
-        # Fallback if DB error occurs
-        completed_count = 0
-        in_progress_count = 0
-        points_earned = 0
-        challenges = list(qs)
-        for ch in challenges:
-            ch.is_completed = False
-            ch.is_in_progress = False
-            try:
-                ch.tools_count = len(ch.topology.get("tools", [])) if ch.topology else 0
-            except Exception:
-                ch.tools_count = 0
-
-    # Favorites for current user
-    try:
-        favorite_ids = set(Favorite.objects.filter(user=user).values_list("challenge_id", flat=True))
-    except Exception:
-        favorite_ids = set()
-
-    for ch in challenges:
-        ch.is_favorite = ch.id in favorite_ids
+    challenges = [
+        c.with_user_state(
+            is_completed=summary.is_completed(c.id),
+            is_in_progress=summary.is_in_progress(c.id),
+            is_favorite=c.id in summary.favorites,
+        )
+        for c in challenges
+    ]
 
+    # --- Stats: totals & points for current filtered set ---
+    counters = summary.counters(challenges)
     stats = {
-        "total": total_count,
-        "points_total": points_total,
-        "completed": completed_count,
-        "in_progress": in_progress_count,
-        "points_earned": points_earned,
-        "categories_count": categories.count(),
+        "total": counters["total"],
+        "points_total": counters["points_total"],
+        "completed": counters["completed"],
+        "in_progress": counters["in_progress"],
+        "points_earned": counters["points_earned"],
+        "categories_count": len(categories),
     }
 
     context = {
@@ -428,102 +424,153 @@ def challenges_page(request):
 def leaderboards_page(request):
     """
     Dynamic leaderboards backed by the existing database.
-    There is no scoring system yet, so everyone is shown with 0 points.
-    Ordering falls back to most recent users first so the page looks alive.
+    Points and solve counts are read from the denormalized UserScore table.
+    Only the podium and one window of rows are rendered; the rest of the
+    board is paged in through ``leaderboard_api``.
     """
-    # Pull active users from DB (Supabase Postgres via Django settings)
-    users_qs = User.objects.filter(is_active=True).order_by("username")
-
-    # Preload progress for all users to compute points from completed challenges
-    from collections import defaultdict
-    from datetime import timedelta
-    
-    progress_rows = ChallengeProgress.objects.filter(status=ChallengeProgress.Status.COMPLETED)
-    points_map = defaultdict(int)
-    completed_count_map = defaultdict(int)
-    completion_dates_map = defaultdict(set)
-
-    for p in progress_rows.select_related("challenge"):
-        points_map[p.user_id] += p.challenge.points
-        completed_count_map[p.user_id] += 1
-        if p.completed_at:
-            local_date = timezone.localtime(p.completed_at).date()
-            completion_dates_map[p.user_id].add(local_date)
-
-    # Calculate streaks
-    streak_map = {}
-    today = timezone.localtime(timezone.now()).date()
-    yesterday = today - timedelta(days=1)
-
-    for user_id, dates in completion_dates_map.items():
-        streak = 0
-        check_date = today
-        
-        if check_date not in dates:
-            if yesterday in dates:
-                check_date = yesterday
-            else:
-                streak_map[user_id] = 0
-                continue
-
-        while check_date in dates:
-            streak += 1
-            check_date -= timedelta(days=1)
-        
-        streak_map[user_id] = streak
-
-    leaders = []
-    for u in users_qs:
-        image_uri = None
-        try:
-            if hasattr(u, "profile"):
-                img_b64 = u.profile.get_base64_image()
-                if img_b64:
-                    image_uri = f"data:image/jpeg;base64,{img_b64}"
-        except Exception:
-            image_uri = None
-
-        leaders.append({
-            "id": u.id,
-            "username": u.username,
-            "points": points_map.get(u.id, 0),
-            "challenges": completed_count_map.get(u.id, 0),
-            "streak": streak_map.get(u.id, 0),
-            "image_uri": image_uri,
-            "date_joined": u.date_joined,
-        })
+    store = get_leaderboard_store()
+    top = leaderboard.rows_for_entries(store.top(3))
+
+    current_user_rank = store.rank(request.user.id)
+    if current_user_rank is not None and current_user_rank > len(top) + leaderboard.PAGE_SIZE:
+        # Deep in the board: show the neighbourhood around the current user
+        window = leaderboard.rows_for_entries(store.around(request.user.id, leaderboard.PAGE_SIZE // 2))
+    elif top:
+        window = leaderboard.keyset_page(
+            after=leaderboard.encode_cursor(top[-1]["points"], top[-1]["id"])
+        )
+    else:
+        window = []
 
-    # Order leaders by points desc then username
-    leaders.sort(key=lambda r: (-r["points"], r["username"]))
-    top = leaders[:3]
-    rest = leaders[3:]
-    start_rank = len(top) + 1
-
-    # Current user's rank (1-based) if present in list
-    current_user_rank = None
-    current_user_stats = None
-    for idx, row in enumerate(leaders, start=1):
-        if row["id"] == request.user.id:
-            current_user_rank = idx
-            current_user_stats = row
-            break
+    # The current user is always inside the podium or the rendered window
+    current_user_stats = next((row for row in top + window if row["id"] == request.user.id), None)
 
     context = {
         "top": top,
-        "leaders": rest,
-        "all_leaders": leaders,  # optional full list if template needs it
+        "leaders": window,
+        "window": leaderboard.window_meta(window),
         "current_user_rank": current_user_rank,
         "current_user_stats": current_user_stats,
-        "start_rank": start_rank,
     }
 
     return render(request, "accounts/leaderboards.html", context)
 
+
+@login_required
+def leaderboard_api(request):
+    """Keyset-paginated leaderboard rows as JSON.
+
+    Query params: ``after`` / ``before`` (cursors from a previous response),
+    ``around=me`` for a window centred on the caller, and ``limit``.
+    """
+    try:
+        limit = min(max(int(request.GET.get("limit", leaderboard.PAGE_SIZE)), 1), leaderboard.MAX_PAGE_SIZE)
+    except ValueError:
+        return error_response("limit must be an integer.", code="invalid_limit")
+
+    try:
+        if request.GET.get("around") == "me":
+            rows = leaderboard.rows_for_entries(
+                get_leaderboard_store().around(request.user.id, limit // 2)
+            )
+        else:
+            rows = leaderboard.keyset_page(
+                after=request.GET.get("after") or None,
+                before=request.GET.get("before") or None,
+                limit=limit,
+            )
+    except ValueError as e:
+        return error_response(str(e), code="invalid_cursor")
+
+    return success_response(rows, meta=leaderboard.window_meta(rows))
+
+
+SEARCH_MAX_QUERY = 200
+SEARCH_MAX_RESULTS = 50
+
+
+@login_required
+def progress_summary_api(request):
+    """The caller's challenge statuses, favorites and catalog-wide counters."""
+    summary = get_progress_summary(request.user.id)
+    catalog = get_catalog()
+    return success_response({
+        "statuses": {str(cid): status for cid, status in summary.statuses.items()},
+        "favorites": sorted(summary.favorites),
+        "counters": summary.counters(catalog.challenges),
+    })
+
+
+@login_required
+def progress_sync_api(request):
+    """Apply an ordered batch of progress operations in one transaction.
+
+    Expected JSON body: { "operations": [ { "key", "op", "challenge", ... }, ... ] }
+    (see accounts.sync for the ops). Returns one result per operation;
+    results for keys applied by an earlier request are replayed, not
+    re-run. If any operation fails nothing is applied, and the error
+    carries its index and key.
+    """
+    if request.method != "POST":
+        return error_response("POST required.", code="method_not_allowed", status_code=405)
+    try:
+        payload = json.loads(request.body.decode("utf-8") or "{}")
+    except ValueError:
+        return error_response("Body must be JSON.", code="invalid_json")
+    operations = payload.get("operations") if isinstance(payload, dict) else None
+    try:
+        results = sync.apply_batch(request.user, operations)
+    except sync.SyncError as e:
+        return error_response(e.message, code=e.code, status_code=e.status, data={"index": e.index, "key": e.key, **e.data})
+    return success_response(results, meta={"count": len(results)})
+
+
+@login_required
+def search_api(request):
+    """Ranked challenge search with highlighted snippets (``q``, ``limit``)."""
+    q = request.GET.get("q", "").strip()[:SEARCH_MAX_QUERY]
+    if not q:
+        return error_response("q is required.", code="missing_query")
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), SEARCH_MAX_RESULTS)
+    except ValueError:
+        return error_response("limit must be an integer.", code="invalid_limit")
+    hits = get_search_backend().search(q, limit)
+    return success_response([
+        {
+            "id": hit.challenge.id,
+            "slug": hit.challenge.slug,
+            "title": hit.challenge.title,
+            "category": hit.challenge.category.name,
+            "difficulty": hit.challenge.difficulty,
+            "points": hit.challenge.points,
+            "url": hit.challenge.get_absolute_url(),
+            "score": round(hit.score, 4),
+            "snippet": hit.snippet,
+        }
+        for hit in hits
+    ], meta={"q": q, "count": len(hits)})
+
+
+@login_required
+def search_suggest_api(request):
+    """Typeahead: challenges whose words start with the typed prefix."""
+    q = request.GET.get("q", "").strip()[:SEARCH_MAX_QUERY]
+    if not q:
+        return success_response([])
+    suggestions = get_search_backend().suggest(q, SUGGEST_LIMIT)
+    return success_response([
+        {"title": c.title, "category": c.category.name, "url": c.get_absolute_url()}
+        for c in suggestions
+    ])
+
 @login_required
 def challenge_detail(request, slug):
     # Fetch the challenge
-    challenge = get_object_or_404(Challenge, slug=slug)
-    categories = Category.objects.all()
+    catalog = get_catalog()
+    # Inactive challenges aren't in the catalog but stay reachable by URL
+    challenge = catalog.get(slug) or get_object_or_404(Challenge.objects.select_related("category"), slug=slug)
+    categories = catalog.categories
 
     # Build initial content for the text editor
     initial_content = f"""Challenge: {challenge.title}
@@ -548,54 +595,21 @@ Type commands in the Terminal window. Use 'help' for generic terminal help.
     from django.utils.safestring import mark_safe
     initial_content = mark_safe(initial_content)
 
-    # Favorite state for this challenge
-    is_favorite = False
-    if request.user.is_authenticated:
-        try:
-            is_favorite = Favorite.objects.filter(user=request.user, challenge=challenge).exists()
-        except Exception:
-            is_favorite = False
-
-    # Pull last progress for resume and detect unsaved warnings
-    progress = None
-    last_state = None
-    unsaved_warning = False
-    try:
-        # Ensure a progress row exists as soon as a challenge is opened
-        progress, created = ChallengeProgress.objects.get_or_create(
-            user=request.user, challenge=challenge,
-            defaults={"status": ChallengeProgress.Status.ATTEMPTED}
-        )
-        last_state = progress.last_state
-        if not progress.last_saved_ok and progress.status != ChallengeProgress.Status.COMPLETED:
-            unsaved_warning = True
-        # When viewing non-readonly, switch to in-progress and pessimistically mark save as not-ok
-        if request.GET.get("readonly") != "1":
-            if progress.status in [ChallengeProgress.Status.ATTEMPTED, ChallengeProgress.Status.UNSOLVED]:
-                progress.status = ChallengeProgress.Status.IN_PROGRESS
-            progress.last_saved_ok = False
-            progress.save(update_fields=["status", "last_saved_ok", "updated_at"])
-    except Exception:
-        pass
-
-    # Fallback: ensure progress row exists & status is IN_PROGRESS when page is opened (non-readonly)
-    if request.GET.get("readonly") != "1":
-        try:
-            if progress is None:
-                progress, _ = ChallengeProgress.objects.get_or_create(
-                    user=request.user, challenge=challenge,
-                    defaults={"status": ChallengeProgress.Status.IN_PROGRESS}
-                )
-            if progress.status in [ChallengeProgress.Status.ATTEMPTED, ChallengeProgress.Status.UNSOLVED]:
-                ChallengeProgress.objects.filter(pk=progress.pk).update(
-                    status=ChallengeProgress.Status.IN_PROGRESS,
-                    updated_at=timezone.now()
-                )
-        except Exception:
-            # Silent fallback; we surface errors only on explicit POST actions
-            pass
-
+    # One read for progress, resume state and the favorite flag, plus at
+    # most one conditional write recording the open
     readonly = request.GET.get("readonly") == "1"
+    session = progress_repository.open_session(request.user.id, challenge.id, readonly=readonly)
+    is_favorite = session.is_favorite
+    pending = autosave.pending_state(request.user.id, challenge.id)
+    if pending is not None:
+        # Acknowledged by the write-behind buffer but not flushed yet
+        last_state = pending.state
+        state_revision, state_hash = pending.revision, pending.state_hash
+        unsaved_warning = False
+    else:
+        last_state = session.last_state
+        state_revision, state_hash = session.revision, session.state_hash
+        unsaved_warning = session.unsaved
 
     return render(request, "accounts/challenge.html", {
         "challenge": challenge,
@@ -604,6 +618,8 @@ Type commands in the Terminal window. Use 'help' for generic terminal help.
         "is_favorite": is_favorite,
         "readonly": readonly,
         "last_state": last_state,
+        "state_revision": state_revision,
+        "state_hash": state_hash,
         "unsaved_warning": unsaved_warning,
         "save_progress_url": reverse('save_progress', args=[challenge.id]),
         "update_status_url": reverse('update_challenge_status', args=[challenge.id]),
@@ -616,11 +632,12 @@ def toggle_favorite(request, challenge_id: int):
         return HttpResponseBadRequest("POST required")
     challenge = get_object_or_404(Challenge, id=challenge_id)
     try:
-        fav, created = Favorite.objects.get_or_create(user=request.user, challenge=challenge)
-        if created:
-            return JsonResponse({"favorited": True})
-        fav.delete()
-        return JsonResponse({"favorited": False})
+        # Atomic so the challenge's favorite count moves with the row
+        with transaction.atomic():
+            fav, created = Favorite.objects.get_or_create(user=request.user, challenge=challenge)
+            if not created:
+                fav.delete()
+        return JsonResponse({"favorited": created})
     except Exception:
         return JsonResponse({"error": "Unable to save favorite. Please try again."}, status=500)
 
@@ -641,29 +658,68 @@ def favorites_page(request):
 @csrf_exempt  # Prototype: remove when front-end CSRF stable
 def save_progress(request, challenge_id: int):
     """Persist user's last_state for a challenge and mark save as successful.
-    Expected JSON body: { "last_state": <any json-serializable> }
+    Expected JSON body: { "last_state": <any json-serializable>, "final": <bool, optional>,
+    "base_revision": <int, optional>, "state_hash": <sha256 hex, optional> }
+    or, to send only the changes, "patch": <RFC 6902 operations> in place of
+    last_state, with base_revision required.
+    Returns { ok, unchanged, revision, state_hash }; 409 when base_revision is
+    stale, 413 when the state exceeds the challenge's size limit, and 422 with
+    snapshot_required when a patch doesn't apply.
     """
     if request.method != "POST":
         return HttpResponseBadRequest("POST required")
-    challenge = get_object_or_404(Challenge, id=challenge_id)
+    challenge = find_challenge(id=challenge_id)
+    if challenge is None:
+        raise Http404("Challenge not found.")
     import json
     try:
         payload = json.loads(request.body.decode("utf-8") or "{}")
     except Exception:
         payload = {}
     last_state = payload.get("last_state")
+    base_revision = payload.get("base_revision")
+    if base_revision is not None and (type(base_revision) is not int or base_revision < 0):
+        return JsonResponse({"ok": False, "message": "base_revision must be a non-negative integer."}, status=400)
+    client_hash = payload.get("state_hash")
+    client_hash = client_hash if isinstance(client_hash, str) else None
+    if "patch" in payload and base_revision is None:
+        return JsonResponse({"ok": False, "message": "A patch requires base_revision."}, status=400)
     try:
-        prog, _ = ChallengeProgress.objects.get_or_create(
-            user=request.user, challenge=challenge,
-            defaults={"status": ChallengeProgress.Status.IN_PROGRESS}
-        )
-        # Apply updates
-        prog.last_state = last_state
-        prog.last_saved_ok = True
-        if prog.status == ChallengeProgress.Status.ATTEMPTED:
-            prog.status = ChallengeProgress.Status.IN_PROGRESS
-        prog.save()  # full save (avoid update_fields mismatch with DB schema)
-        return JsonResponse({"ok": True})
+        # Buffered and acknowledged at once; the final save on page unload
+        # (and AUTOSAVE_MODE=write_through) goes straight to the database
+        if "patch" in payload:
+            result = autosave.save_patch(
+                request.user.id, challenge.id, payload["patch"],
+                base_revision=base_revision, state_hash=client_hash, final=bool(payload.get("final")),
+                max_bytes=state_limit(challenge),
+            )
+        else:
+            result = autosave.save(
+                request.user.id, challenge.id, last_state,
+                base_revision=base_revision, state_hash=client_hash, final=bool(payload.get("final")),
+                max_bytes=state_limit(challenge),
+            )
+        if result.outcome == autosave.CONFLICT:
+            return JsonResponse({
+                "ok": False,
+                "message": "This challenge was saved from another window. Reload to continue from the latest state.",
+                "revision": result.revision,
+                "state_hash": result.state_hash,
+            }, status=409)
+        return JsonResponse({
+            "ok": True,
+            "unchanged": result.outcome == autosave.UNCHANGED,
+            "revision": result.revision,
+            "state_hash": result.state_hash,
+        })
+    except JsonPatchError as e:
+        return JsonResponse({"ok": False, "snapshot_required": True, "message": f"Patch rejected: {e}"}, status=422)
+    except StateTooLarge as e:
+        return JsonResponse({
+            "ok": False,
+            "message": f"Your work is too large to save ({e.size} bytes; this challenge allows {e.limit}).",
+            "limit": e.limit,
+        }, status=413)
     except Exception as e:
         tb = traceback.format_exc()
         print(tb)
@@ -679,7 +735,9 @@ def update_challenge_status(request, challenge_id: int):
     """
     if request.method != "POST":
         return HttpResponseBadRequest("POST required")
-    challenge = get_object_or_404(Challenge, id=challenge_id)
+    challenge = find_challenge(id=challenge_id)
+    if challenge is None:
+        raise Http404("Challenge not found.")
     # Extract status from POST or JSON
     status_val = request.POST.get("status")
     if not status_val:
@@ -692,37 +750,24 @@ def update_challenge_status(request, challenge_id: int):
     if status_val not in ["in_progress", "completed"]:
         return JsonResponse({"ok": False, "message": "Invalid status."}, status=400)
     try:
-        prog, _ = ChallengeProgress.objects.get_or_create(
-            user=request.user, challenge=challenge,
-            defaults={"status": ChallengeProgress.Status.ATTEMPTED}
-        )
         if status_val == "in_progress":
-            if prog.status == ChallengeProgress.Status.COMPLETED:
-                return JsonResponse({"ok": True, "status": prog.status, "message": "Already completed. Cannot revert to In Progress."})
-            if prog.status != ChallengeProgress.Status.IN_PROGRESS:
-                prog.status = ChallengeProgress.Status.IN_PROGRESS
-                prog.save()
-            return JsonResponse({"ok": True, "status": prog.status, "message": "Marked In Progress."})
+            result = progress_repository.mark_in_progress(request.user.id, challenge.id)
+            if result.status == ChallengeProgress.Status.COMPLETED:
+                return JsonResponse({"ok": True, "status": result.status, "message": "Already completed. Cannot revert to In Progress."})
+            return JsonResponse({"ok": True, "status": result.status, "message": "Marked In Progress."})
         # completed path
-        if prog.status == ChallengeProgress.Status.COMPLETED:
-            return JsonResponse({"ok": True, "status": prog.status, "message": "Already completed. Points previously awarded."})
-        prog.mark_completed()
-        return JsonResponse({"ok": True, "status": prog.status, "points_awarded": challenge.points, "message": f"Congratulations! Challenge completed. +{challenge.points} points."})
+        result = progress_repository.complete(request.user.id, challenge.id, challenge.points, request.user.username)
+        if not result.changed:
+            return JsonResponse({"ok": True, "status": result.status, "message": "Already completed. Points previously awarded."})
+        return JsonResponse({"ok": True, "status": result.status, "points_awarded": challenge.points, "message": f"Congratulations! Challenge completed. +{challenge.points} points."})
     except Exception as e:
         tb = traceback.format_exc()
         print(tb)
         return JsonResponse({"ok": False, "message": f"Server error ({type(e).__name__}): {e}", "debug": tb}, status=500)
 
 
-@login_required
-@csrf_exempt
-def api_mark_inprogress(request):
-    """Endpoint /inprogress
-    POST body or form data must include 'slug' or 'id'. Marks challenge IN_PROGRESS.
-    Returns current status; does not award points.
-    """
-    if request.method != "POST":
-        return HttpResponseBadRequest("POST required")
+def _challenge_from_request(request):
+    """Resolve the 'slug' or 'id' from form data or a JSON body."""
     slug = request.POST.get("slug")
     ch_id = request.POST.get("id")
     if not slug and not ch_id:
@@ -736,21 +781,28 @@ def api_mark_inprogress(request):
         ch_id = payload.get("id")
     try:
         if slug:
-            challenge = get_object_or_404(Challenge, slug=slug)
-        else:
-            challenge = get_object_or_404(Challenge, id=int(ch_id))
-    except Exception:
+            return find_challenge(slug=slug)
+        return find_challenge(id=int(ch_id))
+    except (TypeError, ValueError):
+        return None
+
+
+@login_required
+@csrf_exempt
+def api_mark_inprogress(request):
+    """Endpoint /inprogress
+    POST body or form data must include 'slug' or 'id'. Marks challenge IN_PROGRESS.
+    Returns current status; does not award points.
+    """
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST required")
+    challenge = _challenge_from_request(request)
+    if challenge is None:
         return JsonResponse({"ok": False, "message": "Challenge not found."}, status=404)
-    prog, _ = ChallengeProgress.objects.get_or_create(
-        user=request.user, challenge=challenge,
-        defaults={"status": ChallengeProgress.Status.ATTEMPTED}
-    )
-    if prog.status == ChallengeProgress.Status.COMPLETED:
-        return JsonResponse({"ok": True, "status": prog.status, "message": "Already completed."})
-    if prog.status != ChallengeProgress.Status.IN_PROGRESS:
-        prog.status = ChallengeProgress.Status.IN_PROGRESS
-        prog.save(update_fields=["status", "updated_at"])
-    return JsonResponse({"ok": True, "status": prog.status, "message": "Marked In Progress."})
+    result = progress_repository.mark_in_progress(request.user.id, challenge.id)
+    if result.status == ChallengeProgress.Status.COMPLETED:
+        return JsonResponse({"ok": True, "status": result.status, "message": "Already completed."})
+    return JsonResponse({"ok": True, "status": result.status, "message": "Marked In Progress."})
 
 
 @login_required
@@ -762,32 +814,14 @@ def api_mark_complete(request):
     """
     if request.method != "POST":
         return HttpResponseBadRequest("POST required")
-    slug = request.POST.get("slug")
-    ch_id = request.POST.get("id")
-    if not slug and not ch_id:
-        import json
-        try:
-            payload = json.loads(request.body.decode("utf-8") or "{}")
-        except Exception:
-            payload = {}
-        slug = payload.get("slug")
-        ch_id = payload.get("id")
-    try:
-        if slug:
-            challenge = get_object_or_404(Challenge, slug=slug)
-        else:
-            challenge = get_object_or_404(Challenge, id=int(ch_id))
-    except Exception:
+    challenge = _challenge_from_request(request)
+    if challenge is None:
         return JsonResponse({"ok": False, "message": "Challenge not found."}, status=404)
-    prog, _ = ChallengeProgress.objects.get_or_create(
-        user=request.user, challenge=challenge,
-        defaults={"status": ChallengeProgress.Status.ATTEMPTED}
-    )
-    if prog.status == ChallengeProgress.Status.COMPLETED:
+    result = progress_repository.complete(request.user.id, challenge.id, challenge.points, request.user.username)
+    if not result.changed:
         # Already completed— do not re-award points
-        return JsonResponse({"ok": True, "status": prog.status, "points_awarded": 0, "message": "Already completed."})
-    prog.mark_completed()
-    return JsonResponse({"ok": True, "status": prog.status, "points_awarded": challenge.points, "message": f"Completed. +{challenge.points} points."})
+        return JsonResponse({"ok": True, "status": result.status, "points_awarded": 0, "message": "Already completed."})
+    return JsonResponse({"ok": True, "status": result.status, "points_awarded": challenge.points, "message": f"Completed. +{challenge.points} points."})
 
 
 @login_required
@@ -962,18 +996,11 @@ def admin_dashboard_page(request):
         date_joined__gte=timezone.now() - timedelta(days=30)
     ).count()
     
-    # Top performers (most points) — compute correctly using aggregation across all active users
-    # Use conditional aggregation so we only sum points for COMPLETED progress
+    # Top performers (most points) — read from the denormalized UserScore table
     annotated_users = User.objects.filter(is_active=True).annotate(
-        points=Sum(
-            'challenge_progress__challenge__points',
-            filter=Q(challenge_progress__status=ChallengeProgress.Status.COMPLETED)
-        ),
-        completed_count=Count(
-            'challenge_progress',
-            filter=Q(challenge_progress__status=ChallengeProgress.Status.COMPLETED)
-        )
-    ).order_by('-points')[:5]
+        points=Coalesce('score__points', 0),
+        completed_count=Coalesce('score__solved_count', 0)
+    ).order_by('-points', 'username')[:5]
 
     # Normalize results into small dicts for template use and handle None values
     top_users = []
@@ -989,24 +1016,13 @@ def admin_dashboard_page(request):
     # === CHALLENGE STATISTICS ===
     total_challenges = Challenge.objects.filter(is_active=True).count()
     
-    # Challenge completion rates
+    # Challenge completion rates, from the ChallengeStats rollup
     challenges_with_stats = []
-    for challenge in Challenge.objects.filter(is_active=True):
-        progress_counts = ChallengeProgress.objects.filter(
-            challenge=challenge
-        ).values('status').annotate(count=Count('id'))
-        
-        completed = 0
-        in_progress = 0
-        attempted = 0
-        
-        for p in progress_counts:
-            if p['status'] == ChallengeProgress.Status.COMPLETED:
-                completed = p['count']
-            elif p['status'] == ChallengeProgress.Status.IN_PROGRESS:
-                in_progress = p['count']
-            elif p['status'] == ChallengeProgress.Status.ATTEMPTED:
-                attempted = p['count']
+    for challenge in Challenge.objects.filter(is_active=True).select_related('category', 'stats'):
+        stats = getattr(challenge, 'stats', None)
+        completed = stats.completed if stats else 0
+        in_progress = stats.in_progress if stats else 0
+        attempted = stats.attempted if stats else 0
         
         total_attempts = completed + in_progress + attempted
         completion_rate = (completed / total_attempts * 100) if total_attempts > 0 else 0
@@ -1035,29 +1051,19 @@ def admin_dashboard_page(request):
     
     # Most popular (favorited) challenges
     popular_challenges = Challenge.objects.annotate(
-        fav_count=Count('favorited_by')
+        fav_count=Coalesce('stats__favorites', 0)
     ).order_by('-fav_count')[:5]
     
     # === PROGRESS ANALYTICS ===
-    # Completion trend (last 30 days)
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    daily_completions = ChallengeProgress.objects.filter(
-        status=ChallengeProgress.Status.COMPLETED,
-        completed_at__gte=thirty_days_ago
-    ).annotate(
-        day=TruncDate('completed_at')
-    ).values('day').annotate(
-        count=Count('id')
-    ).order_by('day')
-    
-    # Format for chart and compute total completions (last 30 days)
+    # Completion trend (last 30 days), one point per day from the daily
+    # buckets; longer windows come from admin_completion_trend
     completion_trend = [
-        {'date': item['day'].strftime('%Y-%m-%d'), 'count': item['count']}
-        for item in daily_completions
+        {'date': day.strftime('%Y-%m-%d'), 'count': count}
+        for day, count in trends.last_days(30)
     ]
 
     # Total completions in the last 30 days (sum of daily counts)
-    completions_30d = sum(item['count'] for item in daily_completions) if daily_completions else 0
+    completions_30d = sum(item['count'] for item in completion_trend)
     
     # === DIFFICULTY DISTRIBUTION ===
     difficulty_qs = Challenge.objects.filter(is_active=True).values('difficulty').annotate(count=Count('id')).order_by('difficulty')
@@ -1105,6 +1111,10 @@ def admin_dashboard_page(request):
 # 2. USER MANAGEMENT
 # ============================================================================
 
+# Users per page on the user management screen
+ADMIN_USERS_PAGE_SIZE = 50
+
+
 @login_required
 @user_passes_test(is_admin)
 @login_required
@@ -1116,28 +1126,27 @@ def admin_users_page(request):
     from django.utils import timezone
     
     # === USER STATISTICS ===
-    # Total users should reflect what's in the DB (all accounts)
-    total_users = User.objects.count()
-    
-    # Active users (logged in within last 7 days)
+    # All four counters in one pass over the user table
     seven_days_ago = timezone.now() - timedelta(days=7)
-    # Active users = users who logged in during the last 7 days (include all records)
-    active_users = User.objects.filter(last_login__gte=seven_days_ago).count()
+    thirty_days_ago = timezone.now() - timedelta(days=30)
+    sixty_days_ago = timezone.now() - timedelta(days=60)
+    counts = User.objects.aggregate(
+        # Total users should reflect what's in the DB (all accounts)
+        total=Count('id'),
+        # Active users = users who logged in during the last 7 days (include all records)
+        active=Count('id', filter=Q(last_login__gte=seven_days_ago)),
+        # New users this month
+        new=Count('id', filter=Q(date_joined__gte=thirty_days_ago)),
+        # Previous month, for the growth percentage
+        previous=Count('id', filter=Q(date_joined__gte=sixty_days_ago, date_joined__lt=thirty_days_ago)),
+    )
+    total_users = counts['total']
+    active_users = counts['active']
     
     # Admin users stat removed — do not compute it
     
-    # New users this month
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    new_users_this_month = User.objects.filter(
-        date_joined__gte=thirty_days_ago
-    ).count()
-    
-    # Calculate growth percentage (compare to previous month)
-    sixty_days_ago = timezone.now() - timedelta(days=60)
-    previous_month_users = User.objects.filter(
-        date_joined__gte=sixty_days_ago,
-        date_joined__lt=thirty_days_ago
-    ).count()
+    new_users_this_month = counts['new']
+    previous_month_users = counts['previous']
     
     if previous_month_users > 0:
         growth_percentage = round(
@@ -1147,21 +1156,26 @@ def admin_users_page(request):
     else:
         growth_percentage = 100 if new_users_this_month > 0 else 0
     
-    # === ALL USERS WITH DETAILS ===
+    # === USERS WITH DETAILS, ONE PAGE AT A TIME ===
+    # Search and status filter the whole table, not just the rows on the page
+    search_query = request.GET.get('q', '').strip()
+    status_filter = request.GET.get('status', '')
+    users_qs = user_stats.search(User.objects.all(), search_query)
+    if status_filter in ('active', 'inactive'):
+        users_qs = users_qs.filter(is_active=status_filter == 'active')
+    filters = {k: v for k, v in (('q', search_query), ('status', status_filter)) if v}
+    try:
+        page, page_meta = user_stats.keyset_page(
+            users_qs,
+            after=request.GET.get('after') or None,
+            before=request.GET.get('before') or None,
+            limit=ADMIN_USERS_PAGE_SIZE,
+        )
+    except ValueError:
+        return redirect(f"{reverse('admin_users_page')}?{urlencode(filters)}" if filters else 'admin_users_page')
+    
     users_list = []
-    for user in User.objects.all().order_by('-date_joined'):
-        # Get completed challenges count
-        completed_count = ChallengeProgress.objects.filter(
-            user=user,
-            status=ChallengeProgress.Status.COMPLETED
-        ).count()
-        
-        # Calculate total points
-        total_points = ChallengeProgress.objects.filter(
-            user=user,
-            status=ChallengeProgress.Status.COMPLETED
-        ).aggregate(points=Sum('challenge__points'))['points'] or 0
-        
+    for user in page:
         users_list.append({
             'id': user.id,
             'username': user.username,
@@ -1171,18 +1185,26 @@ def admin_users_page(request):
             'is_active': user.is_active,
             'date_joined': user.date_joined,
             'last_login': user.last_login,
-            'points': total_points,
-            'completed_count': completed_count,
+            'points': user.points,
+            'completed_count': user.completed_count,
         })
     
+    # Completions across all users, from the per-challenge rollup
+    total_completed = ChallengeStats.objects.aggregate(total=Sum('completed'))['total'] or 0
+    
     context = {
         'total_users': total_users,
         # Average completed challenges per user (use DB totals)
-        'avg_completed_per_user': round((ChallengeProgress.objects.filter(status=ChallengeProgress.Status.COMPLETED).count() / total_users), 1) if total_users > 0 else 0,
+        'avg_completed_per_user': round((total_completed / total_users), 1) if total_users > 0 else 0,
         'active_users': active_users,
         'new_users_this_month': new_users_this_month,
         'growth_percentage': growth_percentage,
         'users': users_list,
+        'page': page_meta,
+        'search_query': search_query,
+        'status_filter': status_filter,
+        # Carried over by the pager links
+        'filter_query': urlencode(filters),
     }
     
     return render(request, "accounts/admin_users.html", context)
@@ -1191,37 +1213,31 @@ def admin_users_page(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_users_list(request):
-    """API endpoint to list all users with pagination and search"""
+    """API endpoint to list active users with search, newest first.
+
+    Keyset-paginated: pass the ``next`` (as ``after``) or ``prev`` (as
+    ``before``) cursor from a previous response; ``limit`` sets the page size.
+    """
     search_query = request.GET.get('q', '').strip()
-    page = int(request.GET.get('page', 1))
+    try:
+        limit = min(max(int(request.GET.get('limit', user_stats.PAGE_SIZE)), 1), user_stats.MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer.'}, status=400)
     
-    users_qs = User.objects.filter(is_active=True)
+    users_qs = user_stats.search(User.objects.filter(is_active=True), search_query)
     
-    if search_query:
-        users_qs = users_qs.filter(
-            Q(username__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query)
+    try:
+        page, page_meta = user_stats.keyset_page(
+            users_qs,
+            after=request.GET.get('after') or None,
+            before=request.GET.get('before') or None,
+            limit=limit,
         )
-    
-    paginator = Paginator(users_qs.order_by('-date_joined'), 20)
-    page_obj = paginator.get_page(page)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
     
     users_data = []
-    for user in page_obj:
-        completed = ChallengeProgress.objects.filter(
-            user=user,
-            status=ChallengeProgress.Status.COMPLETED
-        ).count()
-        
-        favorites = Favorite.objects.filter(user=user).count()
-        
-        total_points = ChallengeProgress.objects.filter(
-            user=user,
-            status=ChallengeProgress.Status.COMPLETED
-        ).aggregate(points=Sum('challenge__points'))['points'] or 0
-        
+    for user in page:
         users_data.append({
             'id': user.id,
             'username': user.username,
@@ -1230,16 +1246,15 @@ def admin_users_list(request):
             'last_name': user.last_name,
             'date_joined': user.date_joined.isoformat(),
             'is_active': user.is_active,
-            'completed_challenges': completed,
-            'favorites': favorites,
-            'total_points': total_points
+            'completed_challenges': user.completed_count,
+            'favorites': user.favorite_count,
+            'total_points': user.points
         })
     
     return JsonResponse({
         'users': users_data,
-        'page': page,
-        'total_pages': paginator.num_pages,
-        'total_count': paginator.count
+        **page_meta,
+        'total_count': users_qs.count()
     })
 
 
@@ -1316,32 +1331,31 @@ def admin_challenge_analytics(request, challenge_id):
     """Get detailed analytics for a specific challenge"""
     challenge = get_object_or_404(Challenge, id=challenge_id)
     
-    # Progress breakdown
-    progress_counts = ChallengeProgress.objects.filter(
-        challenge=challenge
-    ).values('status').annotate(count=Count('id'))
+    stats = ChallengeStats.objects.filter(challenge=challenge).first() or ChallengeStats(challenge=challenge)
     
+    # Progress breakdown
     status_breakdown = {}
-    for item in progress_counts:
-        status_breakdown[item['status']] = item['count']
+    for status_value in ChallengeProgress.Status.values:
+        if getattr(stats, status_value):
+            status_breakdown[status_value] = getattr(stats, status_value)
     
-    # Average completion time
+    # Average completion time comes from the rollup; list a sample of solves
     completed_progress = ChallengeProgress.objects.filter(
         challenge=challenge,
         status=ChallengeProgress.Status.COMPLETED,
+        started_at__isnull=False,
         completed_at__isnull=False
-    )
+    ).values_list('started_at', 'completed_at')[:10]
     
-    completion_times = []
-    for p in completed_progress:
-        if p.started_at and p.completed_at:
-            delta = p.completed_at - p.started_at
-            completion_times.append(delta.total_seconds() / 60)  # minutes
+    completion_times = [
+        (completed_at - started_at).total_seconds() / 60  # minutes
+        for started_at, completed_at in completed_progress
+    ]
     
-    avg_time = sum(completion_times) / len(completion_times) if completion_times else 0
+    avg_time = stats.average_solve_minutes
     
     # Favorite count
-    favorite_count = Favorite.objects.filter(challenge=challenge).count()
+    favorite_count = stats.favorites
     
     return JsonResponse({
         'challenge': {
@@ -1353,7 +1367,7 @@ def admin_challenge_analytics(request, challenge_id):
         'status_breakdown': status_breakdown,
         'average_completion_time_minutes': round(avg_time, 2),
         'favorite_count': favorite_count,
-        'completion_times': completion_times[:10]
+        'completion_times': completion_times
     })
 
 
@@ -1440,25 +1454,27 @@ def admin_category_stats(request):
     """Get statistics grouped by category"""
     categories = Category.objects.all()
     
+    # One pass over the challenges and their ChallengeStats rows
+    by_category = {}
+    for challenge in Challenge.objects.select_related('stats').order_by('id'):
+        challenge.completion_count = challenge.stats.completed if hasattr(challenge, 'stats') else 0
+        by_category.setdefault(challenge.category_id, []).append(challenge)
+    
     category_stats = []
     
     for category in categories:
-        challenges = Challenge.objects.filter(category=category, is_active=True)
-        challenge_count = challenges.count()
+        every_challenge = by_category.get(category.id, [])
+        challenges = [c for c in every_challenge if c.is_active]
+        challenge_count = len(challenges)
         
         # Count completions across all challenges in this category
-        total_completions = ChallengeProgress.objects.filter(
-            challenge__category=category,
-            status=ChallengeProgress.Status.COMPLETED
-        ).count()
+        total_completions = sum(c.completion_count for c in every_challenge)
         
         # Total points available in this category
-        total_points = challenges.aggregate(total=Sum('points'))['total'] or 0
+        total_points = sum(c.points for c in challenges)
         
         # Most popular challenge in category
-        popular_challenge = challenges.annotate(
-            completion_count=Count('progress', filter=Q(progress__status=ChallengeProgress.Status.COMPLETED))
-        ).order_by('-completion_count').first()
+        popular_challenge = max(challenges, key=lambda c: c.completion_count, default=None)
         
         category_stats.append({
             'id': category.id,
@@ -1481,41 +1497,171 @@ def admin_category_stats(request):
 
 
 # ============================================================================
-# 6. DATA EXPORT
+# 6. COMPLETION TRENDS
+# ============================================================================
+
+def _positive_int(value):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_completion_trend(request):
+    """Completions per day (or hour) over a window, zero-filled.
+
+    Query parameters: ``bucket`` (``day`` or ``hour``), then either ``days``
+    (a window ending today, default 30) or ``start`` and ``end`` dates
+    (inclusive), and optionally ``challenge`` or ``category`` ids. Hourly
+    buckets only go back COMPLETION_HOURLY_RETENTION_DAYS.
+    """
+    from datetime import datetime, time, timezone as dt_timezone
+    from django.utils.dateparse import parse_date
+
+    bucket = request.GET.get('bucket', trends.DAY)
+    if bucket not in (trends.DAY, trends.HOUR):
+        return error_response("bucket must be day or hour.", code="invalid_bucket")
+    filters = {}
+    for param, key in (('challenge', 'challenge_id'), ('category', 'category_id')):
+        if param in request.GET:
+            filters[key] = _positive_int(request.GET[param])
+            if filters[key] is None:
+                return error_response(f"{param} must be an id.", code=f"invalid_{param}")
+
+    if 'start' in request.GET or 'end' in request.GET:
+        try:
+            start = parse_date(request.GET.get('start', ''))
+            end = parse_date(request.GET.get('end', ''))
+        except ValueError:
+            start = end = None
+        if start is None or end is None:
+            return error_response("start and end must be dates (YYYY-MM-DD).", code="invalid_window")
+    else:
+        days = _positive_int(request.GET.get('days', 30))
+        if days is None:
+            return error_response("days must be a positive number.", code="invalid_window")
+        end = trends.day_of(timezone.now())
+        start = end - timedelta(days=days - 1)
+
+    if bucket == trends.HOUR:
+        # Whole UTC days, midnight to 23:00
+        start = datetime.combine(start, time.min, tzinfo=dt_timezone.utc)
+        end = datetime.combine(end, time(23), tzinfo=dt_timezone.utc)
+    try:
+        points = trends.series(start, end, bucket=bucket, **filters)
+    except ValueError as e:
+        return error_response(str(e), code="invalid_window")
+
+    return success_response(
+        [{'date': key.isoformat(), 'count': count} for key, count in points],
+        meta={
+            'bucket': bucket,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'total': sum(count for _, count in points),
+        },
+    )
+
+
+# ============================================================================
+# 7. DATA EXPORT
 # ============================================================================
 
 @login_required
 @user_passes_test(is_admin)
 def admin_export_data(request):
-    """Export admin data as JSON"""
-    export_type = request.GET.get('type', 'users')
-    
-    if export_type == 'users':
-        users = User.objects.filter(is_active=True).values(
-            'id', 'username', 'email', 'date_joined', 'is_active'
-        )
-        return JsonResponse({'users': list(users)})
-    
-    elif export_type == 'challenges':
-        challenges = Challenge.objects.filter(is_active=True).values(
-            'id', 'title', 'slug', 'difficulty', 'points', 'category__name'
-        )
-        return JsonResponse({'challenges': list(challenges)})
-    
-    elif export_type == 'progress':
-        progress = ChallengeProgress.objects.select_related(
-            'user', 'challenge'
-        ).values(
-            'user__username',
-            'challenge__title',
-            'status',
-            'started_at',
-            'updated_at',
-            'completed_at'
-        )
-        return JsonResponse({'progress': list(progress)})
+    """Export users, challenges or progress, streamed as it's read.
+
+    Query params: ``type`` (users, challenges or progress), ``format``
+    (json, the default, for the original ``{"<type>": [...]}`` document;
+    ndjson; or csv), ``fields`` (comma separated), ``start`` and ``end``
+    (dates, inclusive, or ISO datetimes) and ``gzip=1``.
+    """
+    try:
+        spec = exports.ExportSpec.from_params(request.GET)
+    except exports.ExportError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    return JsonResponse({'error': 'Invalid export type'}, status=400)
+    response = StreamingHttpResponse(exports.stream(spec), content_type=spec.content_type)
+    if spec.format != exports.JSON or spec.compress:
+        response['Content-Disposition'] = f'attachment; filename="{spec.filename()}"'
+    return response
+
+# Background exports, for ones too large to stream within the request timeout
+
+# Jobs listed by GET /api/admin/exports/
+EXPORT_JOBS_LISTED = 20
+
+@login_required
+@user_passes_test(is_admin)
+def admin_export_jobs(request):
+    """GET lists recent export jobs; POST queues one (same parameters as
+    admin_export_data) and answers 202 with its status URL to poll."""
+    if request.method == "POST":
+        try:
+            job = export_jobs.enqueue(request.user, request.POST)
+        except exports.ExportError as e:
+            return error_response(str(e), code="invalid_export")
+        return success_response(export_jobs.job_payload(job), status_code=202)
+    if request.method != "GET":
+        return error_response("Method not allowed.", code="method_not_allowed", status_code=405)
+    jobs = ExportJob.objects.order_by("-created_at")[:EXPORT_JOBS_LISTED]
+    return success_response([export_jobs.job_payload(job) for job in jobs])
+
+@login_required
+@user_passes_test(is_admin)
+def admin_export_job_status(request, job_id):
+    """Progress of one export job. Polling also restarts a job whose
+    worker has died, from its last checkpoint."""
+    job = get_object_or_404(ExportJob, pk=job_id)
+    if export_jobs.resume(job):
+        job.refresh_from_db()
+    return success_response(export_jobs.job_payload(job))
+
+@login_required
+@user_passes_test(is_admin)
+def admin_export_job_download(request, job_id):
+    """Download a finished export. Honors a single-range ``Range`` header
+    (with ``If-Range`` against the ETag) so broken downloads can resume."""
+    job = get_object_or_404(ExportJob, pk=job_id)
+    if job.status == ExportJob.Status.EXPIRED:
+        return error_response("This export has expired.", code="expired", status_code=410)
+    if job.status != ExportJob.Status.DONE:
+        return error_response("This export is not finished.", code="not_ready", status_code=409)
+    try:
+        fh = open(export_jobs.file_path(job), "rb")
+    except FileNotFoundError:
+        return error_response("This export has expired.", code="expired", status_code=410)
+    spec = export_jobs.spec_of(job)
+    size = os.fstat(fh.fileno()).st_size
+    etag = export_jobs.etag(job, size)
+
+    byte_range = None
+    if "Range" in request.headers and request.headers.get("If-Range", etag) == etag:
+        try:
+            byte_range = export_jobs.byte_range(request.headers["Range"], size)
+        except export_jobs.RangeNotSatisfiable:
+            fh.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(fh, as_attachment=True, filename=spec.filename(job.created_at),
+                                content_type=spec.content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(export_jobs.read_range(fh, start, end - start + 1), status=206,
+                                         content_type=spec.content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Disposition'] = f'attachment; filename="{spec.filename(job.created_at)}"'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
 
 @login_required
 @user_passes_test(is_admin)
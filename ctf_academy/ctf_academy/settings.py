@@ -144,6 +144,65 @@ else:
 CACHE_TTL = env.int('CACHE_TTL', default=60)
 REQUEST_TIMEOUT_SECONDS = env.int('REQUEST_TIMEOUT_SECONDS', default=15)
 
+# Without django-redis the leaderboard is kept in each web process, which
+# reloads it from UserScore this often (0 = only on first use); that is
+# what repairs drift, as `manage.py reconcile_leaderboard` can't reach it.
+LEADERBOARD_RELOAD_SECONDS = env.int('LEADERBOARD_RELOAD_SECONDS', default=300)
+
+# Profile image uploads are re-encoded on a small background pool.
+# Set AVATAR_WORKERS=0 to process uploads inline on the request thread.
+AVATAR_WORKERS = env.int('AVATAR_WORKERS', default=2)
+AVATAR_MAX_UPLOAD_BYTES = env.int('AVATAR_MAX_UPLOAD_BYTES', default=5 * 1024 * 1024)
+
+# Content-addressed image storage. When set, blobs are written as files under
+# this directory (served with sendfile); otherwise they live in the Blob table.
+BLOB_STORE_ROOT = env('BLOB_STORE_ROOT', default='')
+
+# Challenge editor autosaves. write_behind buffers the latest state per
+# user/challenge in the cache and flushes it in batches every
+# AUTOSAVE_FLUSH_SECONDS, so a crash can lose up to one interval of edits;
+# write_through saves every call. 0 = only via `manage.py flush_autosave`,
+# which needs the django-redis cache: with any other cache the buffer lives
+# in each web process, and 0 falls back to write_through.
+AUTOSAVE_MODE = env('AUTOSAVE_MODE', default='write_behind')
+AUTOSAVE_FLUSH_SECONDS = env.int('AUTOSAVE_FLUSH_SECONDS', default=10)
+
+# Saved editor state is stored compressed (a registered codec name or the
+# dotted path of an accounts.state_codec.StateCodec subclass). Saves larger
+# than PROGRESS_STATE_MAX_BYTES of JSON are refused with 413 unless the
+# challenge sets its own max_state_bytes.
+PROGRESS_STATE_CODEC = env('PROGRESS_STATE_CODEC', default='zlib')
+PROGRESS_STATE_MAX_BYTES = env.int('PROGRESS_STATE_MAX_BYTES', default=256 * 1024)
+
+# Progress transitions and saves are logged to ProgressEvent through a
+# per-process buffer inserted every PROGRESS_EVENT_FLUSH_SECONDS (0 = insert
+# as each write commits). `manage.py compact_progress_events` folds saves
+# older than PROGRESS_EVENT_COMPACT_DAYS into daily rows, and
+# `manage.py prune_progress_events` drops events past the retention period.
+PROGRESS_EVENT_FLUSH_SECONDS = env.int('PROGRESS_EVENT_FLUSH_SECONDS', default=5)
+PROGRESS_EVENT_COMPACT_DAYS = env.int('PROGRESS_EVENT_COMPACT_DAYS', default=30)
+PROGRESS_EVENT_RETENTION_DAYS = env.int('PROGRESS_EVENT_RETENTION_DAYS', default=365)
+
+# /api/progress/sync/ keeps each applied operation's result under its
+# idempotency key so client retries replay it; `manage.py prune_sync_receipts`
+# drops receipts older than this.
+PROGRESS_SYNC_RECEIPT_HOURS = env.int('PROGRESS_SYNC_RECEIPT_HOURS', default=24)
+
+# Completions are also counted into daily and hourly buckets for the admin
+# trend charts. Hourly buckets older than this are removed by
+# `manage.py prune_completion_buckets`; 0 stops recording them.
+COMPLETION_HOURLY_RETENTION_DAYS = env.int('COMPLETION_HOURLY_RETENTION_DAYS', default=30)
+
+# Admin export jobs (/api/admin/exports/) are written to files under
+# EXPORT_ROOT by EXPORT_WORKERS background threads (0 = only by
+# `manage.py run_export_jobs`, which also resumes jobs whose worker died:
+# running jobs without a checkpoint for EXPORT_STALE_SECONDS). Finished
+# files are deleted after EXPORT_RETENTION_HOURS.
+EXPORT_ROOT = env('EXPORT_ROOT', default=str(BASE_DIR / 'exports'))
+EXPORT_WORKERS = env.int('EXPORT_WORKERS', default=1)
+EXPORT_STALE_SECONDS = env.int('EXPORT_STALE_SECONDS', default=120)
+EXPORT_RETENTION_HOURS = env.int('EXPORT_RETENTION_HOURS', default=24)
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',